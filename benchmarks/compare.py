@@ -0,0 +1,67 @@
+"""Compare two results files written by run.py
+
+    python benchmarks/compare.py benchmarks/results/before.json benchmarks/results/after.json --threshold 10
+
+Prints req/s and p99 latency side by side for every setting both runs
+measured. With --threshold the exit code is 1 when any setting lost more
+than that percentage of throughput or gained it in p99 latency.
+"""
+import argparse
+import json
+import sys
+from typing import Dict, Optional, Tuple
+
+
+def load(path: str) -> Dict[Tuple, dict]:
+    with open(path) as f:
+        report = json.load(f)
+    rows = {}
+    for variant in report["variants"]:
+        for result in variant.get("results", []):
+            key = (variant["variant"], result["scenario"], result["concurrency"], result["payload_bytes"])
+            rows[key] = result
+    return rows
+
+
+def change(before: Optional[float], after: Optional[float]) -> Optional[float]:
+    if not before or after is None:
+        return None
+    return (after - before) / before * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark runs")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, help="percent regression that fails the comparison")
+    args = parser.parse_args()
+
+    before, after = load(args.before), load(args.after)
+    regressions = 0
+    print(f"{'variant':<12} {'scenario':<20} {'conc':>4} {'bytes':>6} "
+          f"{'req/s before':>13} {'after':>9} {'change':>8} {'p99 before':>11} {'after':>9} {'change':>8}")
+    for key in sorted(before.keys() & after.keys()):
+        old, new = before[key], after[key]
+        rps = change(old["requests_per_second"], new["requests_per_second"])
+        p99 = change(old["latency_ms"]["p99"], new["latency_ms"]["p99"])
+        flag = ""
+        if args.threshold is not None and ((rps is not None and rps < -args.threshold)
+                                           or (p99 is not None and p99 > args.threshold)):
+            regressions += 1
+            flag = "  REGRESSION"
+        print(f"{key[0]:<12} {key[1]:<20} {key[2]:>4} {key[3]:>6} "
+              f"{old['requests_per_second']:>13} {new['requests_per_second']:>9} {_pct(rps):>8} "
+              f"{old['latency_ms']['p99']:>11} {new['latency_ms']['p99']:>9} {_pct(p99):>8}{flag}")
+    for key in sorted(before.keys() ^ after.keys()):
+        print(f"only in {'before' if key in before else 'after'}: {' '.join(map(str, key))}")
+    if regressions:
+        print(f"{regressions} setting(s) regressed by more than {args.threshold}%", file=sys.stderr)
+        sys.exit(1)
+
+
+def _pct(value: Optional[float]) -> str:
+    return f"{value:+.1f}%" if value is not None else "-"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Check that the typical dashboard queries of one variant use an index
+
+Seeds the variant's database with logs from a handful of sources spread
+over the last day, asks its storage backend for the plan of every query
+from queries() and flags the plans that read a whole table instead of
+a range of an index. Writes the plans as JSON; the exit code is 1
+when any plan was flagged. Attribute and text searches are only checked
+on Postgres, the only database with indexes for them; the optional
+full-text index is switched on unless LOG_FULLTEXT_INDEX says otherwise.
+
+    python benchmarks/explain.py --app-dir distributed-logging-system-it23425590 --out plans.json
+    DATABASE_URL=postgresql+asyncpg://localhost/logs python benchmarks/explain.py --app-dir ...
+
+Runs against the same throwaway SQLite database as loadgen.py unless
+DATABASE_URL says otherwise. Usually run through benchmarks/run.py.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import sys
+from datetime import datetime, timedelta
+from typing import List
+
+from loadgen import load_app
+
+SOURCES = 20  # distinct log names in the seeded data
+SEED_BATCH_ROWS = 1000
+
+# Plan steps that read every row of a table: a sequential scan on Postgres, a scan without an index on SQLite
+FULL_SCAN = re.compile(r"^(->\s*)?((Parallel )?Seq Scan on |SCAN \w+$)")
+# Postgres scans empty tables, such as the partitions created ahead of time, sequentially at no cost
+NO_COST = re.compile(r"\(cost=[\d.]+\.\.0\.00 ")
+
+
+def full_scans(plan: List[str], in_id_order: bool = False) -> List[str]:
+    """The flagged plan steps; in_id_order allows SQLite's plain SCAN, which then walks the table's own id b-tree"""
+    flagged = [line.strip() for line in plan if FULL_SCAN.match(line.strip()) and not NO_COST.search(line)]
+    if in_id_order:
+        flagged = [line for line in flagged if not line.startswith("SCAN ")]
+    return flagged
+
+
+def queries(log_filter, key, now: datetime, postgres: bool = False) -> List[tuple]:
+    """(name, scan arguments) of the queries a dashboard sends; time filters only where logs have a timestamp"""
+    timed = "since" in log_filter._fields
+    searchable = postgres and "contains" in log_filter._fields
+    listed = [
+        ("latest_page", {"limit": 100, "descending": True}),
+        ("next_page", {"after": key, "limit": 100}),
+        ("source_page", {"limit": 100, "where": log_filter(name="source-3")}),
+        ("source_latest_page", {"limit": 100, "where": log_filter(name="source-3"), "descending": True}),
+    ]
+    if timed:
+        listed += [
+            ("source_last_5_minutes", {"limit": 100, "descending": True,
+                                       "where": log_filter(name="source-3", since=now - timedelta(minutes=5))}),
+            ("time_range", {"limit": 100, "where": log_filter(since=now - timedelta(hours=1),
+                                                              until=now - timedelta(minutes=30))}),
+        ]
+    if searchable:
+        listed += [
+            ("attribute_equals", {"limit": 100, "where": log_filter(equals={"request_id": "req-42"})}),
+            ("attribute_contains", {"limit": 100, "descending": True, "where": log_filter(contains={"level": "error"})}),
+            ("text_search", {"limit": 100, "where": log_filter(text="timeout")}),
+        ]
+    return listed
+
+
+def seed_rows(start: int, count: int, rows: int, now: datetime, timed: bool, searchable: bool) -> List[dict]:
+    batch = []
+    for i in range(start, start + count):
+        row = {"name": f"source-{i % SOURCES}", "password": "secret"}
+        if timed:
+            # Evenly spread over the last day, oldest first
+            row["timestamp"] = now - timedelta(days=1) * (rows - i) / rows
+        if searchable:
+            # One request every 10 logs, one error in 50
+            error = i % 50 == 0
+            row["message"] = "upstream timeout" if error else "request served"
+            row["attributes"] = {"request_id": f"req-{i // 10}", "level": "error" if error else "info"}
+        batch.append(row)
+    return batch
+
+
+async def check(app, rows: int) -> List[dict]:
+    from app.database import engine
+    from app.storage import LogFilter, storage
+
+    now = datetime.utcnow()
+    timed = "since" in LogFilter._fields
+    searchable = "contains" in LogFilter._fields
+    # The startup handlers create the tables, indexes and partitions
+    async with app.router.lifespan_context(app):
+        if await storage.count() < rows:
+            for start in range(0, rows, SEED_BATCH_ROWS):
+                await storage.insert_batch(seed_rows(start, min(SEED_BATCH_ROWS, rows - start), rows, now, timed,
+                                                     searchable), return_ids=False)
+        async with engine.begin() as conn:
+            # Fresh statistics, or the planner guesses the table is tiny
+            await conn.exec_driver_sql("ANALYZE")
+        middle = (await storage.scan(limit=rows // 2))[-1]
+        key = (middle.timestamp, middle.id) if timed else middle.id
+
+        results = []
+        for name, arguments in queries(LogFilter, key, now, postgres=engine.dialect.name == "postgresql"):
+            plan = await storage.explain(**arguments)
+            # Without timestamps logs are scanned in id order, the order SQLite stores the table in
+            flagged = full_scans(plan, in_id_order=not timed and "where" not in arguments)
+            print(f"{name:<24} {'ok' if not flagged else 'FULL SCAN'}", file=sys.stderr)
+            results.append({
+                "query": name,
+                "arguments": {arg: repr(value) for arg, value in arguments.items()},
+                "plan": plan,
+                "full_scans": flagged,
+                "ok": not flagged,
+            })
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the query plans of one variant")
+    parser.add_argument("--app-dir", required=True, help="variant directory to import")
+    parser.add_argument("--db-driver", default="sqlite",
+                        help="SQLAlchemy driver for the default SQLite database, e.g. sqlite+aiosqlite")
+    parser.add_argument("--rows", type=int, default=20000, help="logs to seed before explaining")
+    parser.add_argument("--out", help="write the plans here instead of stdout")
+    args = parser.parse_args()
+
+    out = os.path.abspath(args.out) if args.out else None  # before load_app changes directory
+    os.environ.setdefault("LOG_FULLTEXT_INDEX", "true")  # read by the models on import
+    app = load_app(args.app_dir, args.db_driver)
+    # The apps configure INFO logging on import; only the verdicts are of interest here
+    logging.getLogger().setLevel(logging.WARNING)
+    results = asyncio.run(check(app, args.rows))
+    output = json.dumps(results, indent=2)
+    if out:
+        with open(out, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    if not all(result["ok"] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
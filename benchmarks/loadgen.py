@@ -0,0 +1,241 @@
+"""Load generator for one variant of the logging service
+
+Drives the variant's HTTP API with a fixed number of requests per
+scenario at a given concurrency and payload size, and writes req/s and
+latency percentiles as JSON. The app is either imported and called
+in-process through httpx's ASGI transport (--app-dir) or reached over a
+socket (--url).
+
+    python benchmarks/loadgen.py --app-dir distributed-logging-system-it23161160. --out raft.json
+    python benchmarks/loadgen.py --url http://localhost:8000 --concurrency 64 --out cluster.json
+
+In-process runs default to a throwaway SQLite database, no NTP servers,
+no backups and a single-node Raft cluster; set DATABASE_URL and friends
+to override. Usually run through benchmarks/run.py.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Callable, List, Optional
+
+import httpx
+
+READY_TIMEOUT = 15.0  # seconds to wait for a Raft leader before giving up
+
+
+def make_log(seq: int, payload_bytes: int) -> dict:
+    """A log whose name pads the request body to roughly payload_bytes"""
+    name = f"bench-{seq}-"
+    return {"name": name + "x" * max(0, payload_bytes - len(name)), "password": "secret"}
+
+
+def make_ndjson(seq: int, payload_bytes: int, rows: int) -> bytes:
+    return b"".join((json.dumps(make_log(seq * rows + i, payload_bytes)) + "\n").encode() for i in range(rows))
+
+
+class Scenario:
+    """One endpoint, and how to build the n-th request for it"""
+
+    def __init__(self, name: str, method: str, path: str, build: Optional[Callable] = None,
+                 params: Optional[dict] = None, rows: int = 1):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.build = build
+        self.params = params
+        self.rows = rows  # log rows written per request
+
+    def request(self, seq: int, payload_bytes: int) -> dict:
+        kwargs = {"params": self.params} if self.params else {}
+        if self.build is not None:
+            kwargs.update(self.build(seq, payload_bytes))
+        return kwargs
+
+
+def scenarios(bulk_rows: int) -> List[Scenario]:
+    """Every known scenario; writes come first so the reads have rows to return"""
+    return [
+        Scenario("post_log", "POST", "/logs/", lambda seq, size: {"json": make_log(seq, size)}),
+        Scenario("bulk_ingest", "POST", "/logs/bulk",
+                 lambda seq, size: {"content": make_ndjson(seq, size, bulk_rows),
+                                    "headers": {"Content-Type": "application/x-ndjson"}},
+                 rows=bulk_rows),
+        Scenario("get_logs", "GET", "/logs/", params={"limit": 100}),
+        Scenario("get_logs_latest", "GET", "/logs/", params={"limit": 100, "order": "desc"}),
+        Scenario("get_logs_by_name", "GET", "/logs/",
+                 lambda seq, size: {"params": {"name": make_log(seq, size)["name"], "limit": 100}}),
+        Scenario("consensus_status", "GET", "/consensus/status"),
+        Scenario("consensus_logs", "GET", "/consensus/logs", params={"limit": 100}),
+        Scenario("replication_status", "GET", "/replication/status"),
+    ]
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, requests: int,
+                       concurrency: int, payload_bytes: int, warmup: int = 0) -> dict:
+    """Send `requests` requests from `concurrency` workers and summarize them"""
+    for seq in range(warmup):
+        await client.request(scenario.method, scenario.path, **scenario.request(-1 - seq, payload_bytes))
+
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    counter = itertools.count()
+
+    async def worker():
+        for seq in counter:
+            if seq >= requests:
+                return
+            kwargs = scenario.request(seq, payload_bytes)
+            started = time.perf_counter()
+            try:
+                response = await client.request(scenario.method, scenario.path, **kwargs)
+                statuses[str(response.status_code)] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    ok = sum(count for status, count in statuses.items() if status.isdigit() and int(status) < 400)
+    return {
+        "scenario": scenario.name,
+        "method": scenario.method,
+        "path": scenario.path,
+        "concurrency": concurrency,
+        "payload_bytes": payload_bytes,
+        "requests": requests,
+        "errors": requests - ok,
+        "status_codes": dict(statuses),
+        "seconds": round(elapsed, 4),
+        "requests_per_second": round(requests / elapsed, 1) if elapsed else None,
+        "rows_per_second": round(ok * scenario.rows / elapsed, 1) if elapsed else None,
+        "latency_ms": {
+            "mean": ms(sum(latencies) / len(latencies) if latencies else None),
+            "p50": ms(percentile(latencies, 50)),
+            "p95": ms(percentile(latencies, 95)),
+            "p99": ms(percentile(latencies, 99)),
+            "max": ms(max(latencies) if latencies else None),
+        },
+    }
+
+
+async def wait_ready(client: httpx.AsyncClient, paths: set):
+    """Wait until the node can take writes; only Raft nodes need to elect a leader first"""
+    if "/consensus/status" not in paths:
+        return
+    deadline = time.monotonic() + READY_TIMEOUT
+    while time.monotonic() < deadline:
+        status = (await client.get("/consensus/status")).json()
+        if status.get("leader_id") is not None:
+            return
+        await asyncio.sleep(0.05)
+    raise RuntimeError("No Raft leader was elected")
+
+
+async def run_matrix(client: httpx.AsyncClient, args) -> List[dict]:
+    paths = set((await client.get("/openapi.json")).json()["paths"])
+    await wait_ready(client, paths)
+    selected = [scenario for scenario in scenarios(args.bulk_rows)
+                if scenario.path in paths and (not args.scenarios or scenario.name in args.scenarios)]
+    results = []
+    for scenario in selected:
+        for payload_bytes in args.payload_bytes:
+            for concurrency in args.concurrency:
+                result = await run_scenario(client, scenario, args.requests, concurrency, payload_bytes, args.warmup)
+                print(f"{scenario.name:<20} c={concurrency:<4} {payload_bytes:>6}B "
+                      f"{result['requests_per_second']:>9} req/s  p99 {result['latency_ms']['p99']}ms"
+                      f"  errors {result['errors']}", file=sys.stderr)
+                results.append(result)
+    return results
+
+
+def load_app(app_dir: str, db_driver: str):
+    """Import a variant's FastAPI app, defaulting its settings to a local, single-process setup"""
+    app_dir = os.path.abspath(app_dir)
+    scratch = tempfile.mkdtemp(prefix="bench-")
+    defaults = {
+        "DATABASE_URL": f"{db_driver}:///{os.path.join(scratch, 'logs.db')}",
+        "NTP_SERVERS": "",
+        "BACKUP_SERVERS": "",
+        "NODE_ID": "1",
+        "PEERS": "",
+        "RAFT_HOST": "127.0.0.1",
+        "RAFT_PORT": "0",
+        "RAFT_DATA_DIR": os.path.join(scratch, "raft"),
+        "CLUSTER_NODES": "1=http://bench",
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+    # Paths such as app/static are relative to the variant, and its utils package is imported from app/
+    os.chdir(app_dir)
+    sys.path[:0] = [app_dir, os.path.join(app_dir, "app")]
+    from app.main import app
+    return app
+
+
+async def run(args) -> List[dict]:
+    if args.url:
+        limits = httpx.Limits(max_connections=max(args.concurrency))
+        async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+            return await run_matrix(client, args)
+
+    app = load_app(args.app_dir, args.db_driver)
+    # httpx does not send lifespan events, so run the startup and shutdown handlers here
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout) as client:
+            return await run_matrix(client, args)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark one variant of the logging service")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--app-dir", help="variant directory to import and call in-process")
+    target.add_argument("--url", help="base URL of a running node")
+    parser.add_argument("--db-driver", default="sqlite",
+                        help="SQLAlchemy driver for the default SQLite database, e.g. sqlite+aiosqlite")
+    parser.add_argument("--scenarios", nargs="*", help="scenario names to run (default: all the app serves)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--payload-bytes", type=int, nargs="+", default=[64, 1024])
+    parser.add_argument("--requests", type=int, default=1000, help="requests per scenario and setting")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests before each setting")
+    parser.add_argument("--bulk-rows", type=int, default=100, help="NDJSON lines per bulk request")
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-request timeout in seconds")
+    parser.add_argument("--out", help="write the results here instead of stdout")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    # The apps configure INFO logging on import; a line per client request would skew the numbers
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    out = os.path.abspath(args.out) if args.out else None  # before load_app changes directory
+    results = asyncio.run(run(args))
+    output = json.dumps(results, indent=2)
+    if out:
+        with open(out, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Benchmark every variant of the logging service and save one results file
+
+Each variant is a package called `app`, so each one is loaded by
+loadgen.py in its own process, against its own fresh SQLite database,
+and then by explain.py, which checks the query plans of its typical
+read queries. The combined results, with the git commit and machine
+they came from, go to benchmarks/results/ for compare.py.
+
+    python benchmarks/run.py
+    python benchmarks/run.py --variants raft async --concurrency 1 32 --payload-bytes 64 4096
+    python benchmarks/run.py --url raft-cluster=http://localhost:8000
+
+Needs the variants' own requirements plus benchmarks/requirements.txt.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOADGEN = os.path.join(ROOT, "benchmarks", "loadgen.py")
+EXPLAIN = os.path.join(ROOT, "benchmarks", "explain.py")
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+# name: (directory, SQLAlchemy driver for its SQLite database)
+VARIANTS = {
+    "async": ("distributed-logging-system-it23425590", "sqlite+aiosqlite"),
+    "replication": ("distributed-logging-system-it23289598", "sqlite+aiosqlite"),
+    "raft": ("distributed-logging-system-it23161160.", "sqlite+aiosqlite"),
+}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def loadgen_args(args) -> List[str]:
+    extra = ["--concurrency", *map(str, args.concurrency), "--payload-bytes", *map(str, args.payload_bytes),
+             "--requests", str(args.requests), "--warmup", str(args.warmup), "--bulk-rows", str(args.bulk_rows)]
+    if args.scenarios:
+        extra += ["--scenarios", *args.scenarios]
+    return extra
+
+
+def run_variant(name: str, target: List[str], args, scratch: str) -> dict:
+    """Run loadgen.py in a child process; a variant that fails is recorded, not fatal"""
+    out = os.path.join(scratch, f"{name}.json")
+    log = os.path.join(scratch, f"{name}.log")
+    print(f"== {name}", file=sys.stderr)
+    with open(log, "w") as log_file:
+        # Results go to --out, so stray stdout is kept in the log; stderr (progress lines, app logging) is shown
+        child = subprocess.run([sys.executable, LOADGEN, *target, *loadgen_args(args), "--out", out],
+                               stdout=log_file, stderr=subprocess.PIPE, text=True, timeout=args.timeout)
+    sys.stderr.write(child.stderr)
+    if child.returncode != 0 or not os.path.exists(out):
+        tail = child.stderr.strip().splitlines()[-5:]
+        return {"variant": name, "error": "\n".join(tail) or f"exit code {child.returncode}"}
+    with open(out) as f:
+        return {"variant": name, "results": json.load(f)}
+
+
+def explain_variant(name: str, target: List[str], args, scratch: str) -> dict:
+    """Run explain.py in a child process; a plan that reads a whole table fails the run"""
+    out = os.path.join(scratch, f"{name}-plans.json")
+    print(f"== {name} query plans", file=sys.stderr)
+    with open(os.path.join(scratch, f"{name}-plans.log"), "w") as log_file:
+        child = subprocess.run([sys.executable, EXPLAIN, *target, "--rows", str(args.explain_rows), "--out", out],
+                               stdout=log_file, stderr=subprocess.PIPE, text=True, timeout=args.timeout)
+    sys.stderr.write(child.stderr)
+    if not os.path.exists(out):
+        tail = child.stderr.strip().splitlines()[-5:]
+        return {"plans_error": "\n".join(tail) or f"exit code {child.returncode}"}
+    with open(out) as f:
+        return {"plans": json.load(f)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the logging service variants")
+    parser.add_argument("--variants", nargs="+", choices=sorted(VARIANTS), default=sorted(VARIANTS))
+    parser.add_argument("--url", nargs="*", default=[], metavar="NAME=URL",
+                        help="benchmark running nodes instead of the in-process variants")
+    parser.add_argument("--scenarios", nargs="*")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--payload-bytes", type=int, nargs="+", default=[64, 1024])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--bulk-rows", type=int, default=100)
+    parser.add_argument("--explain-rows", type=int, default=20000,
+                        help="logs seeded before checking the query plans, 0 to skip the check")
+    parser.add_argument("--timeout", type=float, default=1800, help="seconds allowed per variant")
+    parser.add_argument("--out", help="results file (default: benchmarks/results/<timestamp>.json)")
+    args = parser.parse_args()
+
+    if args.url:
+        targets = [(spec.split("=", 1)[0], ["--url", spec.split("=", 1)[-1]]) for spec in args.url]
+    else:
+        targets = [(name, ["--app-dir", os.path.join(ROOT, VARIANTS[name][0]), "--db-driver", VARIANTS[name][1]])
+                   for name in args.variants]
+
+    started = datetime.now(timezone.utc)
+    with tempfile.TemporaryDirectory(prefix="bench-") as scratch:
+        variants = [run_variant(name, target, args, scratch) for name, target in targets]
+        if not args.url and args.explain_rows:
+            # In a fresh process and database of its own, so the load above does not skew the statistics
+            for variant, (name, target) in zip(variants, targets):
+                variant.update(explain_variant(name, target, args, scratch))
+
+    report = {
+        "started": started.isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("out", "timeout")},
+        "variants": variants,
+    }
+    out = args.out or os.path.join(RESULTS_DIR, started.strftime("%Y%m%dT%H%M%SZ") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {out}", file=sys.stderr)
+    if any("error" in variant or "plans_error" in variant
+           or not all(plan["ok"] for plan in variant.get("plans", [])) for variant in variants):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import asyncio
+import logging
+import os
+from typing import List, Optional, Tuple
+from app.consensus.transport import RpcError
+
+FORWARD_BATCH_SIZE = int(os.getenv("FORWARD_BATCH_SIZE", "256"))  # writes per ForwardWrites RPC
+FORWARD_MAX_INFLIGHT = int(os.getenv("FORWARD_MAX_INFLIGHT", "4"))  # concurrent RPCs to the leader
+FORWARD_TIMEOUT = float(os.getenv("FORWARD_TIMEOUT", "2.0"))  # seconds, covers the leader's commit
+
+
+class ForwardError(Exception):
+    """Raised when a write cannot be handed to the leader"""
+
+
+class WriteForwarder:
+    """Sends writes received by a follower to the leader
+
+    Writes go over the Raft transport's persistent connection. Writes that
+    arrive while earlier batches are in flight are coalesced into the next
+    ForwardWrites RPC.
+    """
+
+    def __init__(self, raft_node, transport, batch_size: int = FORWARD_BATCH_SIZE,
+                 max_inflight: int = FORWARD_MAX_INFLIGHT, timeout: float = FORWARD_TIMEOUT):
+        self.raft_node = raft_node
+        self.transport = transport
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self._pending: List[Tuple[dict, asyncio.Future]] = []
+        self._slots = asyncio.Semaphore(max_inflight)
+        self._draining = False
+        self.logger = logging.getLogger("write_forwarder")
+
+    async def forward(self, data: dict) -> int:
+        """Index the leader committed the write at"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((data, future))
+        if not self._draining:
+            self._draining = True
+            asyncio.create_task(self._drain())
+        return await future
+
+    async def _drain(self):
+        try:
+            while self._pending:
+                await self._slots.acquire()
+                batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+                asyncio.create_task(self._send(batch))
+        finally:
+            self._draining = False
+
+    async def _send(self, batch: List[Tuple[dict, asyncio.Future]]):
+        try:
+            leader_id = self.raft_node.leader_id
+            if leader_id is None or leader_id == self.raft_node.node_id:
+                raise ForwardError("No leader node available")
+            try:
+                reply = await self.transport.call(
+                    leader_id, "ForwardWrites", {"entries": [data for data, _ in batch]}, self.timeout
+                )
+            except RpcError as e:
+                raise ForwardError(f"Forwarding to node {leader_id} failed: {e}")
+            for (_, future), index in zip(batch, reply["indices"]):
+                if not future.done():
+                    if index is None:
+                        future.set_exception(ForwardError("Failed to replicate log to majority of nodes"))
+                    else:
+                        future.set_result(index)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e if isinstance(e, ForwardError) else ForwardError(repr(e)))
+        finally:
+            self._slots.release()
@@ -0,0 +1,39 @@
+import os
+from typing import Dict, Optional
+
+DEFAULT_CLUSTER_NODES = "1=http://localhost:8000,2=http://localhost:8001,3=http://localhost:8002"
+
+
+def parse_cluster_nodes(spec: str) -> Dict[int, str]:
+    """Parse CLUSTER_NODES into {node_id: base_url}
+
+    Entries are "id=url"; bare URLs are numbered from 1 in order.
+    """
+    nodes = {}
+    for position, item in enumerate(filter(None, (part.strip() for part in spec.split(","))), 1):
+        if "=" in item:
+            node_id, url = item.split("=", 1)
+            nodes[int(node_id)] = url.rstrip("/")
+        else:
+            nodes[position] = item.rstrip("/")
+    return nodes
+
+
+class LeaderTracker:
+    """Maps the Raft node's leader hint to the leader's HTTP API
+
+    The hint comes from the last AppendEntries or election, so it is
+    dropped as soon as the node steps down or a new term starts without a
+    known leader; no lookup is needed to keep it current.
+    """
+
+    def __init__(self, raft_node, nodes: Optional[Dict[int, str]] = None):
+        self.raft_node = raft_node
+        self.nodes = nodes if nodes is not None else parse_cluster_nodes(os.getenv("CLUSTER_NODES", DEFAULT_CLUSTER_NODES))
+
+    def known_leader(self) -> Optional[str]:
+        """Leader URL if this node knows who leads the current term"""
+        leader_id = self.raft_node.leader_id
+        if leader_id is not None and leader_id in self.nodes:
+            return self.nodes[leader_id]
+        return None
@@ -1,23 +1,650 @@
-from typing import Dict, Optional
-from dataclasses import dataclass
+import asyncio
+import bisect
+import io
+import json
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+from array import array
+from collections import OrderedDict
+from typing import Iterator, List, Optional, Tuple
 from app.consensus.raftNode import LogEntry
 
+# Entry header: payload length, crc32 of (index, term, payload), index, term
+ENTRY_HEADER = struct.Struct(">IIQQ")
+# Index file header: segment size it describes, first index, last index, last term.
+# It is followed by the offset array and then the term array, one item per entry.
+INDEX_HEADER = struct.Struct(">QQQQ")
+
+SEGMENT_BYTES = int(os.getenv("RAFT_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+# batch: entries are synced before they are acknowledged; interval: synced in the background every
+# RAFT_FSYNC_INTERVAL seconds, so a crash can lose acknowledged entries; entry is the same as batch
+FSYNC_POLICY = os.getenv("RAFT_FSYNC", "batch")
+FSYNC_INTERVAL = float(os.getenv("RAFT_FSYNC_INTERVAL", "0.05"))  # seconds, for the interval policy
+MAX_LOADED_SEGMENTS = 8  # sealed segments whose index and mapping stay in memory
+
+FSYNC_POLICIES = ("entry", "batch", "interval")
+
+
+def encode_entry(entry: LogEntry) -> bytes:
+    payload = json.dumps(entry.data, separators=(",", ":")).encode()
+    crc = zlib.crc32(payload, zlib.crc32(struct.pack(">QQ", entry.index, entry.term)))
+    return ENTRY_HEADER.pack(len(payload), crc, entry.index, entry.term) + payload
+
+
+class Segment:
+    """One file of consecutive entries, named after its first index
+
+    Without a path the segment lives in memory, which is handy for tests.
+    """
+
+    def __init__(self, first_index: int, path: Optional[str] = None):
+        self.first_index = first_index
+        self.last_index = first_index - 1
+        self.last_term = 0
+        self.size = 0
+        self.path = path
+        # Dense per-entry file offsets and terms (8 bytes each); None while evicted
+        self.offsets: Optional[array] = array("q")
+        self.terms: Optional[array] = array("q")
+        self._file = None
+        self._map = None
+        self._mem = bytearray() if path is None else None
+
+    @property
+    def index_path(self) -> str:
+        return self.path[:-len(".log")] + ".idx"
+
+    def __len__(self):
+        return self.last_index - self.first_index + 1
+
+    # --- Writing ---------------------------------------------------------------
+
+    def open_for_append(self):
+        if self._mem is None and self._file is None:
+            self._file = open(self.path, "ab")
+
+    def write(self, records: List[Tuple[LogEntry, bytes]]):
+        """Append encoded entries in one write"""
+        offset = self.size
+        for entry, record in records:
+            self.offsets.append(offset)
+            self.terms.append(entry.term)
+            offset += len(record)
+        data = b"".join(record for _, record in records)
+        if self._mem is not None:
+            self._mem += data
+        else:
+            self._file.write(data)
+        self.size = offset
+        self.last_index = records[-1][0].index
+        self.last_term = records[-1][0].term
+
+    def flush(self, fsync: bool):
+        if self._file is not None:
+            self._file.flush()
+            if fsync:
+                os.fsync(self._file.fileno())
+
+    def sync_handle(self) -> Optional[int]:
+        """Flush to the OS and return a duplicate descriptor to fsync, which stays valid if the segment is closed"""
+        if self._file is None:
+            return None
+        self._file.flush()
+        return os.dup(self._file.fileno())
+
+    def seal(self):
+        """Stop appending and write the offset and term arrays next to the segment"""
+        if self._mem is not None:
+            return
+        self.flush(fsync=True)
+        self._file.close()
+        self._file = None
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(INDEX_HEADER.pack(self.size, self.first_index, self.last_index, self.last_term))
+            f.write(self.offsets.tobytes())
+            f.write(self.terms.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.index_path)
+
+    def truncate(self, offset: int, index: int, prev_term: int):
+        """Drop every entry from `index` (found at `offset`) onwards"""
+        self.release_map()
+        if self._mem is not None:
+            del self._mem[offset:]
+        else:
+            if self._file is not None:
+                self._file.flush()
+            with open(self.path, "r+b") as f:
+                f.truncate(offset)
+                f.flush()
+                os.fsync(f.fileno())
+            if os.path.exists(self.index_path):
+                os.remove(self.index_path)
+        self.size = offset
+        self.last_index = index - 1
+        self.last_term = prev_term
+        if self.offsets is not None:
+            del self.offsets[index - self.first_index:]
+            del self.terms[index - self.first_index:]
+
+    def delete(self):
+        self.close()
+        if self._mem is None:
+            for path in (self.path, self.index_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def close(self):
+        self.release_map()
+        if self._file is not None:
+            self._file.flush()
+            self._file.close()
+            self._file = None
+
+    # --- Reading ---------------------------------------------------------------
+
+    def buffer(self):
+        """Memory-mapped view of the segment, remapped when the file has grown"""
+        if self._mem is not None:
+            return self._mem
+        if self._map is None or len(self._map) < self.size:
+            self.release_map()
+            if self._file is not None:
+                self._file.flush()
+            with open(self.path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), self.size, access=mmap.ACCESS_READ)
+        return self._map
+
+    def release_map(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def load_index(self):
+        """Bring evicted offset and term arrays back, from the .idx file if there is one"""
+        if self.offsets is not None:
+            return
+        self.offsets, self.terms = array("q"), array("q")
+        if self._mem is None and os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as f:
+                data = f.read()
+            width = len(self) * self.offsets.itemsize
+            if INDEX_HEADER.unpack_from(data)[0] == self.size and len(data) == INDEX_HEADER.size + 2 * width:
+                self.offsets.frombytes(data[INDEX_HEADER.size:INDEX_HEADER.size + width])
+                self.terms.frombytes(data[INDEX_HEADER.size + width:])
+                return
+        for offset, _index, term, _length in self.scan(verify=False):
+            self.offsets.append(offset)
+            self.terms.append(term)
+
+    def evict(self):
+        self.release_map()
+        self.offsets = self.terms = None
+
+    def scan(self, offset: int = 0, verify: bool = True) -> Iterator[Tuple[int, int, int, int]]:
+        """Yield (offset, index, term, record length) for every intact entry"""
+        buf = self.buffer() if self.size else b""
+        expected = None
+        while offset + ENTRY_HEADER.size <= self.size:
+            length, crc, index, term = ENTRY_HEADER.unpack_from(buf, offset)
+            end = offset + ENTRY_HEADER.size + length
+            if end > self.size or (expected is not None and index != expected):
+                return
+            if verify:
+                payload = bytes(buf[offset + ENTRY_HEADER.size:end])
+                if zlib.crc32(payload, zlib.crc32(struct.pack(">QQ", index, term))) != crc:
+                    return
+            yield offset, index, term, end - offset
+            expected = index + 1
+            offset = end
+
+    def locate(self, index: int) -> int:
+        """File offset of an entry held by this segment"""
+        self.load_index()
+        return self.offsets[index - self.first_index]
+
+    def read(self, offset: int) -> Tuple[LogEntry, int]:
+        buf = self.buffer()
+        length, _crc, index, term = ENTRY_HEADER.unpack_from(buf, offset)
+        start = offset + ENTRY_HEADER.size
+        data = json.loads(bytes(buf[start:start + length]))
+        return LogEntry(term=term, index=index, data=data), start + length
+
+    def term_at(self, index: int) -> int:
+        self.load_index()
+        return self.terms[index - self.first_index]
+
 
 class LogStorage:
-    def __init__(self):
-        self.logs: Dict[int, LogEntry] = {}
+    """Durable Raft log made of append-only segment files
+
+    Entries are stored in a compact binary format and read through mmap.
+    Indices are dense, so each segment keeps plain offset and term arrays
+    and finds any entry in O(1). Only the active segment and the most
+    recently used sealed segments are held in memory, so memory does not
+    grow with the log. The current term and vote are persisted next to the segments.
+
+    Appends and save_state only write; the fsyncs run in a worker thread
+    when sync() is awaited, so the event loop keeps serving heartbeats
+    while the disk catches up. One fsync covers everything written before it.
+
+    A snapshot of the state machine covers every entry up to
+    snapshot_index; segments entirely covered by it are deleted.
+    """
+
+    def __init__(self, data_dir: Optional[str] = None, segment_bytes: int = SEGMENT_BYTES,
+                 fsync_policy: str = FSYNC_POLICY, fsync_interval: float = FSYNC_INTERVAL):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy {fsync_policy}")
+        self.data_dir = data_dir
+        self.segment_bytes = segment_bytes
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.segments: List[Segment] = []
+        self._starts: List[int] = []  # first index of each segment, for bisect
+        self._loaded: "OrderedDict[int, Segment]" = OrderedDict()
+        self._state = (0, None)  # hard state when running without a data directory
+        self._unsynced_state: Optional[Tuple[int, Optional[int]]] = None  # saved but not on disk yet
+        self.synced_index = 0  # entries up to here are on disk
+        self._truncations = 0  # an fsync that overlapped a truncation proves nothing about the entries after it
+        self._sync_lock = asyncio.Lock()
+        self._syncer: Optional[asyncio.Task] = None
+        self._snapshot: Optional[bytes] = None  # snapshot when running without a data directory
+        self.snapshot_index = 0
+        self.snapshot_term = 0
         self.last_index = 0
+        self.last_term = 0
+        self._recover()
+
+    @property
+    def first_index(self) -> int:
+        """Oldest entry still held in the log"""
+        return self.segments[0].first_index if self.segments else self.last_index + 1
+
+    # --- Recovery ----------------------------------------------------------------
+
+    def _segment_path(self, first_index: int) -> Optional[str]:
+        if self.data_dir is None:
+            return None
+        return os.path.join(self.data_dir, f"{first_index:020d}.log")
+
+    def _recover(self):
+        """Rebuild segment metadata from the files on disk"""
+        if self.data_dir is None:
+            return
+        os.makedirs(self.data_dir, exist_ok=True)
+        self._recover_snapshot()
+        names = sorted(name for name in os.listdir(self.data_dir) if name.endswith(".log"))
+        for position, name in enumerate(names):
+            segment = Segment(int(name[:-len(".log")]), os.path.join(self.data_dir, name))
+            segment.size = os.path.getsize(segment.path)
+            is_last = position == len(names) - 1
+            if not is_last and self._recover_from_index(segment):
+                segment.evict()
+                self._add_segment(segment)
+                continue
+            # No usable index (or the active segment): scan it, dropping a torn tail
+            end = 0
+            for offset, index, term, length in segment.scan(verify=is_last):
+                segment.offsets.append(offset)
+                segment.terms.append(term)
+                segment.last_index, segment.last_term = index, term
+                end = offset + length
+            if end < segment.size:
+                segment.truncate(end, segment.last_index + 1, segment.last_term)
+            if len(segment) == 0 and is_last and self.segments:
+                segment.delete()
+                continue
+            self._add_segment(segment)
+
+        if self.segments:
+            self.last_index = self.segments[-1].last_index
+            self.last_term = self.segments[-1].last_term
+            self.segments[-1].open_for_append()
+        self.synced_index = self.last_index
+        if self.snapshot_index:
+            # Finish a compaction or log reset that was interrupted by a crash
+            segment = self._find_segment(self.snapshot_index)
+            if self.last_index < self.snapshot_index or (
+                    segment is not None
+                    and segment.term_at(self.snapshot_index) != self.snapshot_term):
+                self._reset_log(self.snapshot_index, self.snapshot_term)
+            else:
+                self._compact(self.snapshot_index)
+
+    def _recover_snapshot(self):
+        names = sorted(os.listdir(self.data_dir))
+        for name in names:
+            if name.endswith(".snap.tmp"):
+                os.remove(os.path.join(self.data_dir, name))
+        snapshots = [name for name in names if name.endswith(".snap")]
+        if snapshots:
+            index, term = snapshots[-1][len("snapshot-"):-len(".snap")].split("-")
+            self.snapshot_index, self.snapshot_term = int(index), int(term)
+            self._remove_old_snapshots()
+
+    @staticmethod
+    def _recover_from_index(segment: Segment) -> bool:
+        if not os.path.exists(segment.index_path):
+            return False
+        with open(segment.index_path, "rb") as f:
+            header = f.read(INDEX_HEADER.size)
+        if len(header) < INDEX_HEADER.size:
+            return False
+        size, first, last, term = INDEX_HEADER.unpack(header)
+        if size != segment.size or first != segment.first_index:
+            return False
+        segment.last_index, segment.last_term = last, term
+        return True
+
+    # --- Hard state ------------------------------------------------------------
+
+    def save_state(self, term: int, voted_for: Optional[int]):
+        """Record current_term and voted_for; await sync() before they are acted upon"""
+        self._state = (term, voted_for)
+        if self.data_dir is not None:
+            self._unsynced_state = (term, voted_for)
+
+    def _write_state(self, term: int, voted_for: Optional[int]):
+        path = os.path.join(self.data_dir, "state.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump({"current_term": term, "voted_for": voted_for}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def load_state(self) -> Tuple[int, Optional[int]]:
+        if self.data_dir is None or self._unsynced_state is not None:
+            return self._state
+        path = os.path.join(self.data_dir, "state.json")
+        if not os.path.exists(path):
+            return 0, None
+        with open(path) as f:
+            state = json.load(f)
+        return state["current_term"], state["voted_for"]
+
+    # --- Writing -----------------------------------------------------------------
 
     def append(self, entry: LogEntry):
         """Append a new log entry"""
-        self.logs[entry.index] = entry
-        if entry.index > self.last_index:
-            self.last_index = entry.index
+        self.append_many([entry])
+
+    def append_many(self, entries: List[LogEntry]):
+        """Append consecutive entries; they are durable once sync() returns"""
+        if not entries:
+            return
+        if entries[0].index != self.last_index + 1:
+            raise ValueError(f"Expected index {self.last_index + 1}, got {entries[0].index}")
+        segment = self._active_segment()
+        size = segment.size
+        pending = []
+        for entry in entries:
+            record = encode_entry(entry)
+            # Roll over to a new segment once the active one is full
+            if pending and size >= self.segment_bytes:
+                self._write(segment, pending)
+                segment = self._active_segment()
+                size, pending = segment.size, []
+            pending.append((entry, record))
+            size += len(record)
+        self._write(segment, pending)
+        if self.data_dir is None:
+            self.synced_index = self.last_index
+
+    def _write(self, segment: Segment, records: List[Tuple[LogEntry, bytes]]):
+        segment.write(records)
+        self.last_index = records[-1][0].index
+        self.last_term = records[-1][0].term
+
+    @property
+    def durable_index(self) -> int:
+        """Entries up to here may be acknowledged: synced ones, or all of them under the interval policy"""
+        return self.last_index if self.fsync_policy == "interval" else self.synced_index
+
+    async def sync(self, entries: Optional[bool] = None):
+        """Wait until the saved state, and the appended entries unless the interval policy covers them, are on disk"""
+        if entries is None:
+            entries = self.fsync_policy != "interval"
+        wanted = self.last_index if entries else 0
+        while self._unsynced_state is not None or self.synced_index < min(wanted, self.last_index):
+            # Whoever queues behind a running fsync usually finds its writes covered by it
+            async with self._sync_lock:
+                state, self._unsynced_state = self._unsynced_state, None
+                target, truncations = self.last_index, self._truncations
+                handle = None
+                if self.synced_index < min(wanted, target) and self.segments:
+                    handle = self.segments[-1].sync_handle()
+                if state is None and handle is None:
+                    continue
+                try:
+                    await asyncio.to_thread(self._fsync, state, handle)
+                except BaseException:
+                    if state is not None and self._unsynced_state is None:
+                        self._unsynced_state = state
+                    raise
+                # Sealed segments were synced when they were sealed
+                if handle is not None and truncations == self._truncations:
+                    self.synced_index = max(self.synced_index, target)
+
+    def _fsync(self, state: Optional[Tuple[int, Optional[int]]], handle: Optional[int]):
+        if handle is not None:
+            try:
+                os.fsync(handle)
+            finally:
+                os.close(handle)
+        if state is not None:
+            self._write_state(*state)
+
+    async def _sync_periodically(self):
+        while True:
+            await asyncio.sleep(self.fsync_interval)
+            try:
+                await self.sync(entries=True)
+            except OSError:
+                # Retried on the next tick; entries are still acknowledged under this policy
+                pass
+
+    def start(self):
+        """Start syncing in the background under the interval policy; call from the running loop"""
+        if self.data_dir is not None and self.fsync_policy == "interval" and self._syncer is None:
+            self._syncer = asyncio.create_task(self._sync_periodically())
+
+    def _active_segment(self) -> Segment:
+        if self.segments and self.segments[-1].size < self.segment_bytes:
+            return self.segments[-1]
+        if self.segments:
+            self.segments[-1].seal()
+            self._remember(self.segments[-1])
+        segment = Segment(self.last_index + 1, self._segment_path(self.last_index + 1))
+        segment.open_for_append()
+        self._add_segment(segment)
+        return segment
+
+    def _add_segment(self, segment: Segment):
+        self.segments.append(segment)
+        self._starts.append(segment.first_index)
+
+    def truncate_from(self, index: int):
+        """Remove the entry at index and everything after it"""
+        if index > self.last_index or not self.segments:
+            return
+        while self.segments and self.segments[-1].first_index >= index and len(self.segments) > 1:
+            self._loaded.pop(self.segments[-1].first_index, None)
+            self._starts.pop()
+            self.segments.pop().delete()
+        segment = self.segments[-1]
+        segment.load_index()
+        if index <= segment.first_index:
+            index = segment.first_index
+            prev_term = self.term_at(index - 1)
+            offset = 0
+        else:
+            prev_term = self.term_at(index - 1)
+            offset = segment.locate(index)
+        segment.truncate(offset, index, prev_term)
+        segment.open_for_append()
+        self._loaded.pop(segment.first_index, None)
+        self.last_index = segment.last_index
+        self.last_term = segment.last_term
+        self.synced_index = min(self.synced_index, self.last_index)
+        self._truncations += 1
+
+    # --- Snapshots -----------------------------------------------------------------
+
+    def _snapshot_path(self, index: int, term: int) -> str:
+        return os.path.join(self.data_dir, f"snapshot-{index:020d}-{term:020d}.snap")
+
+    def _remove_old_snapshots(self):
+        keep = os.path.basename(self._snapshot_path(self.snapshot_index, self.snapshot_term))
+        for name in os.listdir(self.data_dir):
+            if name.endswith(".snap") and name != keep:
+                os.remove(os.path.join(self.data_dir, name))
+
+    def create_snapshot_file(self):
+        """Binary file to write a new snapshot into; pass it to save_snapshot or discard_snapshot_file"""
+        if self.data_dir is None:
+            return io.BytesIO()
+        return tempfile.NamedTemporaryFile(suffix=".snap.tmp", dir=self.data_dir, delete=False)
+
+    def discard_snapshot_file(self, snapshot_file):
+        snapshot_file.close()
+        if self.data_dir is not None and os.path.exists(snapshot_file.name):
+            os.remove(snapshot_file.name)
+
+    def save_snapshot(self, snapshot_file, index: int, term: int):
+        """Make a finished snapshot current and compact the log it covers
+
+        Entries after the snapshot are kept only if the log agrees with it
+        at index; otherwise the whole log is discarded.
+        """
+        if index <= self.snapshot_index:
+            self.discard_snapshot_file(snapshot_file)
+            return
+        if self.data_dir is None:
+            self._snapshot = snapshot_file.getvalue()
+            snapshot_file.close()
+        else:
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+            snapshot_file.close()
+            os.replace(snapshot_file.name, self._snapshot_path(index, term))
+        matches = index <= self.last_index and self.term_at(index) == term
+        self.snapshot_index, self.snapshot_term = index, term
+        if self.data_dir is not None:
+            self._remove_old_snapshots()
+        if matches:
+            self._compact(index)
+        else:
+            self._reset_log(index, term)
+
+    def open_snapshot(self):
+        """Readable binary file with the current snapshot, or None"""
+        if not self.snapshot_index:
+            return None
+        if self.data_dir is None:
+            return io.BytesIO(self._snapshot)
+        return open(self._snapshot_path(self.snapshot_index, self.snapshot_term), "rb")
+
+    def _compact(self, index: int):
+        """Delete sealed segments whose entries are all covered by a snapshot"""
+        while len(self.segments) > 1 and self.segments[0].last_index <= index:
+            self._starts.pop(0)
+            segment = self.segments.pop(0)
+            self._loaded.pop(segment.first_index, None)
+            segment.delete()
+
+    def _reset_log(self, index: int, term: int):
+        """Drop every entry; the next one appended is index + 1"""
+        for segment in self.segments:
+            segment.delete()
+        self.segments = []
+        self._starts = []
+        self._loaded.clear()
+        self.last_index = index
+        self.last_term = term
+        self.synced_index = index
+        self._truncations += 1
+
+    # --- Reading -----------------------------------------------------------------
+
+    def _remember(self, segment: Segment):
+        """Keep at most MAX_LOADED_SEGMENTS sealed segments mapped and indexed"""
+        if segment is self.segments[-1]:
+            return
+        self._loaded[segment.first_index] = segment
+        self._loaded.move_to_end(segment.first_index)
+        while len(self._loaded) > MAX_LOADED_SEGMENTS:
+            _, evicted = self._loaded.popitem(last=False)
+            evicted.evict()
+
+    def _find_segment(self, index: int) -> Optional[Segment]:
+        if index < 1 or index > self.last_index:
+            return None
+        position = bisect.bisect_right(self._starts, index) - 1
+        if position < 0:
+            return None
+        segment = self.segments[position]
+        self._remember(segment)
+        return segment
 
     def get(self, index: int) -> Optional[LogEntry]:
         """Get a log entry by index"""
-        return self.logs.get(index)
+        segment = self._find_segment(index)
+        if segment is None:
+            return None
+        return segment.read(segment.locate(index))[0]
+
+    def term_at(self, index: int) -> int:
+        """Term of the entry at index: 0 before the log, -1 past its end"""
+        if index == 0:
+            return 0
+        if index == self.snapshot_index:
+            return self.snapshot_term
+        if index == self.last_index:
+            return self.last_term
+        segment = self._find_segment(index)
+        if segment is None:
+            return -1
+        return segment.term_at(index)
+
+    def entries_from(self, index: int, limit: int) -> List[LogEntry]:
+        """Up to limit consecutive entries starting at index"""
+        entries = []
+        while len(entries) < limit and index <= self.last_index:
+            segment = self._find_segment(index)
+            if segment is None:
+                break
+            offset = segment.locate(index)
+            while len(entries) < limit and index <= segment.last_index:
+                entry, offset = segment.read(offset)
+                entries.append(entry)
+                index += 1
+        return entries
+
+    def entries_between(self, start: int, end: int, limit: int) -> List[LogEntry]:
+        """Entries start..end (inclusive), at most limit of them, in O(limit)"""
+        start = max(start, self.first_index)
+        end = min(end, self.last_index)
+        return self.entries_from(start, min(limit, end - start + 1))
 
     def get_all(self) -> list:
         """Get all log entries in order"""
-        return [self.logs[i] for i in sorted(self.logs.keys())]
\ No newline at end of file
+        return self.entries_from(self.first_index, self.last_index)
+
+    def close(self):
+        if self._syncer is not None:
+            self._syncer.cancel()
+            self._syncer = None
+        if self.segments:
+            self.segments[-1].flush(fsync=True)
+            self.synced_index = self.last_index
+        if self._unsynced_state is not None:
+            self._write_state(*self._unsynced_state)
+            self._unsynced_state = None
+        for segment in self.segments:
+            segment.close()
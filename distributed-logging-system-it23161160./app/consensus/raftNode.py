@@ -1,9 +1,16 @@
+import base64
 import logging
+import random
 from typing import Dict, List, Optional
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, asdict
 import asyncio
 from enum import Enum, auto
 
+from app.consensus.transport import RpcError
+from app.metrics import Histogram
+
+APPEND_ENTRIES_RTT = Histogram("raft_append_entries_rtt_seconds", "Round trip of an answered AppendEntries", ["peer"])
+
 
 class RaftRole(Enum):
     FOLLOWER = auto()
@@ -16,25 +23,46 @@ class RaftParams:
     election_timeout: int = 1000  # ms
     heartbeat_interval: int = 500  # ms
     rpc_timeout: int = 300  # ms
+    max_append_entries: int = 512  # entries per AppendEntries RPC
+    max_inflight: int = 4  # pipelined AppendEntries RPCs per follower
+    snapshot_threshold: int = 10000  # applied entries between snapshots
+    snapshot_chunk_bytes: int = 1024 * 1024  # bytes per InstallSnapshot RPC
+    lease_reads: bool = True  # serve reads on a valid leader lease without a heartbeat round
+    lease_ratio: float = 0.9  # share of the election timeout a lease lasts (clock drift margin)
+    write_timeout: int = 1500  # ms a write may take to commit and apply before it is reported as failed
 
 
 @dataclass
 class LogEntry:
+    __slots__ = ("term", "index", "data")  # no per-instance __dict__
+
     term: int
     index: int
     data: dict
 
 
 class RaftNode:
-    def __init__(self, node_id: int, peers: List[int], params: RaftParams):
+    def __init__(self, node_id: int, peers: List[int], params: RaftParams, transport=None, storage=None,
+                 state_machine=None, rng: Optional[random.Random] = None):
         self.node_id = node_id
         self.peers = peers
         self.params = params
+        self.transport = transport
+        self.rng = rng or random.Random()
+
+        if storage is None:
+            from app.consensus.logStorage import LogStorage
+            storage = LogStorage()  # in-memory log
+        self.log = storage
+        if state_machine is None:
+            from app.consensus.stateMachine import MemoryStateMachine
+            state_machine = MemoryStateMachine()
+        self.state_machine = state_machine
 
-        self.current_term = 0
-        self.voted_for: Optional[int] = None
+        # Term and vote survive restarts
+        self.current_term, self.voted_for = self.log.load_state()
         self.role = RaftRole.FOLLOWER
-        self.log: List[LogEntry] = []
+        self.leader_id: Optional[int] = None
 
         self.commit_index = 0
         self.last_applied = 0
@@ -45,20 +73,96 @@ class RaftNode:
 
         self.election_timer = None
         self.heartbeat_timer = None
+        self._commit_waiters: Dict[int, asyncio.Future] = {}
+        self._inflight: Dict[int, int] = {}  # AppendEntries RPCs outstanding per follower
+        self._proposals: List[tuple] = []  # (data, future) waiting for the next group commit
+        self._snapshotting = False
+        self._incoming_snapshot = None  # (index, term, file) while an InstallSnapshot is in progress
+        self._apply_waiters: List[tuple] = []  # (index, future) for reads waiting on last_applied
+        self._applier: Optional[asyncio.Task] = None  # applies committed entries, one batch at a time
+        self._ack_times: Dict[int, float] = {}  # send time of the latest AppendEntries each follower answered
+        self._leader_contact = float("-inf")  # loop time we last heard from a leader
+        self._noop: Optional[asyncio.Future] = None
+        self._transferring = False  # proposals are refused while leadership is handed over
+        self._handed_over = False  # TimeoutNow was sent; another leader may exist before we step down
+        self._failover_started: Optional[float] = None  # when we last heard from the previous leader
+        self.failover_latency: Optional[float] = None  # seconds from leader loss to our first commit
+        self.elections_won = 0
         self.logger = logging.getLogger(f"raft_node_{node_id}")
 
     async def start(self):
         """Start the Raft node"""
+        if self.log.snapshot_index:
+            await self._restore_snapshot()
+        self.log.start()
         self._reset_election_timer()
         self.logger.info(f"Node {self.node_id} started as follower")
 
+    async def stop(self):
+        """Stop all timers"""
+        for timer in (self.election_timer, self.heartbeat_timer, self._applier):
+            if timer:
+                timer.cancel()
+        self._fail_commit_waiters()
+        self._discard_incoming_snapshot()
+
+    # --- Log helpers ---------------------------------------------------------
+
+    def _last_log_index(self) -> int:
+        return self.log.last_index
+
+    def _last_log_term(self) -> int:
+        return self.log.last_term
+
+    def _term_at(self, index: int) -> int:
+        return self.log.term_at(index)
+
+    def _entries_from(self, index: int, limit: int) -> List[LogEntry]:
+        return self.log.entries_from(index, limit)
+
+    def _truncate_from(self, index: int):
+        self.log.truncate_from(index)
+
+    def _append_entries(self, entries: List[LogEntry]):
+        self.log.append_many(entries)
+
+    def _persist_state(self):
+        self.log.save_state(self.current_term, self.voted_for)
+
+    @property
+    def majority(self) -> int:
+        return (len(self.peers) + 1) // 2 + 1
+
+    # --- Term and role changes -----------------------------------------------
+
+    def _step_down(self, term: int, leader_id: Optional[int] = None):
+        """Follow a newer term (or a leader of the current one)"""
+        if term > self.current_term:
+            self.current_term = term
+            self.voted_for = None
+            self._persist_state()
+        was_leader = self.role == RaftRole.LEADER
+        self.role = RaftRole.FOLLOWER
+        self.leader_id = leader_id
+        if was_leader:
+            self.logger.info(f"Node {self.node_id} stepped down in term {self.current_term}")
+            if self.heartbeat_timer:
+                self.heartbeat_timer.cancel()
+                self.heartbeat_timer = None
+            self._fail_commit_waiters()
+        self._reset_election_timer()
+
+    def _random_timeout(self) -> float:
+        """Election timeout drawn from [T, 2T] so nodes rarely time out together"""
+        base = self.params.election_timeout / 1000
+        return base + self.rng.random() * base
+
     def _reset_election_timer(self):
         """Reset the election timeout"""
         if self.election_timer:
             self.election_timer.cancel()
 
-        timeout = self.params.election_timeout / 1000
-        self.election_timer = asyncio.create_task(self._election_timeout(timeout))
+        self.election_timer = asyncio.create_task(self._election_timeout(self._random_timeout()))
 
     async def _election_timeout(self, timeout: float):
         """Handle election timeout"""
@@ -67,34 +171,109 @@ class RaftNode:
         if self.role == RaftRole.LEADER:
             return
 
-        self.logger.info(f"Election timeout, becoming candidate (term {self.current_term + 1})")
+        # Retry with a new election if this one does not finish
+        self.election_timer = asyncio.create_task(self._election_timeout(self._random_timeout()))
+        await self._run_election()
+
+    async def _pre_vote(self) -> bool:
+        """Ask whether we could win before bumping the term, so a node that was cut off cannot disrupt the cluster"""
+        request = {
+            "term": self.current_term + 1,
+            "candidate_id": self.node_id,
+            "last_log_index": self._last_log_index(),
+            "last_log_term": self._last_log_term(),
+        }
+        votes = 1
+        for next_reply in asyncio.as_completed(self._call_peers("PreVote", request)):
+            reply = await next_reply
+            if reply is not None and reply["vote_granted"]:
+                votes += 1
+                if votes >= self.majority:
+                    return True
+        return votes >= self.majority
+
+    async def _run_election(self, transfer: bool = False):
+        """Stand for election; transfer skips pre-vote when the leader handed over to us"""
+        if not transfer:
+            term, leader_id = self.current_term, self.leader_id
+            won = await self._pre_vote()
+            # A leader may have shown up while the pre-vote was in flight; its result is stale then
+            if self.current_term != term or self.leader_id not in (None, leader_id) or self._leader_is_alive():
+                self.logger.debug(f"Node {self.node_id} heard from a leader during the pre-vote for term {term + 1}")
+                return
+            if not won:
+                self.logger.debug(f"Node {self.node_id} lost the pre-vote for term {term + 1}")
+                return
+        if self.role == RaftRole.LEADER:
+            return
+
+        self.logger.info(f"Becoming candidate (term {self.current_term + 1})")
         self.role = RaftRole.CANDIDATE
         self.current_term += 1
         self.voted_for = self.node_id
+        self.leader_id = None
+        self._persist_state()
+        term = self.current_term
+        # Our own vote has to be on disk before we ask for the others
+        await self.log.sync(entries=False)
+        if self.role != RaftRole.CANDIDATE or self.current_term != term:
+            return
 
-        # Request votes from peers
+        # Request votes from all peers at once
+        request = {
+            "term": term,
+            "candidate_id": self.node_id,
+            "last_log_index": self._last_log_index(),
+            "last_log_term": self._last_log_term(),
+            "transfer": transfer,
+        }
         votes = 1  # vote for self
-        for peer in self.peers:
-            # In a real implementation, send RPC to peers
-            pass
+        for next_reply in asyncio.as_completed(self._call_peers("RequestVote", request)):
+            reply = await next_reply
+            if self.role != RaftRole.CANDIDATE or self.current_term != term:
+                return
+            if reply is None:
+                continue
+            if reply["term"] > self.current_term:
+                self._step_down(reply["term"])
+                return
+            if reply["vote_granted"]:
+                votes += 1
+
+            # If we get majority votes, become leader
+            if votes >= self.majority:
+                await self._become_leader()
+                return
 
-        # If we get majority votes, become leader
-        if votes > len(self.peers) / 2:
+        if votes >= self.majority and self.role == RaftRole.CANDIDATE:
             await self._become_leader()
 
     async def _become_leader(self):
         """Transition to leader state"""
         self.role = RaftRole.LEADER
+        self.leader_id = self.node_id
+        self._handed_over = False
+        self.elections_won += 1
+        if self.election_timer and self.election_timer is not asyncio.current_task():
+            self.election_timer.cancel()
+        self.election_timer = None
         self.logger.info(f"Node {self.node_id} became leader for term {self.current_term}")
 
+        if self._leader_contact != float("-inf"):
+            self._failover_started = self._leader_contact
+
         # Initialize leader state
         for peer in self.peers:
-            self.next_index[peer] = len(self.log) + 1
+            self.next_index[peer] = self._last_log_index() + 1
             self.match_index[peer] = 0
+        self._ack_times = {}
 
         # Start sending heartbeats
         self._start_heartbeat_timer()
 
+        # Commit a no-op so the commit index of this term is known before serving reads
+        self._noop = asyncio.ensure_future(self.replicate_log({}))
+
     def _start_heartbeat_timer(self):
         """Start periodic heartbeats"""
         if self.heartbeat_timer:
@@ -106,22 +285,552 @@ class RaftNode:
     async def _send_heartbeats(self, interval: float):
         """Send periodic heartbeats to followers"""
         while self.role == RaftRole.LEADER:
-            # In a real implementation, send AppendEntries RPC to all peers
+            self._broadcast_append_entries(heartbeat=True)
             await asyncio.sleep(interval)
 
-    async def replicate_log(self, entry: dict) -> bool:
-        """Attempt to replicate a log entry to majority of nodes"""
+    # --- Replication -----------------------------------------------------------
+
+    async def _call(self, peer: int, rpc: str, payload: dict) -> Optional[dict]:
+        """Send an RPC to a peer; None if it could not be delivered in time"""
+        if self.transport is None:
+            return None
+        try:
+            return await self.transport.call(peer, rpc, payload, self.params.rpc_timeout / 1000)
+        except RpcError as e:
+            self.logger.debug(f"{rpc} to node {peer} failed: {e}")
+            return None
+
+    def _call_peers(self, rpc: str, payload: dict) -> List[asyncio.Task]:
+        """Send an RPC to every peer at once
+
+        The calls start in peer order: as_completed would start bare
+        coroutines in set order, and a seeded simulation must make its
+        random draws in the same order every run.
+        """
+        return [asyncio.ensure_future(self._call(peer, rpc, payload)) for peer in self.peers]
+
+    def _broadcast_append_entries(self, heartbeat: bool = False):
+        for peer in self.peers:
+            self._pump(peer, heartbeat)
+
+    def _pump(self, peer: int, heartbeat: bool = False):
+        """Keep up to max_inflight AppendEntries in flight to a follower
+
+        next_index is advanced optimistically as each batch is sent; a
+        rejection or lost request moves it back.
+        """
+        while self.role == RaftRole.LEADER and self._inflight.get(peer, 0) < self.params.max_inflight:
+            idle = self._inflight.get(peer, 0) == 0
+            next_index = self.next_index.get(peer, self._last_log_index() + 1)
+            if next_index < self.log.first_index or self._term_at(next_index - 1) == -1:
+                # The entries this follower needs were compacted into the snapshot
+                if idle:
+                    self._start_send(peer, self._send_snapshot(peer, self.current_term))
+                return
+            entries = self._entries_from(next_index, self.params.max_append_entries)
+            if not entries and not (heartbeat and idle):
+                return
+            self.next_index[peer] = next_index + len(entries)
+            self._start_send(peer, self._send_append_entries(peer, self.current_term, next_index, entries))
+            if not entries:
+                return
+            heartbeat = False
+
+    def _start_send(self, peer: int, send):
+        self._inflight[peer] = self._inflight.get(peer, 0) + 1
+        asyncio.create_task(self._track_send(peer, send))
+
+    async def _track_send(self, peer: int, send):
+        try:
+            more = await send
+        finally:
+            self._inflight[peer] -= 1
+        if more:
+            self._pump(peer)
+
+    async def _send_append_entries(self, peer: int, term: int, next_index: int, entries: List[LogEntry]) -> bool:
+        """Send one AppendEntries; True if the follower should be sent more right away"""
+        prev_index = next_index - 1
+        request = {
+            "term": term,
+            "leader_id": self.node_id,
+            "prev_log_index": prev_index,
+            "prev_log_term": self._term_at(prev_index),
+            "entries": [asdict(entry) for entry in entries],
+            "leader_commit": self.commit_index,
+        }
+        sent_at = asyncio.get_running_loop().time()
+        reply = await self._call(peer, "AppendEntries", request)
+        if self.role != RaftRole.LEADER or self.current_term != term:
+            return False
+        if reply is None:
+            # Resend from here on the next heartbeat
+            self.next_index[peer] = min(self.next_index.get(peer, next_index), next_index)
+            return False
+        if reply["term"] > self.current_term:
+            self._step_down(reply["term"])
+            return False
+        self._ack_times[peer] = max(self._ack_times.get(peer, sent_at), sent_at)
+        APPEND_ENTRIES_RTT.labels(peer).observe(asyncio.get_running_loop().time() - sent_at)
+
+        if reply["success"]:
+            match = prev_index + len(entries)
+            self.match_index[peer] = max(self.match_index.get(peer, 0), match)
+            self.next_index[peer] = max(self.next_index.get(peer, 0), self.match_index[peer] + 1)
+            self._advance_commit_index()
+            return True
+        # Jump back to the follower's hint instead of one entry at a time
+        self.next_index[peer] = max(1, min(next_index - 1, reply.get("last_log_index", 0) + 1))
+        return True
+
+    async def _send_snapshot(self, peer: int, term: int) -> bool:
+        """Stream the current snapshot in chunks; True if the follower still needs more"""
+        index, last_term = self.log.snapshot_index, self.log.snapshot_term
+        snapshot_file = self.log.open_snapshot()
+        if snapshot_file is None:
+            return False
+        with snapshot_file:
+            size = snapshot_file.seek(0, 2)
+            snapshot_file.seek(0)
+            offset = 0
+            while True:
+                chunk = snapshot_file.read(self.params.snapshot_chunk_bytes)
+                done = offset + len(chunk) >= size
+                request = {
+                    "term": term,
+                    "leader_id": self.node_id,
+                    "last_included_index": index,
+                    "last_included_term": last_term,
+                    "offset": offset,
+                    "data": base64.b64encode(chunk).decode(),
+                    "done": done,
+                }
+                reply = await self._call(peer, "InstallSnapshot", request)
+                if reply is None or self.role != RaftRole.LEADER or self.current_term != term:
+                    return False
+                if reply["term"] > self.current_term:
+                    self._step_down(reply["term"])
+                    return False
+                if not reply["success"]:
+                    return False
+                if done:
+                    break
+                offset += len(chunk)
+
+        self.logger.info(f"Sent snapshot up to {index} to node {peer}")
+        self.match_index[peer] = max(self.match_index.get(peer, 0), index)
+        self.next_index[peer] = self.match_index[peer] + 1
+        self._advance_commit_index()
+        return self.next_index[peer] <= self._last_log_index()
+
+    def _advance_commit_index(self):
+        """Commit the highest index stored on a majority in the current term"""
+        for index in range(self._last_log_index(), self.commit_index, -1):
+            if self._term_at(index) != self.current_term:
+                break
+            stored = 1 if index <= self.log.durable_index else 0  # our own copy counts once it is synced
+            replicas = stored + sum(1 for peer in self.peers if self.match_index.get(peer, 0) >= index)
+            if replicas >= self.majority:
+                self._set_commit_index(index)
+                break
+
+    def _set_commit_index(self, index: int):
+        if index <= self.commit_index:
+            return
+        self.commit_index = index
+        if self._failover_started is not None and self.role == RaftRole.LEADER:
+            self.failover_latency = asyncio.get_running_loop().time() - self._failover_started
+            self._failover_started = None
+            self.logger.info(f"Failover took {self.failover_latency * 1000:.0f}ms")
+        self._apply_committed()
+        for waiting_index in [i for i in self._commit_waiters if i <= index]:
+            future = self._commit_waiters.pop(waiting_index)
+            if not future.done():
+                future.set_result(waiting_index)
+
+    # --- State machine and snapshots -------------------------------------------
+
+    def _apply_committed(self):
+        """Make sure newly committed entries get applied; the state machine's I/O never blocks the loop"""
+        if self._applier is None or self._applier.done():
+            self._applier = asyncio.create_task(self._apply_loop())
+
+    async def _apply_loop(self):
+        """Apply committed entries to the state machine in order, a batch per round trip"""
+        while self.last_applied < self.commit_index:
+            entries = self._entries_from(self.last_applied + 1,
+                                         min(self.commit_index - self.last_applied, self.params.max_append_entries))
+            if not entries:
+                break  # compacted into a snapshot that is being restored
+            try:
+                await self.state_machine.apply_many(entries)
+            except Exception:
+                self.logger.exception(f"Applying entries {entries[0].index}-{entries[-1].index} failed")
+                await asyncio.sleep(self.params.heartbeat_interval / 1000)
+                continue
+            self.last_applied = max(self.last_applied, entries[-1].index)
+            self._wake_apply_waiters()
+        self._maybe_snapshot()
+
+    def _maybe_snapshot(self):
+        if self._snapshotting or self.last_applied - self.log.snapshot_index < self.params.snapshot_threshold:
+            return
+        self._snapshotting = True
+        asyncio.create_task(self._take_snapshot(self.last_applied, self._term_at(self.last_applied)))
+
+    async def _take_snapshot(self, index: int, term: int):
+        """Snapshot the state machine at index and compact the log behind it"""
+        snapshot_file = self.log.create_snapshot_file()
+        try:
+            await self.state_machine.snapshot(snapshot_file, index)
+            self.log.save_snapshot(snapshot_file, index, term)
+            self.logger.info(f"Node {self.node_id} took a snapshot up to {index}")
+        except Exception:
+            self.logger.exception("Snapshot failed")
+            self.log.discard_snapshot_file(snapshot_file)
+        finally:
+            self._snapshotting = False
+
+    async def _restore_snapshot(self):
+        index = self.log.snapshot_index
+        with self.log.open_snapshot() as snapshot_file:
+            await self.state_machine.restore(snapshot_file)
+        self.last_applied = max(self.last_applied, index)
+        self.commit_index = max(self.commit_index, index)
+        self._wake_apply_waiters()
+        self._apply_committed()  # entries after the snapshot
+
+    def _fail_commit_waiters(self):
+        waiters, self._commit_waiters = self._commit_waiters, {}
+        proposals, self._proposals = self._proposals, []
+        for future in list(waiters.values()) + [future for _, future in proposals]:
+            if not future.done():
+                future.set_result(None)
+
+    async def replicate_log(self, entry: dict) -> Optional[int]:
+        """Replicate a log entry to a majority; its index once committed and applied, else None
+
+        None means the write timed out or leadership was lost; the entry
+        may still commit later.
+        """
+        if self.role != RaftRole.LEADER or self._transferring:
+            return None
+
+        # Entries proposed in the same event loop pass are appended and sent together
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.params.write_timeout / 1000
+        future = loop.create_future()
+        self._proposals.append((entry, future))
+        if len(self._proposals) == 1:
+            loop.call_soon(self._flush_proposals)
+        try:
+            # Wait for majority to acknowledge
+            index = await asyncio.wait_for(future, self.params.write_timeout / 1000)
+        except asyncio.TimeoutError:
+            return None
+        # Applying runs behind committing; reads only see the entry once it is applied
+        if index is None or not await self.wait_applied(index, max(deadline - loop.time(), 0)):
+            return None
+        return index
+
+    def _flush_proposals(self):
+        """Group commit: one log write and one AppendEntries per follower for all pending proposals"""
+        proposals, self._proposals = self._proposals, []
+        if self.role != RaftRole.LEADER:
+            for _, future in proposals:
+                if not future.done():
+                    future.set_result(None)
+            return
+
+        first = self._last_log_index() + 1
+        entries = [LogEntry(term=self.current_term, index=first + i, data=data)
+                   for i, (data, _) in enumerate(proposals)]
+        self._append_entries(entries)
+        for entry, (_, future) in zip(entries, proposals):
+            self._commit_waiters[entry.index] = future
+        self._advance_commit_index()  # a single node cluster commits right away
+        # Followers write their copies while ours is synced
+        self._broadcast_append_entries()
+        if self.log.durable_index < self._last_log_index():
+            asyncio.create_task(self._sync_log())
+
+    async def _sync_log(self):
+        """Sync the leader's own log off the event loop, then count it towards the commit index"""
+        try:
+            await self.log.sync()
+        except OSError as e:
+            self.logger.error(f"Log sync failed: {e}")
+            return
+        if self.role == RaftRole.LEADER:
+            self._advance_commit_index()
+
+    async def transfer_leadership(self, target: Optional[int] = None) -> bool:
+        """Hand leadership to a follower without waiting for an election timeout
+
+        The target (by default the most up-to-date follower) is first
+        caught up, then told to start an election immediately.
+        """
+        if self.role != RaftRole.LEADER or not self.peers:
+            return False
+        if target is None:
+            target = max(self.peers, key=lambda peer: self.match_index.get(peer, 0))
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.params.election_timeout / 1000
+        term = self.current_term
+        self._transferring = True
+        try:
+            while self.match_index.get(target, 0) < self._last_log_index():
+                if self.role != RaftRole.LEADER or loop.time() > deadline:
+                    return False
+                self._pump(target, heartbeat=True)
+                await asyncio.sleep(self.params.heartbeat_interval / 1000 / 10)
+            # The target may win before the reply arrives, so the lease ends here already
+            self._handed_over = True
+            if await self._call(target, "TimeoutNow", {"term": term}) is None:
+                return False
+            while self.role == RaftRole.LEADER and self.current_term == term and loop.time() < deadline:
+                await asyncio.sleep(self.params.heartbeat_interval / 1000 / 10)
+            return self.role != RaftRole.LEADER
+        finally:
+            self._transferring = False
+
+    # --- Reads -------------------------------------------------------------------
+
+    def _lease_valid(self) -> bool:
+        """True while a majority answered heartbeats recently enough that no other leader can exist
+
+        A transfer target is elected without waiting for our lease to run
+        out, so there is no lease during a leadership transfer or after it.
+        """
+        if self.role != RaftRole.LEADER or self._transferring or self._handed_over:
+            return False
+        needed = self.majority - 1  # acknowledgements besides our own
+        if needed == 0:
+            return True
+        acks = sorted((self._ack_times.get(peer, float("-inf")) for peer in self.peers), reverse=True)
+        lease = self.params.election_timeout / 1000 * self.params.lease_ratio
+        return acks[needed - 1] + lease > asyncio.get_running_loop().time()
+
+    def _leader_is_alive(self) -> bool:
+        if self.role == RaftRole.LEADER:
+            return self._lease_valid()
+        elapsed = asyncio.get_running_loop().time() - self._leader_contact
+        return self.leader_id is not None and elapsed < self.params.election_timeout / 1000
+
+    async def _confirm_leadership(self) -> bool:
+        """Heartbeat round: True once a majority still accepts us as leader"""
+        term = self.current_term
+        request = {"term": term, "leader_id": self.node_id, "prev_log_index": 0,
+                   "prev_log_term": 0, "entries": [], "leader_commit": 0}
+        acks = 1
+        for next_reply in asyncio.as_completed(self._call_peers("AppendEntries", request)):
+            reply = await next_reply
+            if self.role != RaftRole.LEADER or self.current_term != term:
+                return False
+            if reply is None:
+                continue
+            if reply["term"] > self.current_term:
+                self._step_down(reply["term"])
+                return False
+            acks += 1
+            if acks >= self.majority:
+                return True
+        # A single node cluster (no peers) is always confirmed
+        return acks >= self.majority
+
+    async def read_index(self) -> Optional[int]:
+        """Commit index a linearizable read may be served at; None if we are not the leader
+
+        The leader's commit index is only trusted once an entry of its own
+        term has committed, and leadership is confirmed by the lease or by a
+        heartbeat round.
+        """
         if self.role != RaftRole.LEADER:
+            return None
+        if self._term_at(self.commit_index) != self.current_term:
+            if self._noop is None or not await asyncio.shield(self._noop):
+                return None
+        index = self.commit_index
+        if self.params.lease_reads and self._lease_valid():
+            return index
+        return index if await self._confirm_leadership() else None
+
+    async def read_barrier(self) -> bool:
+        """Wait until this node has applied everything committed before the call (ReadIndex)"""
+        if self.role == RaftRole.LEADER:
+            index = await self.read_index()
+        elif self.leader_id is None or self.transport is None:
             return False
+        else:
+            try:
+                reply = await self.transport.call(self.leader_id, "ReadIndex", {},
+                                                  self.params.election_timeout / 1000)
+            except RpcError as e:
+                self.logger.debug(f"ReadIndex from node {self.leader_id} failed: {e}")
+                return False
+            index = reply["read_index"]
+        if index is None:
+            return False
+        return await self.wait_applied(index)
+
+    def heard_from_leader_within(self, seconds: float) -> bool:
+        """For bounded-staleness reads: the leader, or in touch with one recently"""
+        if self.role == RaftRole.LEADER:
+            return True
+        return asyncio.get_running_loop().time() - self._leader_contact <= seconds
+
+    async def wait_applied(self, index: int, timeout: Optional[float] = None) -> bool:
+        """Wait until the state machine has applied index; timeout in seconds, one election timeout by default"""
+        if self.last_applied >= index:
+            return True
+        if timeout is None:
+            timeout = self.params.election_timeout / 1000
+        future = asyncio.get_running_loop().create_future()
+        self._apply_waiters.append((index, future))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return False
+
+    def _wake_apply_waiters(self):
+        waiting = []
+        for index, future in self._apply_waiters:
+            if future.done():
+                continue
+            if index <= self.last_applied:
+                future.set_result(True)
+            else:
+                waiting.append((index, future))
+        self._apply_waiters = waiting
+
+    # --- RPC handlers ----------------------------------------------------------
+
+    async def handle_rpc(self, rpc: str, payload: dict) -> dict:
+        if rpc == "RequestVote":
+            reply = self.handle_request_vote(payload)
+        elif rpc == "AppendEntries":
+            reply = self.handle_append_entries(payload)
+        elif rpc == "InstallSnapshot":
+            reply = await self.handle_install_snapshot(payload)
+        elif rpc == "ReadIndex":
+            reply = {"read_index": await self.read_index()}
+        elif rpc == "PreVote":
+            reply = self.handle_pre_vote(payload)
+        elif rpc == "TimeoutNow":
+            reply = self.handle_timeout_now(payload)
+        else:
+            raise ValueError(f"Unknown RPC {rpc}")
+        # Term, vote and appended entries reach the disk before the reply can be acted upon
+        await self.log.sync()
+        return reply
+
+    def _log_up_to_date(self, request: dict) -> bool:
+        return (request["last_log_term"], request["last_log_index"]) >= \
+               (self._last_log_term(), self._last_log_index())
 
-        # In a real implementation, send AppendEntries RPC to all peers
-        # and wait for majority to acknowledge
+    def handle_pre_vote(self, request: dict) -> dict:
+        """Would we vote for this candidate? Changes no state"""
+        granted = (
+            request["term"] > self.current_term
+            and not self._leader_is_alive()
+            and self._log_up_to_date(request)
+        )
+        return {"term": self.current_term, "vote_granted": granted}
+
+    def handle_timeout_now(self, request: dict) -> dict:
+        """The leader is handing over to us: start an election right away"""
+        if request["term"] == self.current_term and self.role == RaftRole.FOLLOWER:
+            asyncio.create_task(self._run_election(transfer=True))
+        return {"term": self.current_term}
 
-        # For this simplified version, we'll just append locally
-        new_entry = LogEntry(
-            term=self.current_term,
-            index=len(self.log) + 1,
-            data=entry
+    def handle_request_vote(self, request: dict) -> dict:
+        if request["term"] > self.current_term and not request.get("transfer") and self._leader_is_alive():
+            # Ignore candidates while a leader is active; leader leases rely on this
+            return {"term": self.current_term, "vote_granted": False}
+        if request["term"] > self.current_term:
+            self._step_down(request["term"])
+
+        granted = (
+            request["term"] == self.current_term
+            and self.voted_for in (None, request["candidate_id"])
+            and self._log_up_to_date(request)
         )
-        self.log.append(new_entry)
-        return True
\ No newline at end of file
+        if granted:
+            self.voted_for = request["candidate_id"]
+            self._persist_state()
+            self._reset_election_timer()
+        return {"term": self.current_term, "vote_granted": granted}
+
+    def handle_append_entries(self, request: dict) -> dict:
+        if request["term"] < self.current_term:
+            return {"term": self.current_term, "success": False, "last_log_index": self._last_log_index()}
+
+        # A valid leader for this term: follow it and restart the election timer
+        self._step_down(request["term"], request["leader_id"])
+        self._leader_contact = asyncio.get_running_loop().time()
+
+        prev_index = request["prev_log_index"]
+        prev_term = request["prev_log_term"]
+        entries = request["entries"]
+        if prev_index < self.log.snapshot_index:
+            # Entries covered by our snapshot are committed and match the leader's
+            entries = entries[self.log.snapshot_index - prev_index:]
+            prev_index, prev_term = self.log.snapshot_index, self.log.snapshot_term
+        if self._term_at(prev_index) != prev_term:
+            return {"term": self.current_term, "success": False,
+                    "last_log_index": min(self._last_log_index(), prev_index - 1)}
+
+        new_entries = []
+        for raw in entries:
+            entry = LogEntry(**raw)
+            if new_entries:
+                new_entries.append(entry)
+                continue
+            existing_term = self._term_at(entry.index)
+            if existing_term == entry.term:
+                continue
+            if existing_term != -1:
+                self._truncate_from(entry.index)
+            new_entries.append(entry)
+        # Written as one batch; handle_rpc syncs it before replying
+        self._append_entries(new_entries)
+
+        last_new = request["prev_log_index"] + len(request["entries"])
+        if request["leader_commit"] > self.commit_index:
+            self._set_commit_index(min(request["leader_commit"], last_new))
+        return {"term": self.current_term, "success": True, "last_log_index": self._last_log_index()}
+
+    async def handle_install_snapshot(self, request: dict) -> dict:
+        if request["term"] < self.current_term:
+            return {"term": self.current_term, "success": False}
+        self._step_down(request["term"], request["leader_id"])
+        self._leader_contact = asyncio.get_running_loop().time()
+
+        index, term = request["last_included_index"], request["last_included_term"]
+        if request["offset"] == 0:
+            self._discard_incoming_snapshot()
+            self._incoming_snapshot = (index, term, self.log.create_snapshot_file())
+        incoming = self._incoming_snapshot
+        if incoming is None or incoming[:2] != (index, term) or incoming[2].tell() != request["offset"]:
+            # Out of sequence; the leader starts the transfer over
+            self._discard_incoming_snapshot()
+            return {"term": self.current_term, "success": False}
+
+        snapshot_file = incoming[2]
+        snapshot_file.write(base64.b64decode(request["data"]))
+        if not request["done"]:
+            return {"term": self.current_term, "success": True}
+
+        self._incoming_snapshot = None
+        if index <= self.last_applied:
+            self.log.discard_snapshot_file(snapshot_file)
+        else:
+            self.log.save_snapshot(snapshot_file, index, term)
+            await self._restore_snapshot()
+            self.logger.info(f"Node {self.node_id} installed a snapshot up to {index}")
+        return {"term": self.current_term, "success": True}
+
+    def _discard_incoming_snapshot(self):
+        if self._incoming_snapshot is not None:
+            self.log.discard_snapshot_file(self._incoming_snapshot[2])
+            self._incoming_snapshot = None
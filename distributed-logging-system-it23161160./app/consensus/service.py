@@ -1,52 +1,118 @@
 from fastapi import HTTPException
 from app.consensus.raftNode import RaftNode, RaftParams, RaftRole, LogEntry
 from app.consensus.logStorage import LogStorage  # Correct import
+from app.consensus.transport import RaftTransport, parse_peers, DEFAULT_RAFT_PORT
+from app.consensus.stateMachine import DatabaseStateMachine
+from app.consensus.leaderTracker import LeaderTracker
+from app.consensus.forwarder import WriteForwarder
+from app.metrics import Gauge
+import asyncio
+from app.storage import storage
+from typing import Optional
 import os
 
+STALE_READ_MAX_LAG = float(os.getenv("STALE_READ_MAX_LAG", "5.0"))  # seconds without leader contact
+
+RAFT_TERM = Gauge("raft_term", "Current Raft term")
+RAFT_IS_LEADER = Gauge("raft_is_leader", "1 while this node is the leader")
+RAFT_LAST_INDEX = Gauge("raft_last_index", "Index of the newest entry in the local log")
+RAFT_COMMIT_INDEX = Gauge("raft_commit_index", "Highest index known to be committed")
+RAFT_LAST_APPLIED = Gauge("raft_last_applied", "Highest index applied to the database")
+RAFT_FOLLOWER_LAG = Gauge("raft_follower_lag", "Entries a follower is behind the leader's log (leader only)", ["peer"])
+
 
 class ConsensusService:
     def __init__(self):
         # Initialize with node ID and peer IDs from environment
         self.node_id = int(os.getenv("NODE_ID", "1"))
-        peer_ids = [int(id) for id in os.getenv("PEERS", "2,3").split(",")]
+        peers = parse_peers(os.getenv("PEERS", "2,3"))
+        peer_ids = list(peers)
+
+        # Peer-to-peer RPC transport
+        self.transport = RaftTransport(
+            os.getenv("RAFT_HOST", "0.0.0.0"),
+            int(os.getenv("RAFT_PORT", str(DEFAULT_RAFT_PORT + self.node_id))),
+            peers
+        )
 
         # Initialize Raft node
         raft_params = RaftParams(
-            election_timeout=1000,
-            heartbeat_interval=500,
-            rpc_timeout=300
+            election_timeout=int(os.getenv("RAFT_ELECTION_TIMEOUT", "300")),  # randomized up to 2x
+            heartbeat_interval=int(os.getenv("RAFT_HEARTBEAT_INTERVAL", "50")),
+            rpc_timeout=300,
+            snapshot_threshold=int(os.getenv("RAFT_SNAPSHOT_THRESHOLD", "10000")),
+            write_timeout=int(os.getenv("RAFT_WRITE_TIMEOUT", "1500"))  # below FORWARD_TIMEOUT
         )
-        self.raft_node = RaftNode(self.node_id, peer_ids, raft_params)
+        # Segmented on-disk log; term and vote are kept next to it
+        data_dir = os.path.join(os.getenv("RAFT_DATA_DIR", "data"), f"node{self.node_id}")
+        self.log_storage = LogStorage(data_dir)
+
+        # Committed logs are written to the database with their Raft index as id
+        self.state_machine = DatabaseStateMachine(storage)
+
+        self.raft_node = RaftNode(self.node_id, peer_ids, raft_params, self.transport,
+                                  self.log_storage, self.state_machine)
+
+        # Where followers send clients; node URLs come from CLUSTER_NODES
+        self.leader_tracker = LeaderTracker(self.raft_node)
 
-        # Initialize log storage
-        self.log_storage = LogStorage()
+        # Followers hand writes to the leader over the Raft transport
+        self.forwarder = WriteForwarder(self.raft_node, self.transport)
 
     async def start(self):
         """Start the consensus service"""
+        await self.transport.start(self.handle_rpc)
         await self.raft_node.start()
 
+    async def stop(self):
+        """Stop the consensus service"""
+        # Hand over leadership first so a rolling restart has no election gap
+        await self.raft_node.transfer_leadership()
+        await self.raft_node.stop()
+        await self.transport.stop()
+        self.log_storage.close()
+
+    def collect_metrics(self):
+        """Update the Raft gauges; called when /metrics is scraped"""
+        node = self.raft_node
+        RAFT_TERM.set(node.current_term)
+        RAFT_IS_LEADER.set(int(self.is_leader()))
+        RAFT_LAST_INDEX.set(self.log_storage.last_index)
+        RAFT_COMMIT_INDEX.set(node.commit_index)
+        RAFT_LAST_APPLIED.set(node.last_applied)
+        RAFT_FOLLOWER_LAG.clear()
+        if self.is_leader():
+            for peer in node.peers:
+                RAFT_FOLLOWER_LAG.labels(peer).set(self.log_storage.last_index - node.match_index.get(peer, 0))
+
     def is_leader(self) -> bool:
         """Check if this node is the leader"""
         return self.raft_node.role == RaftRole.LEADER
 
-    async def append_log(self, data: dict) -> bool:
-        """Append a log entry with consensus"""
+    async def handle_rpc(self, rpc: str, payload: dict) -> dict:
+        """Serve writes forwarded by followers; everything else is Raft"""
+        if rpc == "ForwardWrites":
+            indices = await asyncio.gather(*(self.append_log(data) for data in payload["entries"]))
+            return {"indices": list(indices)}
+        return await self.raft_node.handle_rpc(rpc, payload)
+
+    async def append_log(self, data: dict) -> Optional[int]:
+        """Append a log entry with consensus; its index once applied"""
         if not self.is_leader():
-            return False
+            return None
 
-        # Create log entry
-        entry = LogEntry(
-            term=self.raft_node.current_term,
-            index=self.log_storage.last_index + 1,
-            data=data
-        )
+        # The Raft node appends to the shared log storage itself
+        return await self.raft_node.replicate_log(data)
+
+    async def forward_log(self, data: dict) -> int:
+        """Append a log entry through the leader; raises ForwardError if it fails"""
+        return await self.forwarder.forward(data)
 
-        # Replicate to followers (simplified)
-        success = await self.raft_node.replicate_log(entry.data)
-        if success:
-            self.log_storage.append(entry)
+    async def read_barrier(self, stale_ok: bool = False) -> bool:
+        """Make local reads safe: linearizable by default, bounded staleness with stale_ok"""
+        if stale_ok and self.raft_node.heard_from_leader_within(STALE_READ_MAX_LAG):
             return True
-        return False
+        return await self.raft_node.read_barrier()
 
     def get_log(self, index: int):
         """Get a log entry by index"""
@@ -54,4 +120,10 @@ class ConsensusService:
 
     def get_all_logs(self):
         """Get all log entries"""
-        return self.log_storage.get_all()
\ No newline at end of file
+        return self.log_storage.get_all()
+
+    def get_logs(self, start: Optional[int], end: Optional[int], limit: int):
+        """Get up to limit log entries between start and end (inclusive)"""
+        start = self.log_storage.first_index if start is None else start
+        end = self.log_storage.last_index if end is None else end
+        return self.log_storage.entries_between(start, end, limit)
\ No newline at end of file
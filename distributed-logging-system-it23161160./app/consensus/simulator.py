@@ -0,0 +1,290 @@
+"""In-process Raft cluster on a simulated network and a virtual clock
+
+Runs N RaftNodes in one event loop whose clock only moves when every
+task is waiting, so idle time costs nothing (wall time scales with the
+number of commits, not with timeouts) and the same seed always gives the
+same run. No sockets or database are used.
+
+    python -m app.consensus.simulator --nodes 5 --seconds 10 --clients 50 --drop 0.01
+"""
+import argparse
+import asyncio
+import json
+import random
+import selectors
+from typing import Callable, Dict, List, Optional, Set
+from app.consensus.raftNode import RaftNode, RaftParams, RaftRole
+from app.consensus.logStorage import LogStorage
+from app.consensus.transport import RpcError
+
+
+class _VirtualSelector(selectors.BaseSelector):
+    """Selector without real I/O: waiting for `timeout` just moves the virtual clock"""
+
+    def __init__(self):
+        self._keys: Dict[object, selectors.SelectorKey] = {}
+        self.loop: Optional["VirtualClockLoop"] = None
+
+    def register(self, fileobj, events, data=None):
+        key = selectors.SelectorKey(fileobj, self._fileobj_lookup(fileobj), events, data)
+        self._keys[fileobj] = key
+        return key
+
+    def unregister(self, fileobj):
+        return self._keys.pop(fileobj)
+
+    def select(self, timeout=None):
+        if timeout:
+            self.loop.advance(timeout)
+        return []
+
+    def get_map(self):
+        return self._keys
+
+    def _fileobj_lookup(self, fileobj):
+        return fileobj if isinstance(fileobj, int) else fileobj.fileno()
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """Event loop whose time() is virtual and jumps straight to the next timer"""
+
+    def __init__(self):
+        self._now = 0.0
+        selector = _VirtualSelector()
+        super().__init__(selector)
+        selector.loop = self
+
+    def time(self) -> float:
+        return self._now
+
+    def advance(self, seconds: float):
+        self._now += seconds
+
+
+class SimulatedNetwork:
+    """Delivers RPCs between nodes with latency, random drops and partitions"""
+
+    def __init__(self, rng: random.Random, latency: float = 0.001, jitter: float = 0.0005, drop_rate: float = 0.0):
+        self.rng = rng
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.handlers: Dict[int, Callable] = {}
+        self.groups: Optional[List[Set[int]]] = None
+        self.messages = 0
+        self.dropped = 0
+
+    def partition(self, *groups: Set[int]):
+        """Only nodes in the same group can reach each other until heal()"""
+        self.groups = [set(group) for group in groups]
+
+    def heal(self):
+        self.groups = None
+
+    def connected(self, a: int, b: int) -> bool:
+        if self.groups is None:
+            return True
+        return any(a in group and b in group for group in self.groups)
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+
+    async def deliver(self, source: int, target: int, rpc: str, payload: dict) -> dict:
+        self.messages += 1
+        # Requests and replies are decided up front so the run only depends on the seed
+        lost = self.rng.random() < self.drop_rate or self.rng.random() < self.drop_rate
+        request_delay, reply_delay = self._delay(), self._delay()
+        await asyncio.sleep(request_delay)
+        handler = self.handlers.get(target)
+        if lost or handler is None or not self.connected(source, target):
+            self.dropped += 1
+            await asyncio.Event().wait()  # never answered; the caller's timeout fires
+        # Round-trip through JSON like the real transport
+        result = await handler(rpc, json.loads(json.dumps(payload)))
+        await asyncio.sleep(reply_delay)
+        if not self.connected(source, target):
+            self.dropped += 1
+            await asyncio.Event().wait()
+        return json.loads(json.dumps(result))
+
+
+class SimulatedTransport:
+    """Drop-in replacement for RaftTransport on a SimulatedNetwork"""
+
+    def __init__(self, node_id: int, network: SimulatedNetwork):
+        self.node_id = node_id
+        self.network = network
+
+    async def start(self, handler):
+        self.network.handlers[self.node_id] = handler
+
+    async def stop(self):
+        self.network.handlers.pop(self.node_id, None)
+
+    async def call(self, peer: int, rpc: str, payload: dict, timeout: float) -> dict:
+        try:
+            return await asyncio.wait_for(self.network.deliver(self.node_id, peer, rpc, payload), timeout)
+        except asyncio.TimeoutError:
+            raise RpcError(f"{rpc} to node {peer} timed out")
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Simulator:
+    """A cluster of RaftNodes with a client workload, all on virtual time"""
+
+    def __init__(self, nodes: int = 3, seed: int = 0, params: Optional[RaftParams] = None, **network):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.params = params or RaftParams(election_timeout=150, heartbeat_interval=30, rpc_timeout=100,
+                                           snapshot_threshold=10 ** 9)
+        self.network = SimulatedNetwork(random.Random(self.rng.random()), **network)
+        self.node_ids = list(range(1, nodes + 1))
+        self.storages = {node_id: LogStorage() for node_id in self.node_ids}
+        self.nodes: Dict[int, RaftNode] = {}
+        self.elections = 0
+        self.latencies: List[float] = []
+        self.failed = 0
+
+    # --- Cluster control -----------------------------------------------------
+
+    async def start_node(self, node_id: int):
+        """Start (or restart after a crash) a node; its log survives in memory"""
+        peers = [peer for peer in self.node_ids if peer != node_id]
+        transport = SimulatedTransport(node_id, self.network)
+        node = RaftNode(node_id, peers, self.params, transport, self.storages[node_id],
+                        rng=random.Random(self.rng.random()))
+        self.nodes[node_id] = node
+        await transport.start(node.handle_rpc)
+        await node.start()
+
+    async def crash(self, node_id: int):
+        node = self.nodes.pop(node_id)
+        self.elections += node.elections_won
+        await node.transport.stop()
+        await node.stop()
+
+    def leader(self) -> Optional[RaftNode]:
+        leaders = [node for node in self.nodes.values() if node.role == RaftRole.LEADER]
+        return max(leaders, key=lambda node: node.current_term) if leaders else None
+
+    # --- Workload ------------------------------------------------------------
+
+    async def _client(self, client_id: int, until: float):
+        loop = asyncio.get_running_loop()
+        sequence = 0
+        while loop.time() < until:
+            leader = self.leader()
+            if leader is None:
+                await asyncio.sleep(0.01)
+                continue
+            started = loop.time()
+            index = await leader.replicate_log({"client": client_id, "seq": sequence})
+            if index:
+                self.latencies.append(loop.time() - started)
+                sequence += 1
+            else:
+                self.failed += 1
+                await asyncio.sleep(0.01)
+
+    async def run(self, seconds: float, clients: int = 10, events: Optional[List[tuple]] = None) -> dict:
+        """Run the workload for `seconds` of virtual time; events are (at, coroutine function, *args)"""
+        loop = asyncio.get_running_loop()
+        for node_id in self.node_ids:
+            await self.start_node(node_id)
+        start = loop.time()
+        until = start + seconds
+
+        async def scheduled(at, action, *args):
+            await asyncio.sleep(at)
+            result = action(*args)
+            if asyncio.iscoroutine(result):
+                await result
+
+        tasks = [asyncio.create_task(self._client(client_id, until)) for client_id in range(clients)]
+        tasks += [asyncio.create_task(scheduled(*event)) for event in events or []]
+        await asyncio.gather(*tasks)
+        elapsed = loop.time() - start
+
+        for node_id in list(self.nodes):
+            await self.crash(node_id)
+        return self.report(elapsed)
+
+    def report(self, elapsed: float) -> dict:
+        def ms(value):
+            return round(value * 1000, 3) if value is not None else None
+
+        return {
+            "seed": self.seed,
+            "nodes": len(self.node_ids),
+            "virtual_seconds": round(elapsed, 3),
+            "commits": len(self.latencies),
+            "failed_proposals": self.failed,
+            "commits_per_second": round(len(self.latencies) / elapsed, 1) if elapsed else 0,
+            "latency_ms": {
+                "p50": ms(percentile(self.latencies, 50)),
+                "p90": ms(percentile(self.latencies, 90)),
+                "p99": ms(percentile(self.latencies, 99)),
+                "max": ms(max(self.latencies) if self.latencies else None),
+            },
+            "elections": self.elections,
+            "messages": self.network.messages,
+            "dropped_messages": self.network.dropped,
+        }
+
+
+def run_on_virtual_clock(coro):
+    """Run a coroutine on a fresh VirtualClockLoop, cancelling whatever it leaves behind"""
+    loop = VirtualClockLoop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        pending = asyncio.all_tasks(loop)
+        for task in pending:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        loop.close()
+
+
+def simulate(seconds: float = 5.0, clients: int = 10, events: Optional[List[tuple]] = None, **kwargs) -> dict:
+    """Run one simulation and return its report"""
+    return run_on_virtual_clock(Simulator(**kwargs).run(seconds, clients, events))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Raft on a simulated cluster")
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--seconds", type=float, default=10.0, help="virtual seconds to run")
+    parser.add_argument("--clients", type=int, default=10, help="concurrent proposers")
+    parser.add_argument("--latency", type=float, default=1.0, help="one-way latency in ms")
+    parser.add_argument("--jitter", type=float, default=0.5, help="latency jitter in ms")
+    parser.add_argument("--drop", type=float, default=0.0, help="message drop probability")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--partition-at", type=float, help="isolate the leader at this virtual second")
+    parser.add_argument("--heal-at", type=float, help="heal the partition at this virtual second")
+    args = parser.parse_args()
+
+    simulator = Simulator(nodes=args.nodes, seed=args.seed, latency=args.latency / 1000,
+                          jitter=args.jitter / 1000, drop_rate=args.drop)
+    events = []
+    if args.partition_at is not None:
+        def isolate_leader():
+            leader = simulator.leader()
+            if leader is not None:
+                others = set(simulator.node_ids) - {leader.node_id}
+                simulator.network.partition({leader.node_id}, others)
+        events.append((args.partition_at, isolate_leader))
+    if args.heal_at is not None:
+        events.append((args.heal_at, simulator.network.heal))
+
+    report = run_on_virtual_clock(simulator.run(args.seconds, args.clients, events))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
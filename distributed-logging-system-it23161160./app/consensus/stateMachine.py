@@ -0,0 +1,85 @@
+import json
+from typing import BinaryIO, List
+from app.consensus.raftNode import LogEntry
+from app.metrics import Histogram
+
+SNAPSHOT_BATCH_ROWS = 1000  # rows read or written per database round trip
+
+DB_COMMIT_SECONDS = Histogram("db_commit_seconds", "Time spent committing a write transaction", ["source"])
+
+
+class StateMachine:
+    """What committed Raft entries are applied to
+
+    Entries are applied by a single task, in order. snapshot() must write
+    the state as it was right after entry `index` was applied, even if
+    later entries are applied while it runs.
+    """
+
+    async def apply_many(self, entries: List[LogEntry]):
+        raise NotImplementedError
+
+    async def snapshot(self, snapshot_file: BinaryIO, index: int):
+        raise NotImplementedError
+
+    async def restore(self, snapshot_file: BinaryIO):
+        raise NotImplementedError
+
+
+class MemoryStateMachine(StateMachine):
+    """Keeps the data of every applied entry in a list (for tests)"""
+
+    def __init__(self):
+        self.entries: List[dict] = []
+
+    async def apply_many(self, entries: List[LogEntry]):
+        self.entries.extend(entry.data for entry in entries)
+
+    async def snapshot(self, snapshot_file: BinaryIO, index: int):
+        for data in self.entries[:index]:
+            snapshot_file.write(json.dumps(data).encode() + b"\n")
+
+    async def restore(self, snapshot_file: BinaryIO):
+        self.entries = [json.loads(line) for line in snapshot_file]
+
+
+class DatabaseStateMachine(StateMachine):
+    """Stores each applied log as a row whose id is its Raft index
+
+    Applying is idempotent (the storage backend replaces rows by id), so
+    entries may be applied again after a restart. A snapshot is every row up
+    to the snapshot index, as NDJSON.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    async def apply_many(self, entries: List[LogEntry]):
+        # no-op entries carry no log; logs appended before message and attributes existed leave them out
+        rows = [{"id": entry.index, "message": None, "attributes": None, **entry.data} for entry in entries if entry.data]
+        if not rows:
+            return
+        with DB_COMMIT_SECONDS.labels("raft_apply").time():
+            await self.storage.insert_batch(rows)
+
+    async def snapshot(self, snapshot_file: BinaryIO, index: int):
+        after = None
+        while True:
+            records = await self.storage.scan(after, SNAPSHOT_BATCH_ROWS)
+            for record in records:
+                if record.id > index:
+                    return
+                snapshot_file.write(json.dumps(record._asdict()).encode() + b"\n")
+            if len(records) < SNAPSHOT_BATCH_ROWS:
+                return
+            after = records[-1].id
+
+    async def restore(self, snapshot_file: BinaryIO):
+        rows = []
+        for line in snapshot_file:
+            rows.append(json.loads(line))
+            if len(rows) == SNAPSHOT_BATCH_ROWS:
+                await self.storage.insert_batch(rows)
+                rows = []
+        if rows:
+            await self.storage.insert_batch(rows)
@@ -0,0 +1,204 @@
+import asyncio
+import itertools
+import json
+import logging
+import re
+import struct
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+# Every message is a 4-byte big-endian length followed by that many bytes of JSON
+FRAME_HEADER = struct.Struct(">I")
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+DEFAULT_RAFT_PORT = 9000  # node N listens on DEFAULT_RAFT_PORT + N unless configured
+
+Handler = Callable[[str, dict], Awaitable[dict]]
+
+
+class RpcError(Exception):
+    """Raised when an RPC cannot be delivered or times out"""
+
+
+def parse_peers(spec: str) -> Dict[int, Tuple[str, int]]:
+    """Parse PEERS into {node_id: (host, port)}
+
+    Accepted entries: "2" (localhost), "node2" (host node2) or "2=host:port".
+    Without an explicit port node N is reached on DEFAULT_RAFT_PORT + N.
+    """
+    peers = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        if "=" in item:
+            node_id, address = item.split("=", 1)
+            host, _, port = address.rpartition(":")
+            peers[int(node_id)] = (host, int(port))
+            continue
+        match = re.search(r"(\d+)$", item)
+        if not match:
+            raise ValueError(f"Cannot derive a node id from peer '{item}'")
+        node_id = int(match.group(1))
+        host = "localhost" if item.isdigit() else item
+        peers[node_id] = (host, DEFAULT_RAFT_PORT + node_id)
+    return peers
+
+
+async def read_frame(reader: asyncio.StreamReader) -> dict:
+    header = await reader.readexactly(FRAME_HEADER.size)
+    (length,) = FRAME_HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise RpcError(f"Frame of {length} bytes exceeds the limit")
+    return json.loads(await reader.readexactly(length))
+
+
+def encode_frame(message: dict) -> bytes:
+    body = json.dumps(message, separators=(",", ":")).encode()
+    return FRAME_HEADER.pack(len(body)) + body
+
+
+class PeerConnection:
+    """One persistent connection to a peer, shared by all concurrent RPCs
+
+    Requests carry an id so responses can come back in any order. After a
+    reconnect, the read loop of the old connection only fails the requests
+    sent over it.
+    """
+
+    def __init__(self, node_id: int, host: str, port: int):
+        self.node_id = node_id
+        self.host = host
+        self.port = port
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, Tuple[asyncio.StreamWriter, asyncio.Future]] = {}  # id -> (connection, response)
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._read_task: Optional[asyncio.Task] = None
+        self._connect_lock = asyncio.Lock()
+        self.logger = logging.getLogger(f"raft_transport_peer_{node_id}")
+
+    async def _ensure_connected(self):
+        if self._writer is not None and not self._writer.is_closing():
+            return
+        async with self._connect_lock:
+            if self._writer is not None and not self._writer.is_closing():
+                return
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+            self._read_task = asyncio.create_task(self._read_loop(self._reader, self._writer))
+
+    async def _read_loop(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                message = await read_frame(reader)
+                _, future = self._pending.pop(message.get("id"), (None, None))
+                if future is not None and not future.done():
+                    future.set_result(message)
+        except (asyncio.IncompleteReadError, ConnectionError, RpcError, ValueError) as e:
+            self.logger.debug(f"Connection to node {self.node_id} lost: {e!r}")
+        finally:
+            # A newer connection may have replaced this one already; it is left alone
+            self._fail_pending(RpcError(f"Connection to node {self.node_id} closed"), writer)
+            if self._writer is writer:
+                self._close_writer()
+            else:
+                writer.close()
+
+    def _fail_pending(self, error: Exception, writer: asyncio.StreamWriter):
+        """Fail the requests sent over one connection"""
+        for request_id, (sent_on, future) in list(self._pending.items()):
+            if sent_on is writer:
+                del self._pending[request_id]
+                if not future.done():
+                    future.set_exception(error)
+
+    def _close_writer(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def call(self, rpc: str, payload: dict, timeout: float) -> dict:
+        """Send one request and wait at most timeout seconds for its response"""
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(self._ensure_connected(), timeout)
+            # Registered only once connected, so a failed connect leaves no orphaned future
+            self._pending[request_id] = (self._writer, future)
+            self._writer.write(encode_frame({"id": request_id, "type": rpc, "payload": payload}))
+            message = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise RpcError(f"{rpc} to node {self.node_id} timed out")
+        except (OSError, AttributeError) as e:
+            self._close_writer()
+            raise RpcError(f"{rpc} to node {self.node_id} failed: {e!r}")
+        finally:
+            self._pending.pop(request_id, None)
+        if "error" in message:
+            raise RpcError(message["error"])
+        return message["result"]
+
+    async def close(self):
+        self._close_writer()
+        if self._read_task is not None:
+            self._read_task.cancel()
+            self._read_task = None
+
+
+class RaftTransport:
+    """Serves incoming RPCs and keeps one connection open to every peer"""
+
+    def __init__(self, host: str, port: int, peers: Dict[int, Tuple[str, int]]):
+        self.host = host
+        self.port = port
+        self.connections = {node_id: PeerConnection(node_id, h, p) for node_id, (h, p) in peers.items()}
+        self.handler: Optional[Handler] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._clients = set()
+        self.logger = logging.getLogger("raft_transport")
+
+    async def start(self, handler: Handler):
+        self.handler = handler
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.logger.info(f"Raft transport listening on {self.host}:{self.port}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._clients):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+        for connection in self.connections.values():
+            await connection.close()
+
+    async def call(self, peer: int, rpc: str, payload: dict, timeout: float) -> dict:
+        connection = self.connections.get(peer)
+        if connection is None:
+            raise RpcError(f"Unknown peer {peer}")
+        return await connection.call(rpc, payload, timeout)
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        write_lock = asyncio.Lock()
+        tasks = set()
+        self._clients.add(writer)
+        try:
+            while True:
+                message = await read_frame(reader)
+                task = asyncio.create_task(self._dispatch(message, writer, write_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError, RpcError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            # Connection handlers are top-level tasks; end quietly on shutdown
+            pass
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    async def _dispatch(self, message: dict, writer: asyncio.StreamWriter, write_lock: asyncio.Lock):
+        try:
+            response = {"id": message["id"], "result": await self.handler(message["type"], message["payload"])}
+        except Exception as e:
+            self.logger.exception(f"RPC {message.get('type')} failed")
+            response = {"id": message.get("id"), "error": repr(e)}
+        async with write_lock:
+            if not writer.is_closing():
+                writer.write(encode_frame(response))
+                await writer.drain()
@@ -1,23 +1,54 @@
-from fastapi import FastAPI, Request  # Added Request import here
+import logging
+import os
+from fastapi import FastAPI, Request, Response  # Added Request import here
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pathlib import Path
 from app.routers import logs, consensus
 from app.database import create_tables
+from app.storage import storage
+from app.metrics import REGISTRY, CONTENT_TYPE
+
+# Leveled logging for the Raft and transport loggers; LOG_LEVEL=DEBUG for RPC detail
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(),
+                    format="%(asctime)s %(levelname)s %(name)s %(message)s")
 
 app = FastAPI()
 
-# Create the tables at the startup
-create_tables()
+# Create the tables at startup, before the consensus service starts applying logs
+@app.on_event("startup")
+async def on_startup():
+    await create_tables()
 
 # Include routers
 app.include_router(logs.router)
 app.include_router(consensus.router)
 
+# Registered after the routers so the consensus service has stopped applying logs first
+@app.on_event("shutdown")
+async def on_shutdown():
+    await storage.close()
+
+
+@app.middleware("http")
+async def add_leader_hint(request: Request, call_next):
+    """Tell clients where the leader is so they can go straight to it"""
+    response = await call_next(request)
+    leader_url = consensus.consensus_service.leader_tracker.known_leader()
+    if leader_url is not None:
+        response.headers["X-Raft-Leader"] = leader_url
+    return response
+
 # Setup templates and static files
 BASE_DIR = Path(__file__).parent.parent
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
-templates = Jinja2Templates(directory="app/templates")
+STATIC_DIR = BASE_DIR / "app" / "static"
+STATIC_DIR.mkdir(parents=True, exist_ok=True)
+app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
+templates = Jinja2Templates(directory=BASE_DIR / "app" / "templates")
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
 
 @app.get("/", include_in_schema=False)
 async def read_root(request: Request):  # Now properly typed with imported Request
@@ -0,0 +1,23 @@
+import base64
+import json
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(log) -> str:
+    """Opaque cursor pointing just after the given row"""
+    return base64.urlsafe_b64encode(str(log.id).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> int:
+    """Return the id encoded in a cursor, or raise ValueError"""
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def to_ndjson(log) -> bytes:
+    return (json.dumps({"id": log.id, "name": log.name, "password": log.password,
+                        "message": log.message, "attributes": log.attributes}) + "\n").encode()
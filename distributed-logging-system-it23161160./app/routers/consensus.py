@@ -1,6 +1,9 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from app.consensus.service import ConsensusService
+from app.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.metrics import REGISTRY
 from fastapi import status
+from typing import Optional
 
 router = APIRouter(
     prefix="/consensus",
@@ -9,11 +12,16 @@ router = APIRouter(
 
 # Initialize the consensus service
 consensus_service = ConsensusService()
+REGISTRY.add_collector(consensus_service.collect_metrics)
 
 @router.on_event("startup")
 async def startup_event():
     await consensus_service.start()
 
+@router.on_event("shutdown")
+async def shutdown_event():
+    await consensus_service.stop()
+
 @router.get("/status")
 async def get_status():
     return {
@@ -21,12 +29,35 @@ async def get_status():
         "role": consensus_service.raft_node.role.name,
         "term": consensus_service.raft_node.current_term,
         "log_length": consensus_service.log_storage.last_index,
-        "is_leader": consensus_service.is_leader()
+        "is_leader": consensus_service.is_leader(),
+        "leader_id": consensus_service.raft_node.leader_id,
+        "commit_index": consensus_service.raft_node.commit_index,
+        "last_applied": consensus_service.raft_node.last_applied,
+        "snapshot_index": consensus_service.log_storage.snapshot_index,
+        "last_failover_ms": (
+            round(consensus_service.raft_node.failover_latency * 1000)
+            if consensus_service.raft_node.failover_latency is not None else None
+        )
     }
 
+@router.post("/transfer-leadership")
+async def transfer_leadership(target: Optional[int] = None):
+    if not consensus_service.is_leader():
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Only the leader can transfer leadership"
+        )
+    transferred = await consensus_service.raft_node.transfer_leadership(target)
+    return {"transferred": transferred, "leader_id": consensus_service.raft_node.leader_id}
+
 @router.get("/logs")
-async def get_consensus_logs():
-    return consensus_service.get_all_logs()
+async def get_consensus_logs(
+    start: Optional[int] = Query(None, alias="from", ge=1),
+    end: Optional[int] = Query(None, alias="to", ge=1),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+):
+    # Indices are dense, so a range is read directly without scanning the log
+    return consensus_service.get_logs(start, end, limit)
 
 @router.get("/logs/{index}")
 async def get_consensus_log(index: int):
@@ -1,24 +1,27 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from fastapi.responses import RedirectResponse
-from sqlalchemy.orm import Session
-import httpx
-from app.database import get_db
-from app.models import LogDB
-from pydantic import BaseModel
-from typing import List
-from app.consensus.service import ConsensusService
+import time
+from fastapi import APIRouter, HTTPException, status, Response, Query
+from fastapi.responses import StreamingResponse
+from app.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, encode_cursor, to_ndjson
+from app.storage import LogFilter, storage
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Literal, Optional
+from app.routers.consensus import consensus_service
+from app.consensus.forwarder import ForwardError
+from app.metrics import Histogram
 
 router = APIRouter(
     prefix="/logs",
     tags=["logs"]
 )
 
-consensus_service = ConsensusService()
+INGEST_SECONDS = Histogram("log_ingest_seconds", "Time until a log is committed, forwarded or not", ["path", "forwarded"])
 
 
 class Log(BaseModel):
     name: str
     password: str
+    message: Optional[str] = None
+    attributes: Optional[Dict[str, Any]] = None  # Structured context, e.g. {"request_id": "...", "level": "error"}
 
     class Config:
         orm_mode = True
@@ -32,60 +35,101 @@ class LogRead(Log):
     id: int
 
 
-async def find_leader_node():
-    """Helper function to find the current leader"""
-    nodes = ["http://localhost:8000", "http://localhost:8001", "http://localhost:8002"]
-    for url in nodes:
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{url}/consensus/status", timeout=2.0)
-                if response.json().get("is_leader"):
-                    return url
-        except (httpx.RequestError, httpx.HTTPStatusError):
-            continue
-    raise HTTPException(
-        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-        detail="No leader node available"
-    )
+class LogSearch(BaseModel):
+    name: Optional[str] = None
+    contains: Optional[Dict[str, Any]] = None  # Document the attributes must contain, nested values included
+    equals: Optional[Dict[str, Any]] = None  # Attributes that must have exactly these values
+    text: Optional[str] = None  # Full-text query on the message
+    order: Literal["asc", "desc"] = "asc"
+    limit: int = Field(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+    cursor: Optional[str] = None
+    stale_ok: bool = False
 
 
-@router.get("/", response_model=List[LogRead])
-async def get_logs_api(db: Session = Depends(get_db)):
-    if not consensus_service.is_leader():
-        try:
-            leader_url = await find_leader_node()
-            return RedirectResponse(
-                url=f"{leader_url}/logs/",
-                status_code=status.HTTP_307_TEMPORARY_REDIRECT
-            )
-        except HTTPException as e:
-            raise e
+async def stream_logs(after: Optional[int], where: LogFilter, descending: bool):
+    """Yield every matching log after the cursor as NDJSON"""
+    async for log in storage.stream(after, where, descending):
+        yield to_ndjson(log)
 
-    db_logs = db.query(LogDB).all()
-    consensus_logs = consensus_service.get_all_logs()
-    return db_logs
+
+async def wait_for_reads(stale_ok: bool):
+    """Every node serves reads: after a ReadIndex barrier, or right away within the staleness bound"""
+    if not await consensus_service.read_barrier(stale_ok):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Cannot confirm this node is up to date with the leader"
+        )
+
+
+@router.get("/", response_model=List[LogRead])
+async def get_logs_api(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    stale_ok: bool = False,
+    name: Optional[str] = None,
+    order: Literal["asc", "desc"] = "asc",
+):
+    await wait_for_reads(stale_ok)
+
+    # Keyset pagination on id; the next page starts at X-Next-Cursor with the same filters
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    # A name is looked up through the (name, id) index instead of a full scan
+    where = LogFilter(name)
+    descending = order == "desc"
+    if stream:
+        return StreamingResponse(stream_logs(after, where, descending), media_type="application/x-ndjson")
+
+    logs = await storage.scan(after, limit, where, descending)
+    if len(logs) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(logs[-1])
+    return logs
+
+
+@router.post("/search", response_model=List[LogRead])
+async def search_logs(search: LogSearch, response: Response):
+    """Attribute and full-text search, one page at a time like GET /logs/"""
+    await wait_for_reads(search.stale_ok)
+    try:
+        after = decode_cursor(search.cursor) if search.cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    where = LogFilter(search.name, search.contains, search.equals, search.text)
+    try:
+        logs = await storage.scan(after, search.limit, where, search.order == "desc")
+    except ValueError as e:
+        # A match the database cannot express, e.g. nested attribute values outside Postgres
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if len(logs) == search.limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(logs[-1])
+    return logs
 
 
 @router.post("/", response_model=LogRead)
-async def create_log(log: LogCreate, db: Session = Depends(get_db)):
+async def create_log(log: LogCreate):
+    started = time.perf_counter()
     if not consensus_service.is_leader():
-        leader_url = await find_leader_node()
-        return RedirectResponse(
-            url=f"{leader_url}/logs/",
-            status_code=status.HTTP_307_TEMPORARY_REDIRECT
-        )
-
-    success = await consensus_service.append_log(log.dict())
-    if not success:
+        # Forward to the leader instead of making the client follow a redirect
+        try:
+            index = await consensus_service.forward_log(log.dict())
+        except ForwardError as e:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+        INGEST_SECONDS.labels("/logs/", "true").observe(time.perf_counter() - started)
+        return LogRead(id=index, **log.dict())
+
+    index = await consensus_service.append_log(log.dict())
+    if not index:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to replicate log to majority of nodes"
         )
 
-    db_log = LogDB(name=log.name, password=log.password)
-    db.add(db_log)
-    db.commit()
-    db.refresh(db_log)
-    return db_log
+    INGEST_SECONDS.labels("/logs/", "false").observe(time.perf_counter() - started)
+    # The state machine stores the committed log under its Raft index, so there is nothing to read back
+    return LogRead(id=index, **log.dict())
 
 # Keep your existing PUT and DELETE endpoints with similar redirect logic
\ No newline at end of file
@@ -0,0 +1,115 @@
+import asyncio
+import os
+import threading
+import pytest
+from app.consensus import logStorage
+from app.consensus.logStorage import LogStorage
+from app.consensus.raftNode import LogEntry
+
+
+def make_entries(start, count, term=1):
+    return [LogEntry(term=term, index=i, data={"name": f"log{i}"}) for i in range(start, start + count)]
+
+
+def test_recovery_across_segments(tmp_path):
+    storage = LogStorage(str(tmp_path), segment_bytes=1024)
+    storage.append_many(make_entries(1, 500))
+    storage.save_state(3, 2)
+    storage.close()
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".log")]) > 1
+
+    storage = LogStorage(str(tmp_path), segment_bytes=1024)
+    assert storage.last_index == 500
+    assert storage.load_state() == (3, 2)
+    assert storage.get(250).data == {"name": "log250"}
+    assert [entry.index for entry in storage.entries_from(498, 10)] == [498, 499, 500]
+
+
+def test_torn_tail_is_dropped(tmp_path):
+    storage = LogStorage(str(tmp_path))
+    storage.append_many(make_entries(1, 10))
+    storage.close()
+    segment = sorted(name for name in os.listdir(tmp_path) if name.endswith(".log"))[-1]
+    with open(tmp_path / segment, "ab") as f:
+        f.write(b"\x00\x00\x00\x40partial")
+
+    storage = LogStorage(str(tmp_path))
+    assert storage.last_index == 10
+    storage.append(LogEntry(term=1, index=11, data={}))
+    assert storage.get(11).index == 11
+
+
+def test_truncate_from(tmp_path):
+    storage = LogStorage(str(tmp_path), segment_bytes=1024)
+    storage.append_many(make_entries(1, 300))
+    storage.truncate_from(120)
+    assert storage.last_index == 119
+    assert storage.term_at(120) == -1
+    storage.append_many(make_entries(120, 5, term=2))
+    assert storage.last_term == 2
+    assert storage.term_at(119) == 1
+
+
+def test_snapshot_compacts_log(tmp_path):
+    storage = LogStorage(str(tmp_path), segment_bytes=1024)
+    storage.append_many(make_entries(1, 300))
+    snapshot_file = storage.create_snapshot_file()
+    snapshot_file.write(b"state")
+    storage.save_snapshot(snapshot_file, 250, 1)
+    assert storage.first_index > 1
+    assert storage.term_at(250) == 1
+    storage.close()
+
+    storage = LogStorage(str(tmp_path), segment_bytes=1024)
+    assert (storage.snapshot_index, storage.last_index) == (250, 300)
+    with storage.open_snapshot() as f:
+        assert f.read() == b"state"
+
+    # A snapshot the log does not agree with replaces the whole log
+    snapshot_file = storage.create_snapshot_file()
+    storage.save_snapshot(snapshot_file, 400, 3)
+    assert (storage.first_index, storage.last_index, storage.last_term) == (401, 400, 3)
+    storage.append(LogEntry(term=3, index=401, data={}))
+    assert storage.get_all()[0].index == 401
+
+
+def test_range_reads(tmp_path):
+    storage = LogStorage(str(tmp_path), segment_bytes=512)
+    storage.append_many(make_entries(1, 2000))
+    assert [entry.index for entry in storage.entries_between(10, 14, 100)] == [10, 11, 12, 13, 14]
+    assert len(storage.entries_between(1, 2000, 50)) == 50
+    assert storage.entries_between(1990, 5000, 100)[-1].index == 2000
+    # Segments dropped from memory reload their offset and term arrays on demand
+    assert [storage.get(index).index for index in range(1, 2000, 97)] == list(range(1, 2000, 97))
+
+
+@pytest.mark.asyncio
+async def test_sync_runs_off_the_event_loop(tmp_path, monkeypatch):
+    threads = []
+    fsync = os.fsync
+
+    def recording_fsync(fd):
+        threads.append(threading.get_ident())
+        fsync(fd)
+
+    monkeypatch.setattr(logStorage.os, "fsync", recording_fsync)
+    storage = LogStorage(str(tmp_path))
+    storage.append_many(make_entries(1, 10))
+    storage.save_state(2, 1)
+    assert not threads and storage.durable_index == 0
+    await storage.sync()
+    assert threads and threading.get_ident() not in threads
+    assert storage.durable_index == 10
+    storage.close()
+    assert LogStorage(str(tmp_path)).load_state() == (2, 1)
+
+
+@pytest.mark.asyncio
+async def test_interval_policy_syncs_once_writes_stop(tmp_path):
+    storage = LogStorage(str(tmp_path), fsync_policy="interval", fsync_interval=0.01)
+    storage.start()
+    storage.append_many(make_entries(1, 10))
+    assert storage.durable_index == 10 and storage.synced_index == 0
+    await asyncio.sleep(0.1)
+    assert storage.synced_index == 10
+    storage.close()
@@ -0,0 +1,26 @@
+from app.metrics import Registry, Counter, Gauge, Histogram
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = Histogram("ingest_seconds", "Ingest latency", ["path"], buckets=(0.01, 0.1), registry=registry)
+    for value in (0.005, 0.01, 0.05, 3):
+        latency.labels("/logs/").observe(value)
+    text = registry.render()
+    assert 'ingest_seconds_bucket{path="/logs/",le="0.01"} 2' in text
+    assert 'ingest_seconds_bucket{path="/logs/",le="0.1"} 3' in text
+    assert 'ingest_seconds_bucket{path="/logs/",le="+Inf"} 4' in text
+    assert 'ingest_seconds_count{path="/logs/"} 4' in text
+
+
+def test_collectors_run_on_render():
+    registry = Registry()
+    term = Gauge("raft_term", "Current term", registry=registry)
+    requests = Counter("requests_total", "Requests served", registry=registry)
+    state = {"term": 1}
+    registry.add_collector(lambda: term.set(state["term"]))
+    requests.inc()
+    state["term"] = 7
+    text = registry.render()
+    assert "# TYPE raft_term gauge\nraft_term 7\n" in text
+    assert "# TYPE requests_total counter\nrequests_total 1\n" in text
@@ -0,0 +1,80 @@
+import asyncio
+import pytest
+from app.consensus.logStorage import LogStorage
+from app.consensus.raftNode import RaftNode, RaftParams, RaftRole
+
+
+class ScriptedTransport:
+    """Answers RPCs from a dict of rpc name -> handler(peer, payload) and records every call"""
+
+    def __init__(self, handlers):
+        self.handlers = handlers
+        self.calls = []
+
+    async def call(self, peer, rpc, payload, timeout):
+        self.calls.append((peer, rpc))
+        return await self.handlers[rpc](peer, payload)
+
+
+def make_node(handlers):
+    params = RaftParams(election_timeout=150, heartbeat_interval=30)
+    return RaftNode(1, [2, 3], params, ScriptedTransport(handlers), LogStorage())
+
+
+@pytest.mark.asyncio
+async def test_no_term_bump_when_a_leader_appears_during_the_pre_vote():
+    async def pre_vote(peer, payload):
+        # Node 2 wins term 1 while our pre-vote for term 1 is in flight
+        if peer == 2:
+            node.handle_append_entries({"term": 1, "leader_id": 2, "prev_log_index": 0, "prev_log_term": 0,
+                                        "entries": [], "leader_commit": 0})
+        return {"term": 0, "vote_granted": True}
+
+    async def request_vote(peer, payload):
+        return {"term": payload["term"], "vote_granted": True}
+
+    node = make_node({"PreVote": pre_vote, "RequestVote": request_vote})
+    await node._run_election()
+    assert node.current_term == 1
+    assert node.role == RaftRole.FOLLOWER and node.leader_id == 2
+    assert all(rpc == "PreVote" for _, rpc in node.transport.calls)
+    node.election_timer.cancel()
+
+
+@pytest.mark.asyncio
+async def test_no_lease_reads_once_leadership_is_handed_over():
+    leases = []
+
+    async def timeout_now(peer, payload):
+        leases.append(node._lease_valid())
+        return {"term": payload["term"]}
+
+    async def append_entries(peer, payload):
+        return {"term": payload["term"], "success": True, "last_log_index": 0}
+
+    node = make_node({"TimeoutNow": timeout_now, "AppendEntries": append_entries})
+    node.role, node.current_term, node.leader_id = RaftRole.LEADER, 1, 1
+    node._noop = asyncio.get_running_loop().create_future()
+    node._noop.set_result(0)
+    node._term_at = lambda index: 1
+    node._ack_times = {2: asyncio.get_running_loop().time(), 3: asyncio.get_running_loop().time()}
+    assert node._lease_valid()
+
+    # The target never wins here, so we are still leader once the transfer gives up
+    assert not await node.transfer_leadership(2)
+    assert leases == [False]
+    assert node.role == RaftRole.LEADER and not node._lease_valid()
+    # Reads fall back to a heartbeat round
+    assert await node.read_index() == 0
+    assert "AppendEntries" in {rpc for _, rpc in node.transport.calls}
+
+
+@pytest.mark.asyncio
+async def test_rpcs_to_all_peers_start_in_peer_order():
+    async def pre_vote(peer, payload):
+        return {"term": 0, "vote_granted": False}
+
+    node = make_node({"PreVote": pre_vote})
+    node.peers = list(range(2, 18))
+    assert not await node._pre_vote()
+    assert [peer for peer, _ in node.transport.calls] == node.peers
@@ -0,0 +1,103 @@
+import asyncio
+import socket
+import pytest
+from app.consensus.raftNode import RaftNode, RaftParams, RaftRole
+from app.consensus.transport import PeerConnection, RaftTransport, parse_peers
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+async def cluster():
+    ports = {node_id: free_port() for node_id in (1, 2, 3)}
+    nodes, transports = [], []
+    for node_id in ports:
+        peers = {peer: ("127.0.0.1", port) for peer, port in ports.items() if peer != node_id}
+        transport = RaftTransport("127.0.0.1", ports[node_id], peers)
+        # Staggered timeouts so the test does not depend on a split vote resolving
+        params = RaftParams(election_timeout=300 + 200 * node_id, heartbeat_interval=100, rpc_timeout=200)
+        node = RaftNode(node_id, list(peers), params, transport)
+        await transport.start(node.handle_rpc)
+        await node.start()
+        nodes.append(node)
+        transports.append(transport)
+    yield nodes
+    for node, transport in zip(nodes, transports):
+        await node.stop()
+        await transport.stop()
+
+
+def test_parse_peers():
+    assert parse_peers("2,3") == {2: ("localhost", 9002), 3: ("localhost", 9003)}
+    assert parse_peers("node2,node3") == {2: ("node2", 9002), 3: ("node3", 9003)}
+    assert parse_peers("2=10.0.0.2:7000") == {2: ("10.0.0.2", 7000)}
+
+
+@pytest.mark.asyncio
+async def test_election_and_replication(cluster):
+    await asyncio.sleep(1.5)
+    leaders = [node for node in cluster if node.role == RaftRole.LEADER]
+    assert len(leaders) == 1, "Cluster should have exactly one leader"
+
+    leader = leaders[0]
+    results = await asyncio.gather(*[leader.replicate_log({"name": f"log{i}"}) for i in range(20)])
+    assert all(results)
+
+    await asyncio.sleep(0.5)
+    # Every node holds the leader's no-op entry plus the 20 logs
+    assert leader.log.last_index == 21
+    for node in cluster:
+        assert node.log.last_index == 21
+        assert node.commit_index == 21
+        assert node.leader_id == leader.node_id
+
+
+@pytest.mark.asyncio
+async def test_read_barrier(cluster):
+    await asyncio.sleep(1.5)
+    leader = next(node for node in cluster if node.role == RaftRole.LEADER)
+    await leader.replicate_log({"name": "before-read"})
+    for node in cluster:
+        assert await node.read_barrier()
+        assert node.state_machine.entries[-1] == {"name": "before-read"}
+
+
+@pytest.mark.asyncio
+async def test_leadership_transfer(cluster):
+    await asyncio.sleep(1.5)
+    leader = next(node for node in cluster if node.role == RaftRole.LEADER)
+    target = next(node for node in cluster if node is not leader)
+    assert await leader.transfer_leadership(target.node_id)
+    assert target.role == RaftRole.LEADER
+    assert await target.replicate_log({"name": "after-transfer"})
+
+
+@pytest.mark.asyncio
+async def test_old_read_loop_leaves_a_new_connection_alone():
+    async def handler(rpc, payload):
+        await asyncio.sleep(payload["delay"])
+        return {"rpc": rpc}
+
+    server = RaftTransport("127.0.0.1", free_port(), {})
+    await server.start(handler)
+    connection = PeerConnection(2, "127.0.0.1", server.port)
+    try:
+        assert await connection.call("Ping", {"delay": 0}, 1) == {"rpc": "Ping"}
+        old_reader, old_writer = connection._reader, connection._writer
+        # The connection is replaced before its read loop notices that it is gone
+        connection._writer = None
+        slow = asyncio.create_task(connection.call("Slow", {"delay": 0.1}, 1))
+        await asyncio.sleep(0.05)
+        new_writer = connection._writer
+        assert new_writer is not None and new_writer is not old_writer
+        old_reader.feed_eof()
+        assert await slow == {"rpc": "Slow"}
+        assert connection._writer is new_writer and not new_writer.is_closing()
+        assert old_writer.is_closing()
+    finally:
+        await connection.close()
+        await server.stop()
@@ -0,0 +1,55 @@
+import asyncio
+import pytest
+from app.consensus.logStorage import LogStorage
+from app.consensus.raftNode import RaftNode, RaftParams, RaftRole
+from app.consensus.simulator import Simulator, simulate, run_on_virtual_clock
+from app.consensus.stateMachine import MemoryStateMachine
+
+
+def test_same_seed_same_run():
+    runs = [simulate(seconds=1, clients=5, nodes=3, seed=7, drop_rate=0.01) for _ in range(3)]
+    # Other runs in the same process leave different objects (and ids) behind
+    simulate(seconds=0.5, clients=3, nodes=5, seed=1)
+    runs.append(simulate(seconds=1, clients=5, nodes=3, seed=7, drop_rate=0.01))
+    simulate(seconds=0.5, clients=8, nodes=3, seed=2, drop_rate=0.05)
+    runs.append(simulate(seconds=1, clients=5, nodes=3, seed=7, drop_rate=0.01))
+    assert all(run == runs[0] for run in runs)
+    assert runs[0]["commits"] > 0
+    assert runs[0]["elections"] >= 1
+
+
+def test_leader_isolation_triggers_new_election():
+    simulator = Simulator(nodes=5, seed=1)
+    isolated = []
+
+    def isolate_leader():
+        leader = simulator.leader()
+        isolated.append(leader.node_id)
+        simulator.network.partition({leader.node_id}, set(simulator.node_ids) - {leader.node_id})
+
+    report = run_on_virtual_clock(simulator.run(3, clients=5, events=[(1, isolate_leader), (2, simulator.network.heal)]))
+    assert report["elections"] >= 2
+    assert report["commits"] > 0
+    assert report["virtual_seconds"] >= 3
+
+
+def test_write_fails_when_it_is_not_applied_in_time():
+    class StuckStateMachine(MemoryStateMachine):
+        async def apply_many(self, entries):
+            await asyncio.sleep(3600)
+
+    async def write():
+        params = RaftParams(election_timeout=150, heartbeat_interval=30, write_timeout=500)
+        node = RaftNode(1, [], params, storage=LogStorage(), state_machine=StuckStateMachine())
+        await node.start()
+        while node.role != RaftRole.LEADER:
+            await asyncio.sleep(0.01)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        index = await node.replicate_log({"name": "stuck"})
+        return index, node.commit_index, loop.time() - started
+
+    index, commit_index, waited = run_on_virtual_clock(write())
+    assert index is None
+    assert commit_index >= 1  # committed, but never applied
+    assert waited == pytest.approx(0.5, abs=0.01)
@@ -0,0 +1,84 @@
+import asyncio
+import pytest
+from app.database import Base, create_engine_from_env
+from app.storage import LogFilter, PostgresBackend, SQLiteWALBackend, SQLITE_WRITER_BATCH_ROWS
+
+
+@pytest.fixture(params=["sqlalchemy", "sqlite-wal"])
+async def storage(request, tmp_path):
+    # The SQLAlchemy backend runs on aiosqlite here; the schema comes from the models either way
+    engine = create_engine_from_env(f"sqlite:///{tmp_path / 'logs.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    backend = PostgresBackend(engine) if request.param == "sqlalchemy" else SQLiteWALBackend(str(tmp_path / "logs.db"))
+    yield backend
+    await backend.close()
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_insert_scan_and_delete_range(storage):
+    ids = await storage.insert_batch([{"name": f"log{i}", "password": "x"} for i in range(5)])
+    assert ids == [1, 2, 3, 4, 5]
+    assert [log.name for log in await storage.scan(after=2, limit=2)] == ["log2", "log3"]
+    assert [log.id async for log in storage.stream(after=3)] == [4, 5]
+    assert await storage.delete_range(2, 4) == 2
+    assert await storage.count() == 3
+
+
+@pytest.mark.asyncio
+async def test_rows_with_ids_are_replaced(storage):
+    await storage.insert_batch([{"id": 7, "name": "first", "password": "x"}])
+    await storage.insert_batch([{"id": 7, "name": "again", "password": "x"}, {"id": 8, "name": "next", "password": "x"}])
+    assert [(log.id, log.name) for log in await storage.scan()] == [(7, "again"), (8, "next")]
+
+
+@pytest.mark.asyncio
+async def test_filtered_and_descending_scans(storage):
+    await storage.insert_batch([{"name": "ab"[i % 2], "password": "x"} for i in range(6)])
+    where = LogFilter(name="a")
+    assert [log.id for log in await storage.scan(where=where)] == [1, 3, 5]
+    assert [log.id for log in await storage.scan(after=5, limit=2, where=where, descending=True)] == [3, 1]
+    assert [log.id async for log in storage.stream(where=LogFilter(name="b"), descending=True)] == [6, 4, 2]
+
+
+@pytest.mark.asyncio
+async def test_name_lookup_uses_the_index(storage):
+    plan = " ".join(await storage.explain(limit=100, where=LogFilter(name="a"), descending=True))
+    assert "ix_logs_name_id" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+@pytest.mark.asyncio
+async def test_attribute_and_text_filters(storage):
+    await storage.insert_batch([
+        {"name": "api", "password": "x", "message": "upstream timeout after 30s", "attributes": {"level": "error", "request_id": "r1"}},
+        {"name": "api", "password": "x", "message": "request served", "attributes": {"level": "info", "request_id": "r2"}},
+        {"name": "api", "password": "x", "message": "no context", "attributes": None},
+    ])
+    assert (await storage.scan())[2].attributes is None
+    assert [log.id for log in await storage.scan(where=LogFilter(equals={"level": "error"}))] == [1]
+    assert [log.id for log in await storage.scan(where=LogFilter(contains={"request_id": "r2"}))] == [2]
+    assert [log.id for log in await storage.scan(where=LogFilter(text="Timeout"))] == [1]
+    assert await storage.scan(where=LogFilter(equals={"level": "error"}, text="served")) == []
+
+
+@pytest.mark.asyncio
+async def test_nested_attribute_values_need_postgres(storage):
+    with pytest.raises(ValueError):
+        await storage.scan(where=LogFilter(contains={"http": {"status": 500}}))
+
+
+@pytest.mark.asyncio
+async def test_concurrent_writes_share_transactions(tmp_path):
+    engine = create_engine_from_env(f"sqlite:///{tmp_path / 'logs.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    storage = SQLiteWALBackend(str(tmp_path / "logs.db"))
+    commits = sum(SQLITE_WRITER_BATCH_ROWS.labels().counts)
+    ids = await asyncio.gather(*[storage.insert_batch([{"name": f"log{i}", "password": "x"}]) for i in range(200)])
+    assert sorted(id for batch in ids for id in batch) == list(range(1, 201))
+    assert await storage.count() == 200
+    assert sum(SQLITE_WRITER_BATCH_ROWS.labels().counts) - commits < 200
+    await storage.close()
+    await engine.dispose()
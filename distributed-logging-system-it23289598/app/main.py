@@ -1,25 +1,56 @@
 # app/main.py
 
-from fastapi import FastAPI, Request, HTTPException, status, Depends
+import logging
+import os
+import time
+from fastapi import FastAPI, Request, Response, HTTPException, status, Depends, Query
+from sqlalchemy import select
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from pydantic import BaseModel, Field
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 from app.database import SessionLocal, create_tables
 from app.models import LogDB
-from typing import List
+from typing import Any, Dict, List, Literal, Optional
 from pathlib import Path
-from utils.ntp_sync import sync_time  # Import NTP sync function
-from app.replication import replicate_log # Import replication function
+from utils.ntp_sync import clock  # Background NTP corrected clock
+from app.replication import replicator # Backup servers and ack policy
+from app.outbox import outbox, ReplicationBackpressure # Durable replication pipeline
+from app.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, encode_cursor, to_ndjson, to_utc
+from app.storage import LogFilter, storage # Postgres or embedded SQLite, from STORAGE_BACKEND
+from app.partitions import partitions # Time partitions and retention
+from app.metrics import REGISTRY, CONTENT_TYPE, Histogram
+
+# Leveled logging instead of prints; LOG_LEVEL=DEBUG for more detail
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(),
+                    format="%(asctime)s %(levelname)s %(name)s %(message)s")
+
+INGEST_SECONDS = Histogram("log_ingest_seconds", "Time to accept a log, including the replication ack wait", ["path"])
+DB_COMMIT_SECONDS = Histogram("db_commit_seconds", "Time spent committing a write transaction", ["source"])
 
 app = FastAPI()
 
-# Create the tables at the startup
-create_tables()
+# Create the tables, then synchronize the clock and keep refreshing it in the background
+@app.on_event("startup")
+async def on_startup():
+    await partitions.create_table()
+    await create_tables()
+    await clock.refresh()
+    clock.start()
+    # Partitions for the coming intervals have to exist before the first write
+    await partitions.maintain()
+    partitions.start()
+    await outbox.start()
 
-# Synchronize system time at startup
-sync_time()
+@app.on_event("shutdown")
+async def on_shutdown():
+    await partitions.stop()
+    await clock.stop()
+    await outbox.stop()
+    await replicator.close()
+    await storage.close()
 
 # Setup templates and static directories
 BASE_DIR = Path(__file__).resolve().parent.parent  # distributed-logging-system/
@@ -33,18 +64,17 @@ STATIC_DIR.mkdir(parents=True, exist_ok=True)
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 templates = Jinja2Templates(directory=TEMPLATES_DIR)
 
-# Dependency to get a database session
-def get_db():
-    db = SessionLocal()
-    try:
+# Dependency to get a database session from the pool
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 # Pydantic models
 class Log(BaseModel):
     name: str
     password: str
+    message: Optional[str] = None
+    attributes: Optional[Dict[str, Any]] = None  # Structured context, e.g. {"request_id": "...", "level": "error"}
 
     class Config:
         orm_mode = True
@@ -56,42 +86,144 @@ class LogRead(Log):
     id: int
     timestamp: datetime
 
+class ReplicatedLog(Log):
+    id: int
+    timestamp: Optional[datetime]
+
+class ReplicationBatch(BaseModel):
+    entries: List[ReplicatedLog]
+
+class LogSearch(BaseModel):
+    name: Optional[str] = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    contains: Optional[Dict[str, Any]] = None  # Document the attributes must contain, nested values included
+    equals: Optional[Dict[str, Any]] = None  # Attributes that must have exactly these values
+    text: Optional[str] = None  # Full-text query on the message
+    order: Literal["asc", "desc"] = "asc"
+    limit: int = Field(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+    cursor: Optional[str] = None
+
 # Frontend
 @app.get("/", include_in_schema=False)
 async def read_root(request: Request):
     return templates.TemplateResponse("logs.html", {"request": request})
 
+# Storage filter with times in the naive UTC logs are stamped with
+def make_filter(name=None, since=None, until=None, **attributes):
+    where = LogFilter(name, to_utc(since), to_utc(until), **attributes)
+    if where.since and where.until and where.since >= where.until:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="since must be before until")
+    return where
+
+# Streams every matching log after the (timestamp, id) key as NDJSON
+async def stream_logs(after, where, descending):
+    async for log in storage.stream(after, where, descending):
+        yield to_ndjson(log)
+
 # API endpoints
 @app.get("/logs/", response_model=List[LogRead])
-async def get_logs_api(db: Session = Depends(get_db)):
-    logs = db.query(LogDB).all()
+async def get_logs_api(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    name: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    order: Literal["asc", "desc"] = "asc",
+):
+    # Keyset pagination on (timestamp, id); the next page starts at X-Next-Cursor with the same filters
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    # Served by the (name, timestamp) and (timestamp, id) indexes instead of a full scan
+    where = make_filter(name, since, until)
+    descending = order == "desc"
+    if stream:
+        return StreamingResponse(stream_logs(after, where, descending), media_type="application/x-ndjson")
+
+    logs = await storage.scan(after, limit, where, descending)
+    if len(logs) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(logs[-1])
     return logs
 
 @app.post("/logs/", response_model=LogRead)
-async def create_log(log: LogCreate, db: Session = Depends(get_db)):
-    synchronized_time = sync_time()
-    timestamp = synchronized_time if synchronized_time else datetime.utcnow()
+async def create_log(log: LogCreate, response: Response, db: AsyncSession = Depends(get_db)):
+    started = time.perf_counter()
+    # Hold the write back while a backup is too far behind
+    try:
+        await outbox.wait_for_capacity()
+    except ReplicationBackpressure as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+
+    timestamp = clock.now()
 
-    db_log = LogDB(name=log.name, password=log.password, timestamp=timestamp)
+    db_log = LogDB(name=log.name, password=log.password, message=log.message, attributes=log.attributes,
+                   timestamp=timestamp)
     db.add(db_log)
-    db.commit()
-    db.refresh(db_log)
+    # Queue the log for replication in the same transaction
+    entry = await outbox.append(db, db_log)
+    with DB_COMMIT_SECONDS.labels("/logs/").time():
+        await db.commit()
+    outbox.committed(entry.id)
 
-     # Replicate the log to backup servers
-    replication_success = replicate_log(db_log)
-
-    if not replication_success:
-        raise HTTPException(
-            status_code=500,
-            detail="Log replication failed. Some replicas may not have received the log."
-        )
+    # The log is durable either way; the header says whether the ack mode was met in time
+    replicated = await outbox.wait_for_acks(entry.id)
+    response.headers["X-Replication"] = "acked" if replicated else "pending"
 
+    INGEST_SECONDS.labels("/logs/").observe(time.perf_counter() - started)
     return db_log
 
 
+# Attribute and full-text search, one page at a time like GET /logs/
+@app.post("/logs/search", response_model=List[LogRead])
+async def search_logs(search: LogSearch, response: Response):
+    try:
+        after = decode_cursor(search.cursor) if search.cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    where = make_filter(search.name, search.since, search.until,
+                        contains=search.contains, equals=search.equals, text=search.text)
+    try:
+        logs = await storage.scan(after, search.limit, where, search.order == "desc")
+    except ValueError as e:
+        # A match the database cannot express, e.g. nested attribute values outside Postgres
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if len(logs) == search.limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(logs[-1])
+    return logs
+
+
+# Receives batches from the primary's outbox senders
+@app.post("/replication/logs")
+async def receive_replicated_logs(batch: ReplicationBatch):
+    if batch.entries:
+        # Rows keep the primary's id, so a retried batch replaces what it wrote before
+        with DB_COMMIT_SECONDS.labels("/replication/logs").time():
+            await storage.insert_batch([entry.dict() for entry in batch.entries])
+    return {"received": len(batch.entries)}
+
+
+@app.get("/replication/status")
+async def replication_status():
+    return {
+        "ack_mode": replicator.ack_mode,
+        "head": outbox.head,
+        "backups": {backup.url: {"acked": outbox.acked.get(backup.url, 0), "lag": outbox.lag(backup)}
+                    for backup in replicator.backups},
+    }
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
 @app.put("/logs/{log_id}", response_model=LogRead)
-async def update_log(log_id: int, updated_log: LogCreate, db: Session = Depends(get_db)):
-    db_log = db.query(LogDB).filter(LogDB.id == log_id).first()
+async def update_log(log_id: int, updated_log: LogCreate, db: AsyncSession = Depends(get_db)):
+    db_log = (await db.execute(select(LogDB).filter(LogDB.id == log_id))).scalars().first()
     if not db_log:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -100,23 +232,24 @@ async def update_log(log_id: int, updated_log: LogCreate, db: Session = Depends(
 
     db_log.name = updated_log.name
     db_log.password = updated_log.password
-    db.commit()
-    db.refresh(db_log)
+    db_log.message = updated_log.message
+    db_log.attributes = updated_log.attributes
+    await db.commit()
     return db_log
 
 
 
 
 @app.delete("/logs/{log_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_log(log_id: int, db: Session = Depends(get_db)):
-    db_log = db.query(LogDB).filter(LogDB.id == log_id).first()
+async def delete_log(log_id: int, db: AsyncSession = Depends(get_db)):
+    db_log = (await db.execute(select(LogDB).filter(LogDB.id == log_id))).scalars().first()
     if not db_log:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Log with id {log_id} not found"
         )
-    db.delete(db_log)
-    db.commit()
+    await db.delete(db_log)
+    await db.commit()
     return None
 
 
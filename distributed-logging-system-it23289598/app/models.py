@@ -1,8 +1,19 @@
 # app/models.py
-from sqlalchemy import Column, Integer, String, DateTime
+import os
+import re
+from sqlalchemy import Column, Integer, String, DateTime, Index, JSON, Text, text
+from sqlalchemy.dialects.postgresql import JSONB
 from app.database import Base
 from datetime import datetime
 
+LOG_FULLTEXT_INDEX = os.getenv("LOG_FULLTEXT_INDEX", "").lower() in ("1", "true", "yes")  # GIN index for message search on Postgres
+LOG_TEXT_SEARCH_CONFIG = os.getenv("LOG_TEXT_SEARCH_CONFIG", "simple")  # Postgres text search configuration, e.g. english
+if not re.fullmatch(r"\w+", LOG_TEXT_SEARCH_CONFIG):
+    raise ValueError(f"Invalid LOG_TEXT_SEARCH_CONFIG {LOG_TEXT_SEARCH_CONFIG!r}")
+
+# Searches have to use this exact expression for Postgres to answer them from the full-text index
+MESSAGE_TSVECTOR = f"to_tsvector('{LOG_TEXT_SEARCH_CONFIG}'::regconfig, message)"
+
 class LogDB(Base):
     __tablename__ = "logs"
 
@@ -10,4 +21,33 @@ class LogDB(Base):
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     name = Column(String)
     password = Column(String)
-    timestamp = Column(DateTime, default=datetime.utcnow)  # Added timestamp field with default UTC time
+    timestamp = Column(DateTime, default=datetime.utcnow)  # Partition key on Postgres, see app/partitions.py
+    message = Column(Text)
+    # Structured context such as request_id or level; JSONB on Postgres, JSON text elsewhere, SQL NULL if absent
+    attributes = Column(JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), "postgresql"))
+
+    __table_args__ = (
+        Index("ix_logs_timestamp_id", "timestamp", "id"),  # Pages in time order
+        Index("ix_logs_name_timestamp", "name", "timestamp", "id"),  # One source's logs in a time range, in time order
+        # Attribute containment (@>), which also answers equality on a key; jsonb_path_ops supports only that and is smaller
+        Index("ix_logs_attributes", "attributes", postgresql_using="gin",
+              postgresql_ops={"attributes": "jsonb_path_ops"}).ddl_if(dialect="postgresql"),
+        # Optional, since every write pays for it: LOG_FULLTEXT_INDEX=true
+        Index("ix_logs_message_search", text(MESSAGE_TSVECTOR), postgresql_using="gin").ddl_if(
+            dialect="postgresql", callable_=lambda *args, **kwargs: LOG_FULLTEXT_INDEX),
+    )
+
+
+class OutboxEntryDB(Base):
+    __tablename__ = "replication_outbox"
+
+    # Position in the replication stream; committed in the same transaction as the log
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    log_id = Column(Integer, nullable=False)
+
+
+class ReplicaCursorDB(Base):
+    __tablename__ = "replication_cursors"
+
+    backup = Column(String, primary_key=True)
+    acked_position = Column(Integer, nullable=False, default=0)  # Highest outbox id the backup acknowledged
@@ -0,0 +1,234 @@
+# app/outbox.py
+import asyncio
+import logging
+import os
+from typing import Dict, List
+
+from sqlalchemy import delete, func, select
+
+from app.database import SessionLocal
+from app.metrics import REGISTRY, Gauge
+from app.models import LogDB, OutboxEntryDB, ReplicaCursorDB
+from app.replication import Backup, Replicator, replicator as default_replicator
+
+REPLICATION_BATCH_SIZE = int(os.getenv("REPLICATION_BATCH_SIZE", "500"))  # Logs per replication request
+REPLICATION_POLL_INTERVAL = float(os.getenv("REPLICATION_POLL_INTERVAL", "1.0"))  # Idle wake-up in seconds
+REPLICATION_RETRY_BASE = float(os.getenv("REPLICATION_RETRY_BASE", "0.1"))  # First retry delay in seconds
+REPLICATION_RETRY_MAX = float(os.getenv("REPLICATION_RETRY_MAX", "30"))  # Retry delay cap in seconds
+REPLICATION_MAX_LAG = int(os.getenv("REPLICATION_MAX_LAG", "100000"))  # Unacked logs before writes are held back
+REPLICATION_ACK_TIMEOUT = float(os.getenv("REPLICATION_ACK_TIMEOUT", "2.0"))  # Max wait for the ack mode
+REPLICATION_BACKPRESSURE_TIMEOUT = float(os.getenv("REPLICATION_BACKPRESSURE_TIMEOUT", "5.0"))
+OUTBOX_LOCK_KEY = 0x6F7574626F78  # Postgres advisory lock that orders outbox positions ("outbox")
+
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_HEAD = Gauge("replication_outbox_head", "Newest position in the replication outbox")
+REPLICATION_LAG = Gauge("replication_lag", "Logs committed on the primary but not yet acknowledged", ["backup"])
+
+
+class ReplicationBackpressure(Exception):
+    """
+    Raised when a backup stayed more than max_lag logs behind for too long.
+    """
+
+
+class ReplicationOutbox:
+    """
+    Ships committed logs to the backups from a durable outbox table.
+
+    Every log is added to replication_outbox in the same transaction as the log
+    itself. One sender per backup drains the outbox in batches, retries with
+    exponential backoff and stores how far the backup acknowledged in
+    replication_cursors, so nothing is lost or skipped across restarts.
+
+    Senders acknowledge the highest position they sent, which is only safe
+    if positions become visible in order. On Postgres a sequence hands out
+    ids in one order and transactions may commit in another, so appends
+    hold an advisory lock from taking a position until their commit. SQLite
+    already runs one write transaction at a time.
+    """
+
+    def __init__(self, replicator: Replicator = default_replicator, batch_size: int = REPLICATION_BATCH_SIZE,
+                 max_lag: int = REPLICATION_MAX_LAG, session_factory=SessionLocal):
+        self.replicator = replicator
+        self.batch_size = batch_size
+        self.max_lag = max_lag
+        self.session_factory = session_factory
+        self.head = 0  # Newest outbox position
+        self.acked: Dict[str, int] = {}  # Acknowledged position per backup URL
+        self._changed = None
+        self._wakeup: Dict[str, asyncio.Event] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    # --- Write side ---------------------------------------------------------
+
+    async def append(self, db, log: LogDB) -> OutboxEntryDB:
+        """
+        Queues a log for replication. Must run in the transaction that inserts the log,
+        which should commit right after since it holds the outbox lock until then.
+        """
+        if log.id is None:
+            await db.flush()
+        if db.get_bind().dialect.name == "postgresql":
+            # Released at commit or rollback; a lower position can no longer commit after a higher one
+            await db.execute(select(func.pg_advisory_xact_lock(OUTBOX_LOCK_KEY)))
+        entry = OutboxEntryDB(log_id=log.id)
+        db.add(entry)
+        await db.flush()
+        return entry
+
+    def committed(self, position: int):
+        """
+        Wakes the senders after the transaction holding `position` committed.
+        """
+        self.head = max(self.head, position)
+        for event in self._wakeup.values():
+            event.set()
+
+    def lag(self, backup: Backup) -> int:
+        return self.head - self.acked.get(backup.url, 0)
+
+    def acked_count(self, position: int) -> int:
+        return sum(1 for acked in self.acked.values() if acked >= position)
+
+    async def wait_for_capacity(self, timeout: float = REPLICATION_BACKPRESSURE_TIMEOUT):
+        """
+        Holds a write back while any backup is more than max_lag logs behind.
+        """
+        if all(self.lag(backup) <= self.max_lag for backup in self.replicator.backups):
+            return
+        try:
+            await asyncio.wait_for(self._wait(
+                lambda: all(self.lag(backup) <= self.max_lag for backup in self.replicator.backups)
+            ), timeout)
+        except asyncio.TimeoutError:
+            raise ReplicationBackpressure("Backups are too far behind, try again later")
+
+    async def wait_for_acks(self, position: int, timeout: float = REPLICATION_ACK_TIMEOUT) -> bool:
+        """
+        Waits until as many backups as the ack mode requires hold `position`.
+
+        :return: False if that did not happen within timeout; the log is still
+                 durable and will be delivered by the senders
+        """
+        required = self.replicator.required_acks()
+        if self.acked_count(position) >= required:
+            return True
+        try:
+            await asyncio.wait_for(self._wait(lambda: self.acked_count(position) >= required), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _wait(self, predicate):
+        async with self._changed:
+            await self._changed.wait_for(predicate)
+
+    # --- Senders ------------------------------------------------------------
+
+    async def _load_state(self):
+        async with self.session_factory() as db:
+            head = await db.scalar(select(OutboxEntryDB.id).order_by(OutboxEntryDB.id.desc()).limit(1))
+            cursors = {c.backup: c.acked_position for c in (await db.execute(select(ReplicaCursorDB))).scalars()}
+            return head or 0, cursors
+
+    async def _load_batch(self, after: int):
+        async with self.session_factory() as db:
+            rows = (await db.execute(
+                select(OutboxEntryDB.id, LogDB)
+                .outerjoin(LogDB, LogDB.id == OutboxEntryDB.log_id)
+                .filter(OutboxEntryDB.id > after)
+                .order_by(OutboxEntryDB.id)
+                .limit(self.batch_size)
+            )).all()
+            entries = [
+                {
+                    "id": log.id,
+                    "name": log.name,
+                    "password": log.password,
+                    "timestamp": log.timestamp.isoformat() if log.timestamp else None,
+                    "message": log.message,
+                    "attributes": log.attributes,
+                }
+                for _, log in rows if log is not None  # Deleted since; only the position advances
+            ]
+            return entries, (rows[-1][0] if rows else after)
+
+    async def _save_ack(self, backup: str, position: int):
+        async with self.session_factory() as db:
+            cursor = await db.get(ReplicaCursorDB, backup)
+            if cursor is None:
+                db.add(ReplicaCursorDB(backup=backup, acked_position=position))
+            else:
+                cursor.acked_position = position
+            # Everything every backup has acknowledged can leave the outbox
+            if len(self.acked) == len(self.replicator.backups):
+                await db.execute(delete(OutboxEntryDB).where(OutboxEntryDB.id <= min(self.acked.values())))
+            await db.commit()
+
+    async def _acknowledge(self, backup: Backup, position: int):
+        self.acked[backup.url] = position
+        await self._save_ack(backup.url, position)
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def _sender(self, backup: Backup):
+        wakeup = self._wakeup[backup.url]
+        delay = REPLICATION_RETRY_BASE
+        while True:
+            acked = self.acked.get(backup.url, 0)
+            try:
+                entries, position = await self._load_batch(acked)
+            except Exception as e:
+                logger.error("outbox read failed error=%r", e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, REPLICATION_RETRY_MAX)
+                continue
+
+            if position == acked:
+                # Nothing new; sleep until a commit wakes us or the poll interval passes
+                wakeup.clear()
+                try:
+                    await asyncio.wait_for(wakeup.wait(), REPLICATION_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            if entries and not await self.replicator.send_batch(backup, entries):
+                logger.warning("replication retry backup=%s delay=%.2fs lag=%d", backup.url, delay, self.lag(backup))
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, REPLICATION_RETRY_MAX)
+                continue
+
+            delay = REPLICATION_RETRY_BASE
+            self.head = max(self.head, position)
+            await self._acknowledge(backup, position)
+
+    async def start(self):
+        self._changed = asyncio.Condition()
+        head, cursors = await self._load_state()
+        # A fully acknowledged outbox is trimmed empty, so the cursors also bound the head
+        self.head = max([head, *cursors.values()])
+        for backup in self.replicator.backups:
+            self.acked[backup.url] = cursors.get(backup.url, 0)
+            self._wakeup[backup.url] = asyncio.Event()
+            self._tasks.append(asyncio.create_task(self._sender(backup)))
+
+    def collect_metrics(self):
+        """
+        Updates the outbox gauges; called when /metrics is scraped.
+        """
+        OUTBOX_HEAD.set(self.head)
+        for backup in self.replicator.backups:
+            REPLICATION_LAG.labels(backup.url).set(self.lag(backup))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+
+outbox = ReplicationOutbox()
+REGISTRY.add_collector(outbox.collect_metrics)
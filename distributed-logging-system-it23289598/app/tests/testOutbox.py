@@ -0,0 +1,59 @@
+import asyncio
+import os
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from app.database import Base, create_engine_from_env
+from app.models import LogDB
+from app.outbox import ReplicationOutbox
+from app.replication import Backup
+
+# Concurrent write transactions need a database server; SQLite runs one at a time anyway
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "")
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL.startswith("postgresql"),
+                                reason="set TEST_DATABASE_URL to a scratch Postgres database")
+
+
+class FakeReplicator:
+    def __init__(self):
+        self.backups = [Backup("http://backup", 1.0)]
+
+    def required_acks(self) -> int:
+        return 0
+
+
+@pytest.fixture
+async def session_factory():
+    engine = create_engine_from_env(TEST_DATABASE_URL)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(bind=engine, expire_on_commit=False)
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_positions_commit_in_order(session_factory):
+    outbox = ReplicationOutbox(replicator=FakeReplicator(), session_factory=session_factory)
+
+    async def write(db, name):
+        log = LogDB(name=name, password="x")
+        db.add(log)
+        return await outbox.append(db, log)
+
+    async with session_factory() as first, session_factory() as second:
+        await write(first, "first")
+
+        async def write_second():
+            await write(second, "second")
+            await second.commit()
+
+        # The second transaction tries to commit while the first one still holds a lower position
+        task = asyncio.create_task(write_second())
+        await asyncio.sleep(0.2)
+        entries, position = await outbox._load_batch(0)
+        assert (entries, position) == ([], 0)
+
+        await first.commit()
+        await task
+        entries, position = await outbox._load_batch(position)
+        assert [entry["name"] for entry in entries] == ["first", "second"]
@@ -1,8 +1,27 @@
 # utils/ntp_sync.py
+import asyncio
+import logging
+import os
+import time
 import ntplib
 from time import ctime
 from datetime import datetime
 
+from app.metrics import Gauge, Histogram
+
+# NTP servers queried by the background clock, comma separated
+NTP_SERVERS = [s.strip() for s in os.getenv("NTP_SERVERS", "pool.ntp.org").split(",") if s.strip()]
+NTP_SYNC_INTERVAL = float(os.getenv("NTP_SYNC_INTERVAL", "64"))  # Seconds between refreshes
+NTP_TIMEOUT = float(os.getenv("NTP_TIMEOUT", "2"))  # Seconds per NTP request
+NTP_SMOOTHING = float(os.getenv("NTP_SMOOTHING", "0.25"))  # Weight of a new offset sample
+
+logger = logging.getLogger(__name__)
+
+NTP_QUERY_SECONDS = Histogram("ntp_query_seconds", "Time to get an answer from an NTP server", ["server"])
+CLOCK_SKEW_SECONDS = Histogram("clock_skew_seconds", "Absolute local clock offset seen in each NTP sample",
+                               buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
+CLOCK_OFFSET_SECONDS = Gauge("clock_offset_seconds", "Smoothed NTP minus local clock offset")
+
 
 def sync_time(ntp_server="pool.ntp.org"):
     """
@@ -21,11 +40,107 @@ def sync_time(ntp_server="pool.ntp.org"):
         # Convert the NTP time (UNIX timestamp) to a datetime object
         synchronized_time = datetime.utcfromtimestamp(response.tx_time)
 
-        print(f"System time synchronized to: {synchronized_time}")
+        logger.info("time synchronized server=%s time=%s", ntp_server, synchronized_time)
         return synchronized_time
     except ntplib.NTPException as e:
-        print(f"Failed to sync time due to NTP issue: {e}")
+        logger.warning("ntp sync failed server=%s error=%s", ntp_server, e)
     except Exception as e:
-        print(f"Unexpected error occurred while syncing time: {e}")
+        logger.exception("ntp sync failed server=%s error=%s", ntp_server, e)
 
     return None
+
+
+class ClockService:
+    """
+    NTP corrected clock whose offset is refreshed by a background task.
+
+    Reading the time never touches the network: `now()` adds the monotonic
+    time elapsed since the last anchor to the NTP corrected anchor time.
+
+    :param servers: NTP servers to query on each refresh (default is NTP_SERVERS)
+    :param interval: Seconds between refreshes
+    :param timeout: Seconds to wait for each NTP answer
+    :param smoothing: Weight of a new sample in the moving average of the offset
+    """
+
+    def __init__(self, servers=None, interval=NTP_SYNC_INTERVAL,
+                 timeout=NTP_TIMEOUT, smoothing=NTP_SMOOTHING):
+        self.servers = list(servers or NTP_SERVERS)
+        self.interval = interval
+        self.timeout = timeout
+        self.smoothing = smoothing
+        self.offset = 0.0  # Smoothed NTP - local offset in seconds
+        self.last_sync = None
+        self._anchor = (time.monotonic(), time.time())
+        self._task = None
+
+    def now(self):
+        """
+        Returns the current NTP corrected UTC time without any network access.
+        """
+        mono, wall = self._anchor
+        return datetime.utcfromtimestamp(wall + (time.monotonic() - mono))
+
+    def _sample(self):
+        # Keep the offset of the answer with the lowest round trip delay
+        best = None
+        for server in self.servers:
+            started = time.perf_counter()
+            try:
+                response = ntplib.NTPClient().request(server, version=3, timeout=self.timeout)
+            except Exception as e:
+                logger.warning("ntp query failed server=%s error=%s", server, e)
+                continue
+            NTP_QUERY_SECONDS.labels(server).observe(time.perf_counter() - started)
+            if best is None or response.delay < best.delay:
+                best = response
+        return best
+
+    async def refresh(self):
+        """
+        Takes one NTP sample in a worker thread and folds it into the offset.
+
+        :return: True if at least one server answered
+        """
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(None, self._sample)
+        if response is None:
+            return False
+
+        CLOCK_SKEW_SECONDS.observe(abs(response.offset))
+        if self.last_sync is None:
+            self.offset = response.offset
+        else:
+            self.offset += self.smoothing * (response.offset - self.offset)
+        CLOCK_OFFSET_SECONDS.set(self.offset)
+        # Swap the anchor in one assignment so now() never sees a half update
+        self._anchor = (time.monotonic(), time.time() + self.offset)
+        self.last_sync = self.now()
+        return True
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.exception("clock refresh failed error=%s", e)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """
+        Starts the background refresh loop on the running event loop.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+clock = ClockService()
@@ -0,0 +1,52 @@
+# app/pagination.py
+import base64
+import json
+from datetime import datetime, timezone
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(log):
+    """
+    Builds an opaque cursor that points just after the given row.
+
+    :param log: Last log of the current page
+    :return: URL safe cursor string encoding (timestamp, id)
+    """
+    raw = f"{log.timestamp.isoformat()}|{log.id}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    """
+    :param cursor: Cursor produced by encode_cursor
+    :return: (timestamp, id) tuple
+    :raises ValueError: If the cursor is malformed
+    """
+    try:
+        timestamp, log_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def to_utc(value):
+    """
+    :param value: Datetime from a query parameter, naive or with an offset
+    :return: The naive UTC datetime logs are stamped with
+    """
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def to_ndjson(log):
+    return (json.dumps({
+        "id": log.id,
+        "name": log.name,
+        "password": log.password,
+        "timestamp": log.timestamp.isoformat() if log.timestamp else None,
+        "message": log.message,
+        "attributes": log.attributes,
+    }) + "\n").encode()
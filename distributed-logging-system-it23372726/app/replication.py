@@ -1,25 +1,98 @@
-import requests
+import logging
+import os
+import time
+import httpx
 from typing import List
-from app.models import LogDB
 
-# List of backup servers to which logs will be replicated
-BACKUP_SERVERS = ["http://backup-server-1:8000", "http://backup-server-2:8000"]
+from app.metrics import Counter, Histogram
 
-def replicate_log(log: LogDB) -> bool:
-    success = True
-    for server in BACKUP_SERVERS:
+# List of backup servers to which logs will be replicated. An entry may carry its own
+# timeout in seconds, e.g. "http://backup-server-1:8000|0.5"
+BACKUP_SERVERS = [s.strip() for s in os.getenv(
+    "BACKUP_SERVERS", "http://backup-server-1:8000,http://backup-server-2:8000"
+).split(",") if s.strip()]
+REPLICATION_TIMEOUT = float(os.getenv("REPLICATION_TIMEOUT", "2.0"))  # Default per-backup timeout
+REPLICATION_ACK_MODE = os.getenv("REPLICATION_ACK_MODE", "quorum")  # none, one, quorum or all
+
+ACK_MODES = ("none", "one", "quorum", "all")
+
+logger = logging.getLogger(__name__)
+
+REPLICATION_RTT = Histogram("replication_rtt_seconds", "Round trip of one replication batch to a backup", ["backup"])
+REPLICATION_FAILURES = Counter("replication_failures_total", "Replication batches a backup did not store", ["backup"])
+
+
+class Backup:
+    def __init__(self, spec: str, default_timeout: float):
+        url, _, timeout = spec.partition("|")
+        self.url = url.rstrip("/")
+        self.timeout = float(timeout) if timeout else default_timeout
+        self.client = None
+
+    def get_client(self) -> httpx.AsyncClient:
+        # One keep-alive connection pool per backup, created lazily on the running loop
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                base_url=self.url,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_keepalive_connections=10, max_connections=20),
+            )
+        return self.client
+
+
+class Replicator:
+    """
+    Transport to the backup servers and the ack policy applied to client writes.
+
+    :param servers: Backup URLs, optionally suffixed with "|timeout"
+    :param ack_mode: none (fire and forget), one, quorum (majority of primary + backups) or all
+    :param timeout: Default per-backup timeout in seconds
+    """
+
+    def __init__(self, servers: List[str] = None, ack_mode: str = REPLICATION_ACK_MODE,
+                 timeout: float = REPLICATION_TIMEOUT):
+        if ack_mode not in ACK_MODES:
+            raise ValueError(f"Unknown replication ack mode: {ack_mode}")
+        self.backups = [Backup(spec, timeout) for spec in (servers if servers is not None else BACKUP_SERVERS)]
+        self.ack_mode = ack_mode
+
+    def required_acks(self) -> int:
+        n = len(self.backups)
+        if self.ack_mode == "none" or n == 0:
+            return 0
+        if self.ack_mode == "one":
+            return 1
+        if self.ack_mode == "quorum":
+            # The primary already holds the log, so it counts as one vote of n + 1
+            return (n + 1) // 2
+        return n
+
+    async def send_batch(self, backup: Backup, entries: List[dict]) -> bool:
+        """
+        Sends a batch of logs to one backup.
+
+        :return: True if the backup stored the whole batch
+        """
+        started = time.perf_counter()
         try:
-            response = requests.post(f"{server}/logs/", json={
-                "name": log.name,
-                "password": log.password,
-                "timestamp": log.timestamp.isoformat()  # Convert datetime to string
-            })
-            if response.status_code != 201:
-                print(f"Failed to replicate log to {server}")
-                success = False
-        except requests.exceptions.RequestException as e:
-            print(f"Error replicating log to {server}: {e}")
-            success = False
-    return success
+            response = await backup.get_client().post("/replication/logs", json={"entries": entries})
+            REPLICATION_RTT.labels(backup.url).observe(time.perf_counter() - started)
+            if not response.is_success:
+                REPLICATION_FAILURES.labels(backup.url).inc()
+                logger.warning("replication rejected backup=%s logs=%d status=%d",
+                               backup.url, len(entries), response.status_code)
+                return False
+            return True
+        except httpx.HTTPError as e:
+            REPLICATION_FAILURES.labels(backup.url).inc()
+            logger.warning("replication failed backup=%s logs=%d error=%r", backup.url, len(entries), e)
+            return False
+
+    async def close(self):
+        for backup in self.backups:
+            if backup.client is not None:
+                await backup.client.aclose()
+                backup.client = None
 
 
+replicator = Replicator()
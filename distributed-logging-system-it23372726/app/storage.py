@@ -0,0 +1,518 @@
+# app/storage.py
+import asyncio
+import json
+import queue
+import sqlite3
+import threading
+from collections import namedtuple
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
+
+from sqlalchemy import JSON, DateTime, func, insert, literal_column, select, text, tuple_, type_coerce
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from app.database import STORAGE_BACKEND, SQLALCHEMY_DATABASE_URL, SQLITE_BUSY_TIMEOUT_MS, create_engine_from_env, engine
+from app.metrics import Histogram, SIZE_BUCKETS
+from app.models import LOG_TEXT_SEARCH_CONFIG, MESSAGE_TSVECTOR, LogDB
+
+SCAN_PAGE_ROWS = 1000  # Rows per round trip when a scan is streamed
+SQLITE_BATCH_ROWS = 1000  # Rows the SQLite writer commits in one transaction at most
+ID_SEQUENCE_LOCK_KEY = 0x6C6F67735F6964  # Advisory lock taken while the logs id sequence is moved
+SQLITE_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"  # How SQLAlchemy stores DateTime in SQLite, so both can read it
+
+SQLITE_WRITER_BATCH_ROWS = Histogram("sqlite_writer_batch_rows", "Rows committed per SQLite writer transaction",
+                                     buckets=SIZE_BUCKETS)
+
+LOG_TABLE = LogDB.__table__
+LOG_COLUMNS = [column.name for column in LOG_TABLE.columns]
+DATETIME_COLUMNS = {column.name for column in LOG_TABLE.columns if isinstance(column.type, DateTime)}
+JSON_COLUMNS = {column.name for column in LOG_TABLE.columns if isinstance(column.type, JSON)}
+
+# One stored log; backends return these instead of ORM objects so callers never hold a session
+LogRecord = namedtuple("LogRecord", LOG_COLUMNS)
+
+ScanKey = Tuple[datetime, int]  # (timestamp, id) of the last row already seen
+
+# Conditions a scan has to match, None matches any: the exact name, timestamps in [since, until), attributes
+# that contain the given document or have exactly the given values, and messages with every word of text
+LogFilter = namedtuple("LogFilter", ["name", "since", "until", "contains", "equals", "text"],
+                       defaults=[None, None, None, None, None, None])
+
+
+class Explain(Executable, ClauseElement):
+    """
+    EXPLAIN of a query, with the query's parameters bound like when it runs.
+    """
+
+    inherit_cache = False
+
+    def __init__(self, query):
+        self.query = query
+
+
+@compiles(Explain)
+def _compile_explain(element, compiler, **kwargs):
+    prefix = "EXPLAIN QUERY PLAN " if compiler.dialect.name == "sqlite" else "EXPLAIN "
+    return prefix + compiler.process(element.query, **kwargs)
+
+
+class StorageBackend:
+    """
+    Where the rows of the logs table live.
+
+    Logs are scanned in (timestamp, id) order, or the reverse, and ranges are
+    half-open on timestamp. Rows that carry an id replace the row with that
+    id, so a retried replication batch is applied once.
+
+    Attribute and text filters are answered by the JSONB and full-text
+    indexes on Postgres. Elsewhere only top-level attribute values can be
+    matched, and text matches words anywhere in the message.
+    """
+
+    async def insert_batch(self, rows: List[dict], return_ids: bool = True) -> List[int]:
+        """
+        Writes rows in one transaction.
+
+        :return: The ids of the rows in order, or [] when return_ids is False
+        """
+        raise NotImplementedError
+
+    async def scan(self, after: Optional[ScanKey] = None, limit: Optional[int] = None,
+                   where: Optional[LogFilter] = None, descending: bool = False) -> List[LogRecord]:
+        """
+        Logs matching the filter after the (timestamp, id) key, in (timestamp, id) order.
+
+        :param descending: Newest first; the key then bounds the scan from above
+        """
+        raise NotImplementedError
+
+    async def stream(self, after: Optional[ScanKey] = None, where: Optional[LogFilter] = None,
+                     descending: bool = False) -> AsyncIterator[LogRecord]:
+        """
+        Every matching log after the key, fetched a page at a time.
+        """
+        while True:
+            records = await self.scan(after, SCAN_PAGE_ROWS, where, descending)
+            for record in records:
+                yield record
+            if len(records) < SCAN_PAGE_ROWS:
+                return
+            after = (records[-1].timestamp, records[-1].id)
+
+    async def explain(self, after: Optional[ScanKey] = None, limit: Optional[int] = None,
+                      where: Optional[LogFilter] = None, descending: bool = False) -> List[str]:
+        """
+        The database's plan for the same scan, one line per step.
+        """
+        raise NotImplementedError
+
+    async def count(self) -> int:
+        raise NotImplementedError
+
+    async def delete_range(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> int:
+        """
+        Deletes the logs stamped in [start, end).
+
+        :return: Number of deleted logs
+        """
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class PostgresBackend(StorageBackend):
+    """
+    Logs in the database behind an async SQLAlchemy engine.
+
+    Written for Postgres through asyncpg, where id-less batches that need no
+    ids back are loaded with COPY, but any SQLAlchemy database works.
+    """
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+
+    async def insert_batch(self, rows: List[dict], return_ids: bool = True) -> List[int]:
+        if not rows:
+            return []
+        async with self.engine.begin() as conn:
+            dialect = conn.dialect.name
+            if "id" in rows[0]:
+                # Delete and insert rather than ON CONFLICT (id): a partitioned table's
+                # primary key also holds the timestamp, so id alone has no unique index
+                await conn.execute(LOG_TABLE.delete().where(LOG_TABLE.c.id.in_([row["id"] for row in rows])))
+                await conn.execute(insert(LOG_TABLE), rows)
+                if dialect == "postgresql":
+                    # Keep the id sequence ahead of the ids written here in case this node is promoted;
+                    # setval ignores transactions, so writers take turns and never move the sequence back
+                    await conn.execute(select(func.pg_advisory_xact_lock(ID_SEQUENCE_LOCK_KEY)))
+                    await conn.execute(text(
+                        "SELECT setval(pg_get_serial_sequence('logs', 'id'), GREATEST((SELECT MAX(id) FROM logs),"
+                        " pg_sequence_last_value(pg_get_serial_sequence('logs', 'id'))))"
+                    ))
+                return [row["id"] for row in rows]
+            if return_ids:
+                result = await conn.execute(insert(LOG_TABLE).returning(LOG_TABLE.c.id, sort_by_parameter_order=True), rows)
+                return list(result.scalars())
+            driver = (await conn.get_raw_connection()).driver_connection
+            if hasattr(driver, "copy_records_to_table"):
+                columns = list(rows[0])
+                # COPY bypasses the column types, and asyncpg takes JSONB as text
+                records = [tuple(json.dumps(row[column]) if column in JSON_COLUMNS and row[column] is not None
+                                 else row[column] for column in columns) for row in rows]
+                await driver.copy_records_to_table(LOG_TABLE.name, records=records, columns=columns)
+            else:
+                await conn.execute(insert(LOG_TABLE), rows)
+            return []
+
+    def _filter_conditions(self, where: LogFilter) -> list:
+        columns = LOG_TABLE.c
+        conditions = []
+        if where.name is not None:
+            conditions.append(columns.name == where.name)
+        if where.since is not None:
+            conditions.append(columns.timestamp >= where.since)
+        if where.until is not None:
+            conditions.append(columns.timestamp < where.until)
+        if self.engine.dialect.name == "postgresql":
+            attributes = type_coerce(columns.attributes, JSONB)
+            if where.contains:
+                conditions.append(attributes.contains(where.contains))
+            for key, value in (where.equals or {}).items():
+                # Containment finds the rows through the GIN index and is exact for scalars; nested values need both
+                conditions.append(attributes.contains({key: value}))
+                if isinstance(value, (dict, list)):
+                    conditions.append(attributes[key] == type_coerce(value, JSONB))
+            if where.text:
+                tsquery = func.websearch_to_tsquery(literal_column(f"'{LOG_TEXT_SEARCH_CONFIG}'::regconfig"), where.text)
+                conditions.append(literal_column(MESSAGE_TSVECTOR).op("@@")(tsquery))
+            return conditions
+        for key, value in [*(where.contains or {}).items(), *(where.equals or {}).items()]:
+            path = _attribute_path(key, value)
+            if value is None:
+                conditions.append(func.json_type(columns.attributes, path) == "null")
+            else:
+                conditions.append(func.json_extract(columns.attributes, path) == value)
+        conditions += [columns.message.icontains(word, autoescape=True) for word in (where.text or "").split()]
+        return conditions
+
+    def _scan_query(self, after: Optional[ScanKey], limit: Optional[int] = None,
+                    where: Optional[LogFilter] = None, descending: bool = False):
+        timestamp, key = LOG_TABLE.c.timestamp, tuple_(LOG_TABLE.c.timestamp, LOG_TABLE.c.id)
+        if descending:
+            query = select(LOG_TABLE).order_by(timestamp.desc(), LOG_TABLE.c.id.desc())
+        else:
+            query = select(LOG_TABLE).order_by(timestamp, LOG_TABLE.c.id)
+        if where is not None:
+            query = query.where(*self._filter_conditions(where))
+        if after is not None:
+            # The plain bound lets Postgres skip the partitions before the key; the row comparison alone does not
+            if descending:
+                query = query.where(timestamp <= after[0], key < after)
+            else:
+                query = query.where(timestamp >= after[0], key > after)
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
+    async def scan(self, after: Optional[ScanKey] = None, limit: Optional[int] = None,
+                   where: Optional[LogFilter] = None, descending: bool = False) -> List[LogRecord]:
+        async with self.engine.connect() as conn:
+            result = await conn.execute(self._scan_query(after, limit, where, descending))
+            return [LogRecord(*row) for row in result]
+
+    async def stream(self, after: Optional[ScanKey] = None, where: Optional[LogFilter] = None,
+                     descending: bool = False) -> AsyncIterator[LogRecord]:
+        # One server-side cursor instead of a query per page
+        query = self._scan_query(after, None, where, descending).execution_options(yield_per=SCAN_PAGE_ROWS)
+        async with self.engine.connect() as conn:
+            result = await conn.stream(query)
+            async for row in result:
+                yield LogRecord(*row)
+
+    async def explain(self, after: Optional[ScanKey] = None, limit: Optional[int] = None,
+                      where: Optional[LogFilter] = None, descending: bool = False) -> List[str]:
+        async with self.engine.connect() as conn:
+            result = await conn.execute(Explain(self._scan_query(after, limit, where, descending)))
+            return [row[-1] for row in result]
+
+    async def count(self) -> int:
+        async with self.engine.connect() as conn:
+            return await conn.scalar(select(func.count()).select_from(LOG_TABLE))
+
+    async def delete_range(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> int:
+        stmt = LOG_TABLE.delete()
+        if start is not None:
+            stmt = stmt.where(LOG_TABLE.c.timestamp >= start)
+        if end is not None:
+            stmt = stmt.where(LOG_TABLE.c.timestamp < end)
+        async with self.engine.begin() as conn:
+            return (await conn.execute(stmt)).rowcount
+
+
+class _WriteJob:
+    __slots__ = ("run", "rows", "loop", "future")
+
+    def __init__(self, run, rows: int, loop: asyncio.AbstractEventLoop):
+        self.run = run  # Called with the writer's connection
+        self.rows = rows
+        self.loop = loop
+        self.future = loop.create_future()
+
+    def resolve(self, result=None, error: Optional[BaseException] = None):
+        self.loop.call_soon_threadsafe(self._resolve, result, error)
+
+    def _resolve(self, result, error):
+        if self.future.done():  # The caller was cancelled
+            return
+        if error is not None:
+            self.future.set_exception(error)
+        else:
+            self.future.set_result(result)
+
+
+def _to_sqlite(value):
+    if isinstance(value, datetime):
+        return value.strftime(SQLITE_DATETIME_FORMAT)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+def _from_sqlite(name: str, value):
+    if isinstance(value, str):
+        if name in DATETIME_COLUMNS:
+            return datetime.fromisoformat(value)
+        if name in JSON_COLUMNS:
+            return json.loads(value)
+    return value
+
+
+def _record(row) -> LogRecord:
+    return LogRecord(*(_from_sqlite(name, value) for name, value in zip(LOG_COLUMNS, row)))
+
+
+def _attribute_path(key: str, value) -> str:
+    """
+    :return: The JSON path of a top-level attribute for SQLite's json_extract
+    :raises ValueError: If the match needs Postgres' JSONB containment
+    """
+    if isinstance(value, (dict, list)):
+        raise ValueError(f"Matching the nested value of attribute {key!r} needs Postgres")
+    if '"' in key:
+        raise ValueError(f"Matching attribute {key!r} needs Postgres")
+    return f'$."{key}"'
+
+
+class SQLiteWALBackend(StorageBackend):
+    """
+    Logs in a local SQLite file, for nodes that run without a database server.
+
+    All writes go through one thread that commits everything queued at that
+    moment, up to batch_rows rows, in a single transaction, so concurrent
+    requests share one commit instead of taking turns on the file lock. In
+    WAL mode readers do not block the writer; they run in the default
+    executor, each thread on its own connection. synchronous=NORMAL can lose
+    the last commits on power loss, never the file.
+    """
+
+    def __init__(self, path: str, batch_rows: int = SQLITE_BATCH_ROWS):
+        self.path = path
+        self.batch_rows = batch_rows
+        self._jobs: "queue.Queue[Optional[_WriteJob]]" = queue.Queue()  # The running writer's queue
+        self._writer: Optional[threading.Thread] = None
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode; the writer opens its own transactions
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        return conn
+
+    # --- Writer thread ------------------------------------------------------
+
+    def _write_loop(self, jobs: "queue.Queue[Optional[_WriteJob]]"):
+        conn = self._connect()
+        try:
+            stopping = False
+            while not stopping:
+                job = jobs.get()
+                if job is None:
+                    break
+                batch, rows = [job], job.rows
+                while rows < self.batch_rows:
+                    try:
+                        job = jobs.get_nowait()
+                    except queue.Empty:
+                        break
+                    if job is None:
+                        stopping = True
+                        break
+                    batch.append(job)
+                    rows += job.rows
+                self._commit(conn, batch)
+        finally:
+            conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, batch: List[_WriteJob]):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            results = [job.run(conn) for job in batch]
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            if len(batch) > 1:
+                # One bad job must not fail the requests it happened to share a transaction with
+                for job in batch:
+                    self._commit(conn, [job])
+            else:
+                batch[0].resolve(error=e)
+            return
+        rows = sum(job.rows for job in batch)
+        batch[0].loop.call_soon_threadsafe(SQLITE_WRITER_BATCH_ROWS.observe, rows)
+        for job, result in zip(batch, results):
+            job.resolve(result)
+
+    async def _write(self, run, rows: int = 1):
+        if self._writer is None:
+            self._jobs = queue.Queue()
+            self._writer = threading.Thread(target=self._write_loop, args=(self._jobs,), name="sqlite-writer", daemon=True)
+            self._writer.start()
+        job = _WriteJob(run, rows, asyncio.get_running_loop())
+        self._jobs.put(job)
+        return await job.future
+
+    # --- Readers ------------------------------------------------------------
+
+    async def _read(self, run):
+        def read():
+            conn = getattr(self._local, "conn", None)
+            if conn is None:
+                conn = self._local.conn = self._connect()
+                self._readers.append(conn)
+            return run(conn)
+        return await asyncio.to_thread(read)
+
+    # --- Operations ---------------------------------------------------------
+
+    async def insert_batch(self, rows: List[dict], return_ids: bool = True) -> List[int]:
+        if not rows:
+            return []
+        columns = list(rows[0])
+        unknown = set(columns) - set(LOG_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown log columns: {sorted(unknown)}")
+        verb = "INSERT OR REPLACE" if "id" in columns else "INSERT"
+        sql = f"{verb} INTO {LOG_TABLE.name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        params = [tuple(_to_sqlite(row[column]) for column in columns) for row in rows]
+
+        def run(conn: sqlite3.Connection) -> List[int]:
+            if "id" in columns:
+                conn.executemany(sql, params)
+                return [row["id"] for row in rows]
+            if not return_ids:
+                conn.executemany(sql, params)
+                return []
+            return [conn.execute(sql, values).lastrowid for values in params]
+
+        return await self._write(run, len(rows))
+
+    @staticmethod
+    def _scan_sql(after: Optional[ScanKey], limit: Optional[int], where: Optional[LogFilter],
+                  descending: bool) -> Tuple[str, list]:
+        conditions, params = [], []
+        if where is not None:
+            if where.name is not None:
+                conditions.append("name = ?")
+                params.append(where.name)
+            if where.since is not None:
+                conditions.append("timestamp >= ?")
+                params.append(_to_sqlite(where.since))
+            if where.until is not None:
+                conditions.append("timestamp < ?")
+                params.append(_to_sqlite(where.until))
+            for key, value in [*(where.contains or {}).items(), *(where.equals or {}).items()]:
+                if value is None:
+                    conditions.append("json_type(attributes, ?) = 'null'")
+                    params.append(_attribute_path(key, value))
+                else:
+                    conditions.append("json_extract(attributes, ?) = ?")
+                    params += [_attribute_path(key, value), value]
+            for word in (where.text or "").split():
+                conditions.append("message LIKE ? ESCAPE '\\'")
+                params.append("%" + word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        if after is not None:
+            conditions.append("(timestamp, id) < (?, ?)" if descending else "(timestamp, id) > (?, ?)")
+            params += [_to_sqlite(after[0]), after[1]]
+        sql = f"SELECT {', '.join(LOG_COLUMNS)} FROM {LOG_TABLE.name}"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY timestamp DESC, id DESC" if descending else " ORDER BY timestamp, id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return sql, params
+
+    async def scan(self, after: Optional[ScanKey] = None, limit: Optional[int] = None,
+                   where: Optional[LogFilter] = None, descending: bool = False) -> List[LogRecord]:
+        sql, params = self._scan_sql(after, limit, where, descending)
+        return await self._read(lambda conn: [_record(row) for row in conn.execute(sql, params)])
+
+    async def explain(self, after: Optional[ScanKey] = None, limit: Optional[int] = None,
+                      where: Optional[LogFilter] = None, descending: bool = False) -> List[str]:
+        sql, params = self._scan_sql(after, limit, where, descending)
+        return await self._read(lambda conn: [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)])
+
+    async def count(self) -> int:
+        return await self._read(lambda conn: conn.execute(f"SELECT COUNT(*) FROM {LOG_TABLE.name}").fetchone()[0])
+
+    async def delete_range(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> int:
+        sql = f"DELETE FROM {LOG_TABLE.name} WHERE 1=1"
+        params = []
+        if start is not None:
+            sql += " AND timestamp >= ?"
+            params.append(_to_sqlite(start))
+        if end is not None:
+            sql += " AND timestamp < ?"
+            params.append(_to_sqlite(end))
+        return await self._write(lambda conn: conn.execute(sql, params).rowcount)
+
+    async def close(self):
+        """
+        Commits what is queued and stops the writer; a later write starts it again.
+        """
+        if self._writer is not None:
+            # Writes that arrive from now on start a new writer with a queue of its own
+            writer, self._writer = self._writer, None
+            self._jobs.put(None)
+            await asyncio.to_thread(writer.join)
+        for conn in self._readers:
+            conn.close()
+        self._readers.clear()
+        self._local = threading.local()
+
+
+def create_storage(url: Optional[str] = None, backend: str = STORAGE_BACKEND) -> StorageBackend:
+    """
+    The backend named by STORAGE_BACKEND, or the one that matches DATABASE_URL.
+    """
+    target = make_url(url or SQLALCHEMY_DATABASE_URL)
+    backend = backend or ("sqlite" if target.get_backend_name() == "sqlite" else "postgres")
+    if backend == "postgres":
+        return PostgresBackend(create_engine_from_env(url) if url else engine)
+    if backend == "sqlite":
+        if target.get_backend_name() != "sqlite" or target.database in (None, "", ":memory:"):
+            raise ValueError("STORAGE_BACKEND=sqlite needs DATABASE_URL to point at an SQLite file")
+        return SQLiteWALBackend(target.database)
+    raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}, expected postgres or sqlite")
+
+
+storage = create_storage()
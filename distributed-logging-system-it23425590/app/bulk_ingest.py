@@ -0,0 +1,161 @@
+# app/bulk_ingest.py
+import asyncio
+import json
+import os
+
+from app.database import DB_COMMIT_SECONDS
+from app.storage import storage as default_storage
+
+BULK_CHUNK_ROWS = int(os.getenv("BULK_CHUNK_ROWS", "5000"))  # rows per COPY/transaction
+BULK_MAX_LINE_BYTES = int(os.getenv("BULK_MAX_LINE_BYTES", "65536"))
+BULK_MAX_ERRORS = 20  # rejected lines echoed back in the response
+
+COPY_COLUMNS = ["name", "password", "message", "attributes", "timestamp"]
+
+
+class BulkIngestError(Exception):
+    """
+    Raised when a chunk could not be written; carries the chunks already committed.
+    """
+
+    def __init__(self, message, chunks):
+        super().__init__(message)
+        self.chunks = chunks
+
+
+async def iter_lines(byte_stream, max_line=BULK_MAX_LINE_BYTES):
+    """
+    Yield (line_number, bytes) for every line of a chunked body.
+
+    Only the unfinished tail of the body is kept between network chunks, so
+    memory is bounded by the chunk size plus one line. A line longer than
+    max_line is yielded as None once and the rest of it is skipped.
+    """
+    buf = bytearray()
+    line_no = 0
+    discarding = False  # inside an oversized line that was already reported
+    async for chunk in byte_stream:
+        if not chunk:
+            continue
+        if discarding:
+            end = chunk.find(b"\n")
+            if end < 0:
+                continue
+            chunk = chunk[end + 1:]
+            discarding = False
+        buf += chunk
+        start = 0
+        while True:
+            end = buf.find(b"\n", start)
+            if end < 0:
+                break
+            line_no += 1
+            yield line_no, bytes(buf[start:end]) if end - start <= max_line else None
+            start = end + 1
+        del buf[:start]
+        if len(buf) > max_line:
+            line_no += 1
+            yield line_no, None  # oversized line, reported as rejected
+            buf.clear()
+            discarding = True
+    if buf:
+        line_no += 1
+        yield line_no, bytes(buf)
+
+
+def parse_line(line: bytes):
+    """
+    Return (name, password, message, attributes) for a valid NDJSON log line, else raise ValueError.
+    """
+    if line is None:
+        raise ValueError("line too long")
+    doc = json.loads(line)
+    if not isinstance(doc, dict):
+        raise ValueError("expected a JSON object")
+    name, password = doc.get("name"), doc.get("password")
+    if not isinstance(name, str) or not isinstance(password, str):
+        raise ValueError("'name' and 'password' must be strings")
+    message, attributes = doc.get("message"), doc.get("attributes")
+    if message is not None and not isinstance(message, str):
+        raise ValueError("'message' must be a string")
+    if attributes is not None and not isinstance(attributes, dict):
+        raise ValueError("'attributes' must be an object")
+    return name, password, message, attributes
+
+
+async def copy_rows(storage, rows: list):
+    """
+    Write one chunk in its own transaction; the Postgres backend loads it with COPY.
+    """
+    with DB_COMMIT_SECONDS.labels("/logs/bulk").time():
+        await storage.insert_batch([dict(zip(COPY_COLUMNS, row)) for row in rows], return_ids=False)
+
+
+async def ingest_ndjson(byte_stream, clock, chunk_rows=BULK_CHUNK_ROWS, storage=default_storage):
+    """
+    Parse an NDJSON body incrementally and write it to the storage backend in chunks.
+
+    Every row of a chunk is stamped with one clock reading. Parsing of the
+    next chunk overlaps with the write of the previous one, with at most one
+    write in flight.
+    """
+    chunks = []
+    errors = []
+    rows = []
+    rejected = 0
+    pending = None
+
+    async def write(index, chunk, chunk_rejected):
+        await copy_rows(storage, chunk)
+        chunks.append({"chunk": index, "accepted": len(chunk), "rejected": chunk_rejected})
+
+    async def submit(chunk, chunk_rejected):
+        nonlocal pending
+        if pending is not None:
+            await finish()
+        pending = asyncio.create_task(write(len(chunks), chunk, chunk_rejected))
+
+    async def finish():
+        nonlocal pending
+        task, pending = pending, None
+        try:
+            await task
+        except Exception as e:
+            raise BulkIngestError(f"Chunk {len(chunks)} failed: {e}", chunks) from e
+
+    try:
+        async for line_no, line in iter_lines(byte_stream):
+            if line is not None and not line.strip():
+                continue
+            try:
+                rows.append(parse_line(line))
+            except ValueError as e:  # json.JSONDecodeError is a ValueError
+                rejected += 1
+                if len(errors) < BULK_MAX_ERRORS:
+                    errors.append({"line": line_no, "error": str(e)})
+                continue
+            if len(rows) >= chunk_rows:
+                ts = clock.now()
+                await submit([(*fields, ts) for fields in rows], rejected)
+                rows, rejected = [], 0
+    except BaseException:
+        # the body broke off; let the chunk already handed over finish instead of orphaning its write
+        if pending is not None:
+            await asyncio.gather(pending, return_exceptions=True)
+        raise
+
+    if rows:
+        ts = clock.now()
+        await submit([(*fields, ts) for fields in rows], rejected)
+    elif rejected:
+        chunks.append({"chunk": len(chunks) + (pending is not None), "accepted": 0, "rejected": rejected})
+    if pending is not None:
+        await finish()
+
+    chunks.sort(key=lambda c: c["chunk"])
+    return {
+        "accepted": sum(c["accepted"] for c in chunks),
+        "rejected": sum(c["rejected"] for c in chunks),
+        "chunks": chunks,
+        "errors": errors,
+    }
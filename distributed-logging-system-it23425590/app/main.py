@@ -1,23 +1,39 @@
-from fastapi import FastAPI, Request, HTTPException, status, Depends
+from fastapi import FastAPI, Request, Response, HTTPException, status, Depends, Query
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, Field
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from datetime import datetime
 from pathlib import Path
-from typing import List
+from typing import Any, Dict, List, Literal, Optional
+import logging
 import os
-from utils.ntp_sync import analyze_clock_skew
-
-from utils.ntp_sync import sync_time
+import time
+from utils.ntp_sync import clock
 from app.models import LogDB
-from app.database import Base, engine, SessionLocal
+from app.database import SessionLocal, DB_COMMIT_SECONDS, create_tables
+from app.metrics import REGISTRY, CONTENT_TYPE, Histogram
 from app.time_sync_service import TimeSyncService
+from app.bulk_ingest import ingest_ndjson, BulkIngestError
+from app.order_check import OrderChecker
+from app.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, encode_cursor, to_ndjson, to_utc
+from app.storage import LogFilter, storage
+from app.partitions import partitions
+
+# Leveled logging instead of prints; LOG_LEVEL=DEBUG for per-log detail
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(),
+                    format="%(asctime)s %(levelname)s %(name)s %(message)s")
+logger = logging.getLogger(__name__)
+
+INGEST_SECONDS = Histogram("log_ingest_seconds", "Time to accept a request that writes logs", ["path"])
 
 app = FastAPI()
-sync_service = TimeSyncService()
+sync_service = TimeSyncService(clock=clock)
+order_checker = OrderChecker()
+REGISTRY.add_collector(sync_service.collect_metrics)
 
 # Dependency to get DB session
 async def get_db():
@@ -27,9 +43,22 @@ async def get_db():
 # Ensure tables are created on startup
 @app.on_event("startup")
 async def on_startup():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    print("[STARTUP] Tables created and system synced.")
+    await partitions.create_table()
+    await create_tables()
+    await clock.refresh()
+    clock.start()
+    # partitions for the coming intervals have to exist before the first write
+    await partitions.maintain()
+    partitions.start()
+    sync_service.start()
+    logger.info("startup complete, tables created and clock synced")
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await partitions.stop()
+    await sync_service.stop()
+    await clock.stop()
+    await storage.close()
 
 # Setup templates and static directories
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -43,6 +72,8 @@ templates = Jinja2Templates(directory=TEMPLATES_DIR)
 class Log(BaseModel):
     name: str
     password: str
+    message: Optional[str] = None
+    attributes: Optional[Dict[str, Any]] = None  # structured context, e.g. {"request_id": "...", "level": "error"}
     class Config:
         orm_mode = True
 
@@ -53,24 +84,113 @@ class LogRead(Log):
     id: int
     timestamp: datetime
 
+class LogSearch(BaseModel):
+    name: Optional[str] = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    contains: Optional[Dict[str, Any]] = None  # document the attributes must contain, nested values included
+    equals: Optional[Dict[str, Any]] = None  # attributes that must have exactly these values
+    text: Optional[str] = None  # full-text query on the message
+    order: Literal["asc", "desc"] = "asc"
+    limit: int = Field(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+    cursor: Optional[str] = None
+
 # Frontend
 @app.get("/", include_in_schema=False)
 async def read_root(request: Request):
     return templates.TemplateResponse("logs.html", {"request": request})
 
+def make_filter(name=None, since=None, until=None, **attributes):
+    """
+    Storage filter with times in the naive UTC logs are stamped with.
+    """
+    where = LogFilter(name, to_utc(since), to_utc(until), **attributes)
+    if where.since and where.until and where.since >= where.until:
+        raise HTTPException(status_code=400, detail="since must be before until")
+    return where
+
+async def stream_logs(after, where, descending):
+    async for log in storage.stream(after, where, descending):
+        yield to_ndjson(log)
+
 @app.get("/logs/", response_model=List[LogRead])
-async def get_logs(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(LogDB).order_by(LogDB.timestamp))
-    return result.scalars().all()
+async def get_logs(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    name: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    order: Literal["asc", "desc"] = "asc",
+):
+    """
+    One page of logs in (timestamp, id) order, or newest first with order=desc;
+    X-Next-Cursor points at the next page, which takes the same filters.
+    name, since and until (exclusive) are answered from the (name, timestamp)
+    and (timestamp, id) indexes. With stream=true every matching log after the
+    cursor is sent as NDJSON instead.
+    """
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    where = make_filter(name, since, until)
+    descending = order == "desc"
+    if stream:
+        return StreamingResponse(stream_logs(after, where, descending), media_type="application/x-ndjson")
+
+    logs = await storage.scan(after, limit, where, descending)
+    if len(logs) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(logs[-1])
+    return logs
 
 @app.post("/logs/", response_model=LogRead)
-async def create_log(log: Log, db: AsyncSession = Depends(get_db)):
-    ts = sync_time() or datetime.utcnow()
-    new_log = LogDB(name=log.name, password=log.password, timestamp=ts)
-    db.add(new_log)
-    await db.commit()
-    await db.refresh(new_log)
-    return new_log
+async def create_log(log: Log):
+    started = time.perf_counter()
+    row = {"name": log.name, "password": log.password, "message": log.message, "attributes": log.attributes,
+           "timestamp": clock.now()}
+    with DB_COMMIT_SECONDS.labels("/logs/").time():
+        [log_id] = await storage.insert_batch([row])
+    INGEST_SECONDS.labels("/logs/").observe(time.perf_counter() - started)
+    return LogRead(id=log_id, **row)
+
+@app.post("/logs/search", response_model=List[LogRead])
+async def search_logs(search: LogSearch, response: Response):
+    """
+    One page of the logs whose attributes contain or equal the given values
+    and whose message matches the text query, with the filters and paging of
+    GET /logs/. On Postgres the attribute and text predicates are answered by
+    the GIN indexes.
+    """
+    try:
+        after = decode_cursor(search.cursor) if search.cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    where = make_filter(search.name, search.since, search.until,
+                        contains=search.contains, equals=search.equals, text=search.text)
+    try:
+        logs = await storage.scan(after, search.limit, where, search.order == "desc")
+    except ValueError as e:
+        # a match the database cannot express, e.g. nested attribute values outside Postgres
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(logs) == search.limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(logs[-1])
+    return logs
+
+@app.post("/logs/bulk")
+async def create_logs_bulk(request: Request):
+    """
+    Ingest a (chunked) NDJSON body of {"name": ..., "password": ...} lines,
+    optionally with "message" and "attributes".
+    """
+    started = time.perf_counter()
+    try:
+        result = await ingest_ndjson(request.stream(), clock)
+        INGEST_SECONDS.labels("/logs/bulk").observe(time.perf_counter() - started)
+        return result
+    except BulkIngestError as e:
+        raise HTTPException(status_code=500, detail={"error": str(e), "chunks": e.chunks})
 
 @app.put("/logs/{log_id}", response_model=LogRead)
 async def update_log(log_id: int, updated_log: Log, db: AsyncSession = Depends(get_db)):
@@ -81,6 +201,8 @@ async def update_log(log_id: int, updated_log: Log, db: AsyncSession = Depends(g
 
     db_log.name = updated_log.name
     db_log.password = updated_log.password
+    db_log.message = updated_log.message
+    db_log.attributes = updated_log.attributes
     await db.commit()
     await db.refresh(db_log)
     return db_log
@@ -96,13 +218,25 @@ async def delete_log(log_id: int, db: AsyncSession = Depends(get_db)):
     return None
 
 @app.get("/logs/check-order/")
-async def check_order(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(LogDB).order_by(LogDB.id))
-    logs = result.scalars().all()
-    timestamps = [log.timestamp for log in logs]
-    if timestamps != sorted(timestamps):
-        return JSONResponse(content={"warning": "\u26a0 Out-of-order logs detected!"})
-    return {"status": "All logs are in order"}
+async def check_order(
+    from_id: Optional[int] = None,
+    to_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    incremental: bool = False,
+    db: AsyncSession = Depends(get_db),
+):
+    try:
+        report = await order_checker.check(db, from_id, to_id, to_utc(since), to_utc(until), incremental)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if report["out_of_order"]:
+        return JSONResponse(content=jsonable_encoder({"warning": "\u26a0 Out-of-order logs detected!", **report}))
+    return {"status": "All logs are in order", **report}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
 
 @app.get("/status")
 async def index():
@@ -110,16 +244,25 @@ async def index():
 
 @app.get("/clock-skew/")
 async def get_clock_skew():
-    skew = analyze_clock_skew()
+    skew = clock.skew()
     if skew is None:
         raise HTTPException(status_code=500, detail="Failed to analyze clock skew")
-    return {"skew_seconds": skew}
+    return {"skew_seconds": skew, "last_sync": clock.last_sync, "servers": clock.servers}
 
 @app.post("/flush-delay/")
 async def set_flush_delay(seconds: int):
     sync_service.update_flush_delay(seconds)
     return {"message": f"Flush delay updated to {seconds} seconds"}
 
+@app.post("/flush-batch/")
+async def set_flush_batch(batch_size: int = None, max_latency: float = None):
+    sync_service.update_batch_limits(batch_size, max_latency)
+    return {"batch_size": sync_service.batch_size, "max_latency": sync_service.max_latency}
+
+@app.get("/reorder-stats/")
+async def get_reorder_stats():
+    return sync_service.stats()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,47 @@
+# app/pagination.py
+import base64
+import json
+from datetime import datetime, timezone
+from typing import Optional
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(log) -> str:
+    """
+    Opaque cursor pointing just after the given row in (timestamp, id) order.
+    """
+    raw = f"{log.timestamp.isoformat()}|{log.id}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str):
+    """
+    Return (timestamp, id) from a cursor, or raise ValueError if it is malformed.
+    """
+    try:
+        timestamp, log_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def to_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """
+    The naive UTC datetime logs are stamped with, from a query parameter with or without an offset.
+    """
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def to_ndjson(log) -> bytes:
+    return (json.dumps({
+        "id": log.id,
+        "name": log.name,
+        "password": log.password,
+        "timestamp": log.timestamp.isoformat() if log.timestamp else None,
+        "message": log.message,
+        "attributes": log.attributes,
+    }) + "\n").encode()
@@ -0,0 +1,217 @@
+# app/partitions.py
+import asyncio
+import logging
+import os
+import re
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.schema import CreateTable
+
+from app.database import engine as default_engine
+from app.metrics import Counter, Gauge
+from app.models import LogDB
+from app.storage import storage as default_storage
+from utils.ntp_sync import clock as default_clock
+
+LOG_PARTITION_INTERVAL = os.getenv("LOG_PARTITION_INTERVAL", "day")  # day, hour, or none for a plain table
+LOG_PARTITIONS_AHEAD = int(os.getenv("LOG_PARTITIONS_AHEAD", "3"))  # future partitions kept ready
+LOG_RETENTION_DAYS = float(os.getenv("LOG_RETENTION_DAYS", "0"))  # logs older than this are purged, 0 keeps all
+PARTITION_MAINTENANCE_INTERVAL = float(os.getenv("PARTITION_MAINTENANCE_INTERVAL", "300"))  # seconds between runs
+
+# Interval: (partition width, name suffix format); the suffix is the partition's first instant
+INTERVALS = {"day": (timedelta(days=1), "%Y%m%d"), "hour": (timedelta(hours=1), "%Y%m%d%H")}
+PARTITION_NAME = re.compile(r"^logs_p(\d{8}|\d{10})$")
+DEFAULT_PARTITION = "logs_default"
+
+logger = logging.getLogger(__name__)
+
+LOG_PARTITIONS = Gauge("log_partitions", "Time partitions of the logs table")
+RETENTION_DROPPED = Counter("retention_dropped_partitions_total", "Log partitions dropped by the retention policy")
+RETENTION_DELETED = Counter("retention_deleted_rows_total", "Logs deleted row by row by the retention policy")
+
+
+def partition_bounds(name: str) -> Optional[Tuple[datetime, datetime]]:
+    """
+    :param name: Table name of a partition
+    :return: The [start, end) timestamp range it holds, or None if it is not a time partition
+    """
+    match = PARTITION_NAME.match(name)
+    if match is None:
+        return None
+    suffix = match.group(1)
+    step, name_format = INTERVALS["day" if len(suffix) == 8 else "hour"]
+    start = datetime.strptime(suffix, name_format)
+    return start, start + step
+
+
+class PartitionManager:
+    """
+    Keeps the logs table split into day or hour partitions on timestamp and enforces retention.
+
+    On Postgres logs is created as a range partitioned table, so queries with a
+    timestamp filter only touch the partitions in range and every partition
+    has its own small indexes. The partitions for the next `ahead` intervals
+    are created in advance; rows outside every partition land in logs_default.
+    Retention drops whole partitions once all their rows are too old, which
+    is a metadata change instead of a DELETE that leaves dead rows to vacuum.
+
+    Other databases, or a logs table created unpartitioned before, keep a plain
+    table and retention deletes the old rows through the storage backend.
+    """
+
+    def __init__(self, engine=default_engine, storage=default_storage, clock=default_clock,
+                 interval: str = LOG_PARTITION_INTERVAL, ahead: int = LOG_PARTITIONS_AHEAD,
+                 retention_days: float = LOG_RETENTION_DAYS):
+        if interval != "none" and interval not in INTERVALS:
+            raise ValueError(f"Unknown LOG_PARTITION_INTERVAL {interval!r}, expected day, hour or none")
+        self.engine = engine
+        self.storage = storage
+        self.clock = clock
+        self.interval = interval
+        self.ahead = ahead
+        self.retention_days = retention_days
+        self.partitioned = False  # set once the logs table is known to be partitioned
+        self._task = None
+
+    # --- Schema -------------------------------------------------------------
+
+    async def create_table(self):
+        """
+        Creates logs as a partitioned table on Postgres. Runs before create_all, which then skips it.
+        """
+        if self.interval == "none":
+            return
+        async with self.engine.begin() as conn:
+            if conn.dialect.name != "postgresql":
+                return
+            kind = await conn.scalar(text("SELECT relkind::text FROM pg_class WHERE oid = to_regclass('logs')"))
+            if kind is None:
+                await conn.run_sync(self._create_partitioned)
+                kind = "p"
+            elif kind != "p":
+                logger.warning("logs table is not partitioned, retention will delete rows instead")
+        self.partitioned = kind == "p"
+
+    @staticmethod
+    def _create_partitioned(conn):
+        table = LogDB.__table__
+        ddl = str(CreateTable(table).compile(dialect=conn.dialect))
+        # A unique key of a partitioned table has to contain the partition key
+        if "PRIMARY KEY (id)" not in ddl:
+            raise RuntimeError("Unexpected primary key in the logs table definition")
+        ddl = ddl.replace("PRIMARY KEY (id)", "PRIMARY KEY (id, timestamp)").rstrip() + " PARTITION BY RANGE (timestamp)"
+        conn.exec_driver_sql(ddl)
+        conn.exec_driver_sql(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF logs DEFAULT")
+        # Indexes on the parent are created on every partition, present and future
+        for index in table.indexes:
+            index.create(conn)
+
+    async def _partitions(self, conn) -> List[str]:
+        result = await conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = 'logs'::regclass"
+        ))
+        return [name for name in result.scalars() if PARTITION_NAME.match(name)]
+
+    async def _create_ahead(self, now: datetime) -> List[str]:
+        step, name_format = INTERVALS[self.interval]
+        start = now.replace(minute=0, second=0, microsecond=0)
+        if self.interval == "day":
+            start = start.replace(hour=0)
+        created = []
+        async with self.engine.connect() as conn:
+            existing = set(await self._partitions(conn))
+        for i in range(self.ahead + 1):
+            lower = start + i * step
+            name = f"logs_p{lower.strftime(name_format)}"
+            if name in existing:
+                continue
+            try:
+                async with self.engine.begin() as conn:
+                    # Bounds are computed here, never taken from a request
+                    await conn.execute(text(
+                        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF logs "
+                        f"FOR VALUES FROM ('{lower.isoformat(sep=' ')}') TO ('{(lower + step).isoformat(sep=' ')}')"
+                    ))
+                created.append(name)
+            except Exception as e:
+                # E.g. logs_default already holds rows of that range; they stay readable there
+                logger.warning("partition not created name=%s error=%r", name, e)
+        return created
+
+    # --- Retention ----------------------------------------------------------
+
+    async def _drop_before(self, cutoff: datetime) -> List[str]:
+        dropped = []
+        async with self.engine.connect() as conn:
+            names = await self._partitions(conn)
+        for name in sorted(names):
+            if partition_bounds(name)[1] > cutoff:
+                continue
+            async with self.engine.begin() as conn:
+                await conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+            dropped.append(name)
+            RETENTION_DROPPED.inc()
+        LOG_PARTITIONS.set(len(names) - len(dropped))
+        return dropped
+
+    async def _delete_before(self, cutoff: datetime) -> int:
+        if not self.partitioned:
+            deleted = await self.storage.delete_range(None, cutoff)
+        else:
+            # Only rows that fell outside every partition need a DELETE
+            async with self.engine.begin() as conn:
+                result = await conn.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE timestamp < :cutoff"),
+                                            {"cutoff": cutoff})
+                deleted = result.rowcount
+        RETENTION_DELETED.inc(deleted)
+        return deleted
+
+    async def maintain(self) -> dict:
+        """
+        Creates the upcoming partitions and purges what the retention policy expired.
+
+        :return: Names of the created and dropped partitions and the number of deleted rows
+        """
+        now = self.clock.now()
+        report = {"created": [], "dropped": [], "deleted": 0}
+        if self.partitioned:
+            report["created"] = await self._create_ahead(now)
+        if self.retention_days > 0:
+            cutoff = now - timedelta(days=self.retention_days)
+            if self.partitioned:
+                report["dropped"] = await self._drop_before(cutoff)
+            report["deleted"] = await self._delete_before(cutoff)
+        elif self.partitioned:
+            async with self.engine.connect() as conn:
+                LOG_PARTITIONS.set(len(await self._partitions(conn)))
+        if report["created"] or report["dropped"] or report["deleted"]:
+            logger.info("partition maintenance created=%s dropped=%s deleted=%d",
+                        report["created"], report["dropped"], report["deleted"])
+        return report
+
+    async def _maintenance_loop(self):
+        while True:
+            await asyncio.sleep(PARTITION_MAINTENANCE_INTERVAL)
+            try:
+                await self.maintain()
+            except Exception as e:
+                logger.warning("partition maintenance failed, will retry error=%r", e)
+
+    def start(self):
+        """
+        Runs maintain() every PARTITION_MAINTENANCE_INTERVAL seconds; call maintain() once before.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._maintenance_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+partitions = PartitionManager()
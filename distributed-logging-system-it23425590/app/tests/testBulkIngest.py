@@ -0,0 +1,59 @@
+import asyncio
+from datetime import datetime
+import pytest
+from app.bulk_ingest import ingest_ndjson, iter_lines
+
+
+class FakeClock:
+    def now(self):
+        return datetime(2024, 1, 1)
+
+
+class FakeStorage:
+    def __init__(self, delay=0):
+        self.rows = []
+        self.delay = delay
+
+    async def insert_batch(self, rows, return_ids=True):
+        await asyncio.sleep(self.delay)
+        self.rows += rows
+        return []
+
+
+async def body(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+@pytest.mark.asyncio
+async def test_oversized_line_spanning_chunks_is_rejected_once():
+    chunks = [b'{"name":"a","password":"p"}\n{"name":"', b"x" * 40, b"y" * 40, b'z"}\n{"name":"b","password":"p"}\n']
+    lines = [(line_no, line) async for line_no, line in iter_lines(body(*chunks), max_line=32)]
+    assert lines == [(1, b'{"name":"a","password":"p"}'), (2, None), (3, b'{"name":"b","password":"p"}')]
+
+
+@pytest.mark.asyncio
+async def test_long_line_within_one_chunk_is_rejected():
+    lines = [line async for _, line in iter_lines(body(b"x" * 20 + b"\nok\n"), max_line=16)]
+    assert lines == [None, b"ok"]
+
+
+@pytest.mark.asyncio
+async def test_rejected_lines_keep_their_numbers():
+    chunks = [b'{"name":"a","password":"p"}\n', b"{" * 70000, b"{" * 70000, b'\n{"bad"\n{"name":"b","password":"p"}\n']
+    result = await ingest_ndjson(body(*chunks), FakeClock(), storage=FakeStorage())
+    assert (result["accepted"], result["rejected"]) == (2, 2)
+    assert [error["line"] for error in result["errors"]] == [2, 3]
+
+
+@pytest.mark.asyncio
+async def test_pending_write_finishes_when_the_body_breaks_off():
+    async def broken():
+        yield b'{"name":"a","password":"p"}\n'
+        await asyncio.sleep(0)
+        raise ConnectionError("client went away")
+
+    storage = FakeStorage(delay=0.01)
+    with pytest.raises(ConnectionError):
+        await ingest_ndjson(broken(), FakeClock(), chunk_rows=1, storage=storage)
+    assert [row["name"] for row in storage.rows] == ["a"]
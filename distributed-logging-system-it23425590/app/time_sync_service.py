@@ -1,75 +1,241 @@
 import heapq
 import asyncio
-from datetime import datetime, timedelta
-from sqlalchemy.ext.asyncio import AsyncSession
+import itertools
+import logging
+import os
+import time
+from datetime import timedelta
 
-from app.models import LogDB
-from utils.ntp_sync import analyze_clock_skew
+from app.database import DB_COMMIT_SECONDS
+from app.storage import storage as default_storage
+from app.metrics import Counter, Gauge, Histogram, SIZE_BUCKETS
+from utils.ntp_sync import clock as default_clock
+
+FLUSH_BATCH_SIZE = int(os.getenv("FLUSH_BATCH_SIZE", "500"))  # rows per INSERT/transaction
+FLUSH_MAX_LATENCY = float(os.getenv("FLUSH_MAX_LATENCY", "0.5"))  # seconds one flush may keep draining
+REORDER_CHECK_INTERVAL = float(os.getenv("REORDER_CHECK_INTERVAL", "0.1"))  # seconds between watermark checks
+REORDER_MAX_BUFFER = int(os.getenv("REORDER_MAX_BUFFER", "100000"))  # entries held for reordering
+
+logger = logging.getLogger(__name__)
+
+FLUSH_BATCH_ROWS = Histogram("reorder_flush_batch_rows", "Rows written per reorder flush transaction",
+                             buckets=SIZE_BUCKETS)
+REORDER_BUFFER_DEPTH = Gauge("reorder_buffer_depth", "Logs waiting in the reorder buffer")
+REORDER_LATE_ARRIVALS = Counter("reorder_late_arrivals_total", "Logs older than what was already written")
+REORDER_OVERFLOWED = Counter("reorder_overflowed_total", "Logs written early because the buffer was full")
 
 class TimeSyncService:
-    def _init_(self, flush_delay=1):
+    def __init__(self, flush_delay=1, clock=None, batch_size=FLUSH_BATCH_SIZE,
+                 max_latency=FLUSH_MAX_LATENCY, max_buffer=REORDER_MAX_BUFFER,
+                 check_interval=REORDER_CHECK_INTERVAL, storage=default_storage):
         self.log_buffer = []
         self.lock = asyncio.Lock()
         self.flush_delay = flush_delay  # Default flush delay in seconds
+        self.clock = clock or default_clock
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.max_buffer = max_buffer
+        self.check_interval = check_interval
+        self.storage = storage
+        self._seq = itertools.count()  # tie breaker so equal timestamps never compare dicts
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+        # Reorder statistics
+        self.emitted_until = None  # newest timestamp already written
+        self.emitted = 0
+        self.late_arrivals = 0  # logs older than what was already written
+        self.overflowed = 0  # logs written early because the buffer was full
 
     def update_flush_delay(self, new_delay: int):
         """
         Update the delay used for flushing logs.
         """
         self.flush_delay = new_delay
-        print(f"[CONFIG] Flush delay updated to {new_delay} seconds")
+        logger.info("flush delay updated seconds=%s", new_delay)
+
+    def update_batch_limits(self, batch_size: int = None, max_latency: float = None):
+        """
+        Update the rows-per-transaction and max flush latency limits.
+        """
+        if batch_size is not None:
+            self.batch_size = max(1, batch_size)
+        if max_latency is not None:
+            self.max_latency = max_latency
+        logger.info("flush limits updated batch_size=%s max_latency=%s", self.batch_size, self.max_latency)
+
+    def watermark(self):
+        """
+        Logs stamped before this instant are old enough to be written.
+        """
+        return self.clock.now() - timedelta(seconds=self.flush_delay)
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self.log_buffer),
+            "emitted": self.emitted,
+            "late_arrivals": self.late_arrivals,
+            "overflowed": self.overflowed,
+            "emitted_until": self.emitted_until,
+            "flush_delay": self.flush_delay,
+        }
+
+    def collect_metrics(self):
+        """
+        Update the reorder buffer gauge; called when /metrics is scraped.
+        """
+        REORDER_BUFFER_DEPTH.set(len(self.log_buffer))
 
     async def receive_log(self, log_entry: dict):
         """
         Buffer the log entry based on its timestamp (for reordering).
         """
         async with self.lock:
-            heapq.heappush(self.log_buffer, (log_entry['timestamp'], log_entry))
-            print(f"[BUFFER] Received log with timestamp: {log_entry['timestamp']}")
+            if self.emitted_until is not None and log_entry['timestamp'] < self.emitted_until:
+                self.late_arrivals += 1
+                REORDER_LATE_ARRIVALS.inc()
+                logger.debug("late log timestamp=%s", log_entry['timestamp'])
+            heapq.heappush(self.log_buffer, (log_entry['timestamp'], next(self._seq), log_entry))
+            overfull = len(self.log_buffer) > self.max_buffer
+
+        if overfull:
+            self._wakeup.set()
 
-    async def flush_logs(self, db: AsyncSession):
+    async def drain_batch(self, watermark=None) -> list:
         """
-        Flush all buffered logs to the database in sorted order.
+        Pop up to batch_size buffered logs in timestamp order.
+
+        With a watermark only logs stamped before it are popped, unless the
+        buffer is over max_buffer, in which case the oldest logs go out early.
         """
+        batch = []
         async with self.lock:
-            while self.log_buffer:
-                _, log_entry = heapq.heappop(self.log_buffer)
-                await self.store_log(log_entry, db)
-            print("[FLUSH] Log buffer flushed to DB")
+            while self.log_buffer and len(batch) < self.batch_size:
+                timestamp = self.log_buffer[0][0]
+                if watermark is not None and timestamp >= watermark:
+                    if len(self.log_buffer) <= self.max_buffer:
+                        break
+                    self.overflowed += 1
+                    REORDER_OVERFLOWED.inc()
+                batch.append(heapq.heappop(self.log_buffer)[2])
+            if batch:
+                self.emitted += len(batch)
+                newest = batch[-1]['timestamp']
+                if self.emitted_until is None or newest > self.emitted_until:
+                    self.emitted_until = newest
+        return batch
 
-    async def store_log(self, log_entry: dict, db: AsyncSession):
+    async def requeue(self, batch: list, emitted_until=None):
         """
-        Persist a single log entry to the database.
+        Put a batch that failed to store back into the buffer.
+
+        emitted_until is the watermark from before the batch was drained, so
+        its logs are written again in order instead of counting as late.
         """
-        db_log = LogDB(**log_entry)
-        db.add(db_log)
-        await db.commit()
-        await db.refresh(db_log)
-        print(f"[STORE] Log stored: {db_log}")
+        async with self.lock:
+            self.emitted -= len(batch)
+            self.emitted_until = emitted_until
+            for log_entry in batch:
+                heapq.heappush(self.log_buffer, (log_entry['timestamp'], next(self._seq), log_entry))
+
+    async def flush_logs(self, watermark=None, max_latency=None):
+        """
+        Flush buffered logs to storage in sorted order, one transaction per batch.
+
+        The buffer lock is only held while a batch is popped, so new logs keep
+        buffering during the database round trip. With max_latency a flush
+        stops after that many seconds and leaves the rest to the next one.
+        """
+        deadline = time.monotonic() + max_latency if max_latency is not None else None
+        rows = 0
+        while True:
+            emitted_until = self.emitted_until
+            batch = await self.drain_batch(watermark)
+            if not batch:
+                break
+            try:
+                await self.store_batch(batch)
+            except Exception:
+                await self.requeue(batch, emitted_until)
+                raise
+            rows += len(batch)
+            if deadline is not None and time.monotonic() >= deadline:
+                # the reorder stage comes straight back for the rest
+                self._wakeup.set()
+                break
+        if rows:
+            logger.debug("flushed rows=%d", rows)
+        return rows
 
-    async def process_incoming_log(self, log_data: dict, db: AsyncSession):
+    async def store_batch(self, batch: list):
+        """
+        Persist a batch of log entries in a single transaction.
+        """
+        with DB_COMMIT_SECONDS.labels("reorder").time():
+            await self.storage.insert_batch(batch, return_ids=False)
+        FLUSH_BATCH_ROWS.observe(len(batch))
+
+    async def store_log(self, log_entry: dict):
+        """
+        Persist a single log entry to storage.
+        """
+        await self.store_batch([log_entry])
+        logger.debug("log stored name=%s timestamp=%s", log_entry['name'], log_entry['timestamp'])
+
+    async def process_incoming_log(self, log_data: dict):
         """
         Process an incoming log by correcting timestamp using clock skew.
+
+        The log is only buffered here; the reorder stage writes it once the
+        watermark has passed its timestamp.
         """
-        skew = analyze_clock_skew() or 0  # fallback: assume 0 skew if error
-        corrected_time = datetime.utcnow() + timedelta(seconds=skew)
+        corrected_time = log_data.get('timestamp') or self.clock.now()
+        skew = self.clock.offset
 
         log_entry = {
             'name': log_data['name'],
             'password': log_data['password'],
+            'message': log_data.get('message'),
+            'attributes': log_data.get('attributes'),
             'timestamp': corrected_time
         }
 
-        print(f"[PROCESS] Corrected timestamp: {corrected_time} (skew: {skew:.6f} sec)")
+        logger.debug("timestamp corrected time=%s skew=%.6f", corrected_time, skew)
         await self.receive_log(log_entry)
 
-        # Trigger delayed flush with configured delay
-        asyncio.create_task(self.delayed_flush(db, self.flush_delay))
+    async def _reorder_loop(self):
+        """
+        Every check_interval seconds write everything older than the watermark.
+        """
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.check_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if not self.log_buffer:
+                continue
+            try:
+                await self.flush_logs(self.watermark(), self.max_latency)
+            except Exception as e:
+                logger.warning("flush failed, will retry error=%r", e)
+
+    def start(self):
+        """
+        Start the reorder stage on the running event loop.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._reorder_loop())
 
-    async def delayed_flush(self, db: AsyncSession, delay: int):
+    async def stop(self):
         """
-        Wait for delay seconds before flushing buffered logs.
+        Stop the reorder stage and write whatever is still buffered.
         """
-        print(f"[DELAY] Waiting {delay} seconds before flush")
-        await asyncio.sleep(delay)
-        await self.flush_logs(db)
\ No newline at end of file
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush_logs()
@@ -1,7 +1,26 @@
 # utils/ntp_sync.py
+import asyncio
+import logging
+import os
+import time
 import ntplib
 from datetime import datetime
 
+from app.metrics import Gauge, Histogram
+
+# Comma separated list of NTP servers queried on every refresh
+NTP_SERVERS = [s.strip() for s in os.getenv("NTP_SERVERS", "pool.ntp.org").split(",") if s.strip()]
+NTP_SYNC_INTERVAL = float(os.getenv("NTP_SYNC_INTERVAL", "64"))  # seconds between refreshes
+NTP_TIMEOUT = float(os.getenv("NTP_TIMEOUT", "2"))  # seconds per NTP request
+NTP_SMOOTHING = float(os.getenv("NTP_SMOOTHING", "0.25"))  # EWMA weight of a new sample
+
+logger = logging.getLogger(__name__)
+
+NTP_QUERY_SECONDS = Histogram("ntp_query_seconds", "Time to get an answer from an NTP server", ["server"])
+CLOCK_SKEW_SECONDS = Histogram("clock_skew_seconds", "Absolute local clock offset seen in each NTP sample",
+                               buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
+CLOCK_OFFSET_SECONDS = Gauge("clock_offset_seconds", "Smoothed NTP minus local clock offset")
+
 def sync_time(ntp_server="pool.ntp.org"):
     """
     Synchronizes with NTP and returns UTC datetime.
@@ -10,10 +29,10 @@ def sync_time(ntp_server="pool.ntp.org"):
         client = ntplib.NTPClient()
         response = client.request(ntp_server, version=3)
         synchronized_time = datetime.utcfromtimestamp(response.tx_time)
-        print(f"[SYNC] Synchronized Time: {synchronized_time}")
+        logger.info("time synchronized server=%s time=%s", ntp_server, synchronized_time)
         return synchronized_time
     except Exception as e:
-        print(f"[SYNC] NTP sync failed: {e}")
+        logger.warning("ntp sync failed server=%s error=%s", ntp_server, e)
         return datetime.utcnow()
 
 def analyze_clock_skew(ntp_server="pool.ntp.org"):
@@ -26,8 +45,113 @@ def analyze_clock_skew(ntp_server="pool.ntp.org"):
         ntp_time = datetime.utcfromtimestamp(response.tx_time)
         local_time = datetime.utcnow()
         skew = (ntp_time - local_time).total_seconds()
-        print(f"[SKEW] Local: {local_time}, NTP: {ntp_time}, Skew: {skew:.6f} sec")
+        logger.info("clock skew server=%s local=%s ntp=%s skew=%.6f", ntp_server, local_time, ntp_time, skew)
         return skew
     except Exception as e:
-        print(f"[SKEW] Failed to analyze skew: {e}")
+        logger.warning("clock skew analysis failed server=%s error=%s", ntp_server, e)
         return None
+
+
+class ClockService:
+    """
+    NTP corrected clock that refreshes its offset in the background.
+
+    `now()` never touches the network: it adds the monotonic time elapsed
+    since the last anchor to the NTP corrected wall time of that anchor.
+    """
+
+    def __init__(self, servers=None, interval=NTP_SYNC_INTERVAL,
+                 timeout=NTP_TIMEOUT, smoothing=NTP_SMOOTHING):
+        self.servers = list(servers or NTP_SERVERS)
+        self.interval = interval
+        self.timeout = timeout
+        self.smoothing = smoothing
+        self.offset = 0.0  # smoothed NTP - local offset in seconds
+        self.last_sync = None  # UTC datetime of the last successful refresh
+        self._anchor = (time.monotonic(), time.time())
+        self._task = None
+
+    def now(self) -> datetime:
+        """
+        Return the current NTP corrected UTC time.
+        """
+        mono, wall = self._anchor
+        return datetime.utcfromtimestamp(wall + (time.monotonic() - mono))
+
+    def skew(self):
+        """
+        Return the smoothed clock skew in seconds, or None before the first sync.
+        """
+        return self.offset if self.last_sync is not None else None
+
+    def _query(self, server):
+        client = ntplib.NTPClient()
+        started = time.perf_counter()
+        response = client.request(server, version=3, timeout=self.timeout)
+        NTP_QUERY_SECONDS.labels(server).observe(time.perf_counter() - started)
+        return response.offset, response.delay
+
+    def _sample(self):
+        """
+        Query every server and keep the offset of the lowest-delay answer.
+        """
+        best = None
+        for server in self.servers:
+            try:
+                offset, delay = self._query(server)
+            except Exception as e:
+                logger.warning("ntp query failed server=%s error=%s", server, e)
+                continue
+            if best is None or delay < best[1]:
+                best = (offset, delay)
+        return best
+
+    def _apply(self, offset: float):
+        CLOCK_SKEW_SECONDS.observe(abs(offset))
+        if self.last_sync is None:
+            self.offset = offset
+        else:
+            self.offset += self.smoothing * (offset - self.offset)
+        # Publish the new anchor as a single tuple so readers never see a torn update
+        self._anchor = (time.monotonic(), time.time() + self.offset)
+        self.last_sync = self.now()
+        CLOCK_OFFSET_SECONDS.set(self.offset)
+
+    async def refresh(self):
+        """
+        Take one NTP sample off the event loop and fold it into the offset.
+        """
+        loop = asyncio.get_running_loop()
+        sample = await loop.run_in_executor(None, self._sample)
+        if sample is None:
+            return False
+        self._apply(sample[0])
+        logger.debug("clock offset=%.6f sample=%.6f delay=%.6f", self.offset, sample[0], sample[1])
+        return True
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.exception("clock refresh failed error=%s", e)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """
+        Start the background refresh loop on the running event loop.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+clock = ClockService()